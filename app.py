@@ -5,26 +5,36 @@ multiple data source modules.
 """
 
 from flask import Flask, render_template, redirect, url_for
-import logging
-import os
-from config import Config
+from config import get_config
+import instrumentation
+import logging_config
+import metrics
 
 # Import module registrations
 from modules import register_modules
 
-def create_app(config_class=Config):
-    """Create and configure the Flask app."""
-    # Configure logging
-    os.makedirs(os.path.join(config_class.BASEDIR, 'logs', 'app'), exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        filename=os.path.join(config_class.BASEDIR, 'logs', 'app', 'app.log')
-    )
+def create_app(config_class=None):
+    """
+    Create and configure the Flask app.
+
+    Uses the configuration named by APP_CONFIG unless a class is given. Servers
+    load the app through this factory (see wsgi.py and asgi.py), and
+    `flask --app app run` finds it too.
+    """
+    config_class = config_class or get_config()
+
+    # Configure logging: records are written to the app log off the request threads
+    logging_config.configure_logging(config_class)
 
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # Per-request stage timing and profiling hooks
+    instrumentation.init_app(app)
+
+    # Request metrics and the /metrics endpoint
+    metrics.init_app(app)
+
     # Register all modules
     register_modules(app)
 
@@ -36,7 +46,7 @@ def create_app(config_class=Config):
 
     return app
 
-app = create_app()
-
 if __name__ == '__main__':
-    app.run(debug=Config.DEBUG)
\ No newline at end of file
+    # Development server only; use gunicorn.conf.py or asgi.py in production
+    app = create_app()
+    app.run(debug=app.config['DEBUG'])
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""
+ASGI Entry Point for the Market Research Platform
+
+Wraps the Flask app in a2wsgi's WSGI adapter so it can be served by an
+ASGI server, for example:
+
+    uvicorn asgi:application --workers 4
+
+The adapter runs requests on a pool of SERVER_THREADS threads per worker.
+ASGI servers start their workers fresh rather than forking a preloaded app,
+so every worker imports pandas and plotly itself; gunicorn.conf.py preloads
+them once.
+"""
+
+import os
+
+# Serve with the production configuration and build plots in a process pool
+os.environ.setdefault('APP_CONFIG', 'production')
+os.environ.setdefault('PLOT_EXECUTOR', 'process')
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError as e:
+    raise ImportError("Serving over ASGI requires a2wsgi. Install it with 'pip install a2wsgi'") from e
+
+from app import create_app
+from config import Config
+
+application = WSGIMiddleware(create_app(), workers=Config.SERVER_THREADS)
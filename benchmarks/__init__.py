@@ -0,0 +1,8 @@
+"""
+Benchmarks for the Market Research Platform.
+Contains a synthetic USDA ESR dataset generator, a local stand-in for the ESR
+API and an end-to-end benchmark suite with JSON output for comparing runs.
+
+Example:
+    python -m benchmarks.run --commodities 5 --countries 60 --years 10 --output results.json
+"""
@@ -0,0 +1,253 @@
+"""
+Synthetic USDA Export Sales (ESR) dataset generator.
+Produces API-shaped payloads for every ESR endpoint the collector uses and can
+build a complete weekly_export_sales database from them at a configurable
+scale (commodities x countries x marketing years x weeks).
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Add project root to path when run as a script
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Real ESR commodities used as templates: (code, name, unitId, MY start month)
+COMMODITY_TEMPLATES = [
+    (107, 'All Wheat', 1, 6),
+    (401, 'Corn', 1, 9),
+    (701, 'Sorghum', 1, 9),
+    (801, 'Soybeans', 1, 9),
+    (901, 'Soybean cake & meal', 1, 10),
+    (902, 'Soybean oil', 1, 10),
+    (1404, 'Upland Cotton', 2, 8),
+    (1505, 'Pima Cotton', 2, 8),
+    (1701, 'Beef', 1, 1),
+    (1801, 'Pork', 1, 1),
+]
+
+UNITS = [(1, 'Metric Tons'), (2, 'Running Bales')]
+REGIONS = [(1, 'EUROPEAN UNION'), (2, 'OTHER EUROPE'), (3, 'ASIA'), (4, 'AFRICA'),
+           (5, 'NORTH AMERICA'), (6, 'SOUTH AMERICA'), (7, 'OCEANIA')]
+
+WEEK_COLUMNS = ['weeklyExports', 'accumulatedExports', 'outstandingSales', 'grossNewSales',
+                'currentMYNetSales', 'currentMYTotalCommitment', 'nextMYOutstandingSales',
+                'nextMYNetSales']
+
+
+@dataclass
+class DatasetScale:
+    """Size of a synthetic dataset."""
+    commodities: int = 5
+    countries: int = 60
+    years: int = 10
+    weeks: int = 52
+    last_year: int = 2025
+    # Share of commodity/country pairs that trade at all
+    trade_density: float = 0.8
+    seed: int = 42
+
+    @property
+    def market_years(self) -> List[int]:
+        return list(range(self.last_year - self.years + 1, self.last_year + 1))
+
+    @property
+    def expected_rows(self) -> int:
+        return int(self.commodities * self.countries * self.trade_density) * self.years * self.weeks
+
+
+class SyntheticESR:
+    """Deterministic synthetic ESR dataset returning API-shaped payloads."""
+
+    def __init__(self, scale: DatasetScale = None):
+        self.scale = scale or DatasetScale()
+        rng = np.random.default_rng(self.scale.seed)
+
+        templates = COMMODITY_TEMPLATES
+        commodities = []
+        for i in range(self.scale.commodities):
+            code, name, unit_id, start_month = templates[i % len(templates)]
+            if i >= len(templates):
+                code, name = code + 10000 * (i // len(templates)), f"{name} {i // len(templates) + 1}"
+            commodities.append((code, name, unit_id, start_month))
+        self._commodities = commodities
+
+        self._countries = [(1000 + i, f"COUNTRY {i:03d}", int(rng.integers(1, len(REGIONS) + 1)))
+                           for i in range(self.scale.countries)]
+
+        # Which countries trade each commodity, and how much
+        self._buyers = {}
+        for code, *_ in commodities:
+            count = max(1, int(round(self.scale.countries * self.scale.trade_density)))
+            chosen = rng.choice(len(self._countries), size=count, replace=False)
+            size = rng.lognormal(mean=8, sigma=1.2, size=count)
+            self._buyers[code] = (np.sort(chosen), size)
+
+    # ===== Metadata endpoints =====
+
+    def regions(self) -> List[Dict]:
+        return [{'regionId': rid, 'regionName': name} for rid, name in REGIONS]
+
+    def units(self) -> List[Dict]:
+        return [{'unitId': uid, 'unitNames': name} for uid, name in UNITS]
+
+    def commodities(self) -> List[Dict]:
+        return [{'commodityCode': code, 'commodityName': name, 'unitId': unit_id}
+                for code, name, unit_id, _ in self._commodities]
+
+    def countries(self) -> List[Dict]:
+        return [{'countryCode': code, 'countryName': name, 'countryDescription': name.title(),
+                 'regionId': region, 'gencCode': f"X{code % 100:02d}"}
+                for code, name, region in self._countries]
+
+    def market_year_start(self, commodity_code: int, market_year: int) -> pd.Timestamp:
+        start_month = next(c[3] for c in self._commodities if c[0] == commodity_code)
+        # The marketing year is named after the calendar year it ends in
+        year = market_year - 1 if start_month > 1 else market_year
+        return pd.Timestamp(year=year, month=start_month, day=1)
+
+    def release_dates(self) -> List[Dict]:
+        releases = []
+        for code, *_ in self._commodities:
+            for my in self.scale.market_years:
+                start = self.market_year_start(code, my)
+                end = start + pd.DateOffset(years=1) - pd.Timedelta(days=1)
+                last_week = self._week_dates(code, my)[-1]
+                releases.append({
+                    'commodityCode': code,
+                    'marketYear': my,
+                    'marketYearStart': start.strftime('%Y-%m-%dT00:00:00'),
+                    'marketYearEnd': end.strftime('%Y-%m-%dT00:00:00'),
+                    'releaseTimeStamp': (last_week + pd.Timedelta(days=7, hours=8, minutes=30)).strftime('%Y-%m-%dT%H:%M:%S')
+                })
+        return releases
+
+    # ===== Export data =====
+
+    def _week_dates(self, commodity_code: int, market_year: int) -> pd.DatetimeIndex:
+        start = self.market_year_start(commodity_code, market_year)
+        first_thursday = start + pd.Timedelta(days=(3 - start.weekday()) % 7)
+        return pd.date_range(first_thursday, periods=self.scale.weeks, freq='7D')
+
+    def exports(self, commodity_code: int, market_year: int) -> pd.DataFrame:
+        """Weekly export rows for one commodity and marketing year, shaped like /exports."""
+        buyers, size = self._buyers[commodity_code]
+        weeks = self._week_dates(commodity_code, market_year)
+        n_countries, n_weeks = len(buyers), len(weeks)
+        rng = np.random.default_rng([self.scale.seed, commodity_code, market_year])
+
+        season = 1 + 0.5 * np.sin(np.linspace(0, 2 * np.pi, n_weeks))
+        weekly = np.rint(size[:, None] * season[None, :] * rng.gamma(2.0, 0.5, (n_countries, n_weeks)))
+        gross_new = np.rint(weekly * rng.uniform(0.8, 1.4, weekly.shape))
+        net_sales = np.rint(gross_new - weekly * rng.uniform(0, 0.3, weekly.shape))
+        accumulated = np.cumsum(weekly, axis=1)
+        outstanding = np.maximum(np.cumsum(net_sales - weekly, axis=1) + size[:, None] * 4, 0)
+        # Next MY sales start to appear in the last quarter of the marketing year
+        late = (np.arange(n_weeks) >= n_weeks * 3 // 4)[None, :]
+        next_net = np.where(late, np.rint(weekly * rng.uniform(0, 0.4, weekly.shape)), 0)
+        next_outstanding = np.cumsum(next_net, axis=1)
+
+        unit_id = next(c[2] for c in self._commodities if c[0] == commodity_code)
+        country_codes = np.array([self._countries[i][0] for i in buyers])
+        data = {
+            'commodityCode': commodity_code,
+            'countryCode': np.repeat(country_codes, n_weeks),
+            'weeklyExports': weekly.ravel(),
+            'accumulatedExports': accumulated.ravel(),
+            'outstandingSales': outstanding.ravel(),
+            'grossNewSales': gross_new.ravel(),
+            'currentMYNetSales': net_sales.ravel(),
+            'currentMYTotalCommitment': (accumulated + outstanding).ravel(),
+            'nextMYOutstandingSales': next_outstanding.ravel(),
+            'nextMYNetSales': next_net.ravel(),
+            'unitId': unit_id,
+            'weekEndingDate': np.tile(weeks.strftime('%Y-%m-%dT00:00:00'), n_countries)
+        }
+        df = pd.DataFrame(data)
+        df[WEEK_COLUMNS] = df[WEEK_COLUMNS].astype('int64')
+        return df
+
+    def export_pairs(self) -> List[tuple]:
+        return [(code, my) for code, *_ in self._commodities for my in self.scale.market_years]
+
+
+def build_database(path: str, scale: DatasetScale = None, dataset: SyntheticESR = None) -> SyntheticESR:
+    """
+    Build a complete weekly_export_sales database from a synthetic dataset.
+
+    Tables are written through the collector's own process_table_data and
+    write_export_facts so the schema matches what a real collection run produces.
+    """
+    from data_collectors.weekly_export_sales.collector import DATA_RELEASES_DDL, process_table_data
+    from data_collectors.weekly_export_sales.export_facts import update_week_columns, write_export_facts
+    from data_collectors.weekly_export_sales.migrations import migrate
+    from modules.weekly_export_sales.periods import update_period_exports
+
+    dataset = dataset or SyntheticESR(scale)
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    conn = sqlite3.connect(path)
+    try:
+        process_table_data(pd.DataFrame(dataset.regions()), 'metadata_regions', conn)
+        process_table_data(pd.DataFrame(dataset.units()), 'metadata_units', conn)
+        process_table_data(pd.DataFrame(dataset.commodities()), 'metadata_commodities', conn)
+        process_table_data(pd.DataFrame(dataset.countries()), 'metadata_countries', conn)
+
+        conn.execute(DATA_RELEASES_DDL)
+        conn.executemany("""
+            INSERT OR REPLACE INTO data_releases
+            (commodityCode, marketYear, releaseTimeStamp, recorded_at, marketYearStart, marketYearEnd)
+            VALUES (?, ?, ?, datetime('now'), ?, ?)
+        """, [(r['commodityCode'], r['marketYear'], r['releaseTimeStamp'], r['marketYearStart'], r['marketYearEnd'])
+              for r in dataset.release_dates()])
+
+        migrate(conn)
+        for commodity_code, market_year in dataset.export_pairs():
+            write_export_facts(conn, dataset.exports(commodity_code, market_year), commodity_code, market_year)
+        update_week_columns(conn)
+        update_period_exports(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return dataset
+
+
+def add_scale_arguments(parser: argparse.ArgumentParser):
+    """Add dataset scale options to a command line parser."""
+    defaults = DatasetScale()
+    parser.add_argument('--commodities', type=int, default=defaults.commodities)
+    parser.add_argument('--countries', type=int, default=defaults.countries)
+    parser.add_argument('--years', type=int, default=defaults.years)
+    parser.add_argument('--weeks', type=int, default=defaults.weeks)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def scale_from_args(args) -> DatasetScale:
+    return DatasetScale(commodities=args.commodities, countries=args.countries,
+                        years=args.years, weeks=args.weeks, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a synthetic weekly_export_sales database')
+    parser.add_argument('path', help='Database file to create')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    scale = scale_from_args(args)
+    build_database(args.path, scale)
+    print(f"Built {args.path} with about {scale.expected_rows:,} export rows "
+          f"({os.path.getsize(args.path) / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Load test for concurrent identical plot requests.
+
+Serves the app from a threaded WSGI server over a synthetic database and
+fires bursts of identical get_plot requests, released together, at
+increasing concurrency. For each level it reports wall time, the CPU time
+the process used and how many times the plot was actually built, with
+request coalescing on and (with --compare-off) off. The plot cache is
+disabled so every burst reaches the plot builder.
+
+Example:
+    python -m benchmarks.load_test --concurrency 1 2 4 8 16 32 --compare-off
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+# Add project root to path when run as a script
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.generate import SyntheticESR, add_scale_arguments, build_database, scale_from_args
+from benchmarks.run import patched
+
+
+def fire_burst(url: str, form: Dict, concurrency: int) -> List[int]:
+    """Send `concurrency` identical requests at once and return their status codes."""
+    barrier = threading.Barrier(concurrency)
+    statuses = [None] * concurrency
+
+    def client(i):
+        with requests.Session() as session:
+            barrier.wait()
+            response = session.post(url, data=form, timeout=300)
+            statuses[i] = response.status_code if response.json().get('success') else -1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def run_level(url: str, form: Dict, concurrency: int, rounds: int, builds: List[int]) -> Dict:
+    """Run several bursts at one concurrency level and report the median round."""
+    results = []
+    for _ in range(rounds):
+        builds_before = builds[0]
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        statuses = fire_burst(url, form, concurrency)
+        results.append({
+            'wall_ms': (time.perf_counter() - wall_start) * 1000,
+            'cpu_ms': (time.process_time() - cpu_start) * 1000,
+            'builds': builds[0] - builds_before,
+            'failed': sum(status != 200 for status in statuses),
+        })
+    results.sort(key=lambda result: result['cpu_ms'])
+    result = dict(results[len(results) // 2])
+    result['concurrency'] = concurrency
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test concurrent identical plot requests')
+    add_scale_arguments(parser)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--rounds', type=int, default=3, help='Bursts per concurrency level')
+    parser.add_argument('--plot-type', default='weekly',
+                        choices=['weekly', 'country', 'my_comparison', 'commodity_comparison'])
+    parser.add_argument('--compare-off', action='store_true', help='Also run with request coalescing disabled')
+    parser.add_argument('--output', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    os.environ.setdefault('PLOT_WARMUP_ON_STARTUP', 'False')
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    from modules.weekly_export_sales import routes
+    from modules.weekly_export_sales.manager import ExportDataManager
+    from modules.weekly_export_sales.plot_cache import UsageLog
+    from modules.weekly_export_sales.single_flight import SingleFlight
+
+    workdir = tempfile.mkdtemp(prefix='esr_load_')
+    db_path = os.path.join(workdir, 'weekly_export_sales.db')
+    dataset = SyntheticESR(scale_from_args(args))
+    build_database(db_path, dataset=dataset)
+
+    app = create_app()
+    blueprint = app.blueprints['weekly_export_sales']
+    blueprint.export_manager = ExportDataManager(db_path)
+    blueprint.usage_log = UsageLog(os.path.join(workdir, 'usage.db'))
+    blueprint.plot_cache = None
+
+    codes = [c['commodityCode'] for c in dataset.commodities()]
+    years = dataset.scale.market_years
+    form = {
+        'commodity_code': codes[0],
+        'start_year': years[0],
+        'end_year': years[-1],
+        'metric': 'weeklyExports',
+        'plot_type': args.plot_type,
+        'countries[]': ['All Countries'],
+        'compare_commodities[]': [str(code) for code in codes[1:3]],
+    }
+
+    # Count actual plot builds
+    builds = [0]
+    builds_lock = threading.Lock()
+    build_plot = routes.build_plot
+
+    def counting_build_plot(*build_args, **build_kwargs):
+        with builds_lock:
+            builds[0] += 1
+        return build_plot(*build_args, **build_kwargs)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/weekly_export_sales/get_plot"
+
+    modes = {'coalesced': SingleFlight('plot')}
+    if args.compare_off:
+        modes['independent'] = None
+
+    results = {}
+    try:
+        with patched(routes, build_plot=counting_build_plot):
+            fire_burst(url, form, 1)
+            for mode, plot_flights in modes.items():
+                blueprint.plot_flights = plot_flights
+                results[mode] = [run_level(url, form, concurrency, args.rounds, builds)
+                                 for concurrency in args.concurrency]
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.plot_type} plot, {len(dataset.export_pairs())} commodity/year pairs")
+    for mode, levels in results.items():
+        print(f"\n{mode}")
+        print(f"{'concurrency':>12} {'wall ms':>10} {'cpu ms':>10} {'builds':>8} {'failed':>8}")
+        for level in levels:
+            print(f"{level['concurrency']:>12} {level['wall_ms']:>10.1f} {level['cpu_ms']:>10.1f} "
+                  f"{level['builds']:>8} {level['failed']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'plot_type': args.plot_type, 'scale': vars(dataset.scale), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
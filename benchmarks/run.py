@@ -0,0 +1,410 @@
+"""
+End-to-end benchmark suite for the Weekly Export Sales module.
+
+Builds a synthetic database, then times:
+- collect_data against the local stub ESR API
+- every ExportDataManager method
+- every plot type (and the data export) through the Flask test client
+- the size and encode time of each plot payload encoding
+
+Each benchmark records wall-clock statistics over several repeats and the
+peak Python memory of one extra traced run. Results are written as JSON so
+runs can be compared over time with --compare.
+
+Example:
+    python -m benchmarks.run --countries 100 --years 15 --output before.json
+    python -m benchmarks.run --countries 100 --years 15 --compare before.json
+    python -m benchmarks.run --only collector --latency 0.05 --rate-limit-rate 0.05 --timeout-rate 0.02 --stall-seconds 2 --client-timeout 1
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+# Add project root to path when run as a script
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.generate import SyntheticESR, add_scale_arguments, build_database, scale_from_args
+from benchmarks.stub_api import StubBehavior, StubESRServer, add_behavior_arguments, behavior_from_args
+
+
+@contextmanager
+def patched(obj, **attrs):
+    """Temporarily override attributes (e.g. config class settings)."""
+    originals = {name: getattr(obj, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(obj, name, value)
+
+
+class BenchmarkSuite:
+    """Runs and records named benchmarks."""
+
+    def __init__(self, repeat: int = 5, trace_memory: bool = True):
+        self.repeat = repeat
+        self.trace_memory = trace_memory
+        self.results: List[Dict] = []
+
+    def bench(self, group: str, name: str, func: Callable, repeat: int = None, setup: Callable = None,
+              **extra) -> Dict:
+        """Time func over several repeats, then measure its peak memory once."""
+        repeat = repeat or self.repeat
+        times = []
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+        peak = None
+        if self.trace_memory:
+            if setup:
+                setup()
+            tracemalloc.start()
+            try:
+                func()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        result = {
+            'group': group,
+            'name': name,
+            'repeat': repeat,
+            'min_s': round(min(times), 6),
+            'median_s': round(statistics.median(times), 6),
+            'mean_s': round(statistics.mean(times), 6),
+            'max_s': round(max(times), 6),
+            'peak_memory_mb': round(peak / 1e6, 3) if peak is not None else None,
+        }
+        result.update(extra)
+        self.results.append(result)
+        print(f"{group:>10} {name:<40} median {result['median_s'] * 1000:10.1f} ms"
+              f"   peak {result['peak_memory_mb'] if peak is not None else '-':>8} MB")
+        return result
+
+
+def bench_collector(suite: BenchmarkSuite, dataset: SyntheticESR, workdir: str, behavior: StubBehavior = None,
+                    base_url: str = None, client_timeout: float = 5.0, retry_delay: float = 0.05,
+                    engine: str = 'sync', concurrency: int = None):
+    """
+    Time a full collection run into an empty database.
+
+    Runs against a local stub API with the given behavior, or against
+    base_url when one is given (e.g. a stub started separately).
+    """
+    from data_collectors.weekly_export_sales import collector
+    from data_collectors.weekly_export_sales.async_collector import collect_data_async
+    from data_collectors.weekly_export_sales.config import WeeklyExportCollectorConfig
+
+    if engine == 'async':
+        name, collect = 'collect_data[async]', lambda: collect_data_async(concurrency=concurrency)
+    else:
+        name, collect = 'collect_data', collector.collect_data
+
+    db_path = os.path.join(workdir, 'collect.db')
+    metrics_path = os.path.join(workdir, 'collector_metrics.json')
+
+    def reset():
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    def run(url, server=None):
+        with patched(WeeklyExportCollectorConfig,
+                     BASE_URL=url,
+                     DB_PATH=db_path,
+                     METRICS_PATH=metrics_path,
+                     API_KEYS=[f'benchmark-key-{i}' for i in range(3)],
+                     TIMEOUT=client_timeout,
+                     RETRY_DELAY=retry_delay,
+                     WARM_PLOT_CACHE=False):
+            result = suite.bench('collector', name, collect, repeat=1, setup=reset,
+                                 export_pairs=len(dataset.export_pairs()))
+        with open(metrics_path) as f:
+            run_metrics = json.load(f)
+        result['run_metrics'] = {key: run_metrics[key] for key in (
+            'requests', 'request_errors', 'rate_limited', 'retries', 'pairs_updated', 'pairs_failed',
+            'pairs_empty', 'requests_skipped_empty', 'metadata_updated', 'metadata_unchanged', 'rows_written', 'requests_per_second', 'rows_per_second')}
+        if server:
+            result['stub_stats'] = dict(server.stats)
+            result['stub_behavior'] = vars(server.behavior)
+
+    if base_url:
+        run(base_url)
+        return
+    with StubESRServer(dataset, behavior=behavior) as server:
+        run(server.base_url, server)
+
+
+def bench_manager(suite: BenchmarkSuite, db_path: str, dataset: SyntheticESR):
+    """Time every ExportDataManager method on the synthetic database."""
+    from modules.weekly_export_sales.frame_cache import FrameCache
+    from modules.weekly_export_sales.manager import ExportDataManager
+    from modules.weekly_export_sales.query_plan import LoadPlan
+
+    manager = ExportDataManager(db_path)
+    codes = [c['commodityCode'] for c in dataset.commodities()]
+    code = codes[0]
+    years = dataset.scale.market_years
+    start_my, end_my = years[0], years[-1]
+    metric = 'weeklyExports'
+    countries = ['All Countries']
+
+    suite.bench('manager', 'get_commodities', manager.get_commodities)
+    suite.bench('manager', 'get_countries', manager.get_countries)
+    suite.bench('manager', 'get_countries_with_data', lambda: manager.get_countries_with_data(code, start_my, end_my))
+    suite.bench('manager', 'get_marketing_year_info', lambda: manager.get_marketing_year_info(code))
+    suite.bench('manager', 'get_unit_info', lambda: manager.get_unit_info(code))
+    suite.bench('manager', 'get_weekly_report', lambda: manager.get_weekly_report(code))
+    suite.bench('manager', 'get_period_report[month]', lambda: manager.get_period_report(code, 'month'))
+    for period in ('month', 'quarter'):
+        suite.bench('manager', f'get_period_exports[{period}]', lambda: manager.get_period_exports(code, period),
+                    rows=len(manager.get_period_exports(code, period)))
+
+    data = manager.load_data(code, start_my, end_my)
+    suite.bench('manager', 'load_data', lambda: manager.load_data(code, start_my, end_my), rows=len(data))
+    plan = LoadPlan.create(manager.get_countries_with_data(code, start_my, end_my)[:2], [metric])
+    suite.bench('manager', 'load_data[2 countries, 1 metric]', lambda: manager.load_data(code, start_my, end_my, plan),
+                rows=len(manager.load_data(code, start_my, end_my, plan)))
+    suite.bench('manager', 'load_multiple', lambda: manager.load_multiple(codes[:3], start_my, end_my),
+                commodities=len(codes[:3]))
+    suite.bench('manager', 'iter_export_rows',
+                lambda: sum(len(rows) for _, rows in manager.iter_export_rows(code, start_my, end_my)))
+    bench_fact_reader(suite, manager, code, start_my, end_my)
+    with tempfile.TemporaryDirectory() as cache_root:
+        frame_cache = FrameCache(cache_root, 1024 * 1024 * 1024)
+        frame_cache.put(1, 'bench', data)
+        suite.bench('manager', 'frame_cache attach', lambda: frame_cache.get(1, 'bench'), rows=len(data))
+
+    suite.bench('manager', 'get_summary_data', lambda: manager.get_summary_data(data, metric, countries))
+    suite.bench('manager', 'get_weekly_data', lambda: manager.get_weekly_data(data, metric, countries))
+    suite.bench('manager', 'get_weekly_data_by_country',
+                lambda: manager.get_weekly_data_by_country(data, metric, countries))
+    suite.bench('manager', 'get_marketing_year_data',
+                lambda: manager.get_marketing_year_data(data, metric, countries, start_my, end_my))
+
+
+def bench_fact_reader(suite: BenchmarkSuite, manager, code: int, start_my: int, end_my: int):
+    """Compare load_data's NumPy fact reader with pd.read_sql on the same selection."""
+    with manager.get_connection() as conn:
+        unit_info = manager.get_unit_info(code)
+        rows = len(manager._read_facts(conn, code, start_my, end_my, unit_info))
+
+        def read_sql():
+            return pd.read_sql("""
+                SELECT
+                    e.*,
+                    c.commodityName,
+                    mc.countryName,
+                    mc.countryDescription,
+                    mc.regionId,
+                    u.unitNames as unit
+                FROM export_facts e
+                JOIN metadata_commodities c ON e.commodityCode = c.commodityCode
+                JOIN metadata_countries mc ON e.countryCode = mc.countryCode
+                JOIN metadata_units u ON e.unitId = u.unitId
+                WHERE e.commodityCode = ?
+                AND e.market_year BETWEEN ? AND ?
+                ORDER BY e.week_ending_day
+            """, conn, params=(code, start_my, end_my))
+
+        suite.bench('manager', 'read_facts[numpy]',
+                    lambda: manager._read_facts(conn, code, start_my, end_my, unit_info), rows=rows)
+        suite.bench('manager', 'read_facts[read_sql]', read_sql, rows=rows)
+
+
+def bench_routes(suite: BenchmarkSuite, db_path: str, dataset: SyntheticESR, workdir: str):
+    """Time each plot type (built and cached) and the data export through the Flask test client."""
+    from app import create_app
+    from modules.weekly_export_sales.manager import ExportDataManager
+    from modules.weekly_export_sales.plot_cache import PlotCache, UsageLog
+    from modules.weekly_export_sales.plots import PlotRequest
+
+    app = create_app()
+    blueprint = app.blueprints['weekly_export_sales']
+    blueprint.export_manager = ExportDataManager(db_path)
+    blueprint.usage_log = UsageLog(os.path.join(workdir, 'usage.db'))
+    plot_cache = PlotCache(os.path.join(workdir, 'plot_cache'))
+    client = app.test_client()
+
+    codes = [c['commodityCode'] for c in dataset.commodities()]
+    years = dataset.scale.market_years
+    form = {
+        'commodity_code': codes[0],
+        'start_year': years[0],
+        'end_year': years[-1],
+        'metric': 'weeklyExports',
+        'countries[]': ['All Countries'],
+        'compare_commodities[]': [str(code) for code in codes[1:3]],
+    }
+
+    def request_plot(plot_type):
+        response = client.post('/weekly_export_sales/get_plot', data=dict(form, plot_type=plot_type))
+        if not response.get_json().get('success'):
+            raise RuntimeError(f"{plot_type} plot failed: {response.get_json().get('error')}")
+        return response
+
+    plot_types = ('weekly', 'country', 'my_comparison', 'commodity_comparison')
+    blueprint.plot_cache = None
+    for plot_type in plot_types:
+        size = len(request_plot(plot_type).get_data())
+        suite.bench('routes', f'get_plot[{plot_type}]', lambda: request_plot(plot_type), response_bytes=size)
+
+    bench_plot_encoding(suite, blueprint.export_manager, {
+        plot_type: PlotRequest.create(form['commodity_code'], form['start_year'], form['end_year'], form['metric'],
+                                      plot_type, form['countries[]'], codes[1:3])
+        for plot_type in plot_types})
+
+    blueprint.plot_cache = plot_cache
+    for plot_type in plot_types:
+        request_plot(plot_type)
+        suite.bench('routes', f'get_plot[{plot_type},cached]', lambda: request_plot(plot_type))
+
+    def export_csv():
+        response = client.get('/weekly_export_sales/export_data',
+                              query_string={'commodity_code': codes[0], 'format': 'csv'})
+        return sum(len(chunk) for chunk in response.response)
+
+    suite.bench('routes', 'export_data[csv]', export_csv)
+    for report_type in ('weekly', 'monthly'):
+        suite.bench('routes', f'generate_report[{report_type}]', lambda: client.post(
+            '/weekly_export_sales/generate_report', data={'commodity_code': codes[0], 'report_type': report_type}))
+
+
+def bench_plot_encoding(suite: BenchmarkSuite, manager, plot_requests: Dict[str, 'PlotRequest']):
+    """Compare the payload size and encode time of each plot encoding on the figures of the plot types."""
+    from modules.weekly_export_sales import plots
+    from modules.weekly_export_sales.plot_encoding import PLOT_ENCODINGS, encode_figure
+
+    # Keep the figures build_plot hands to the encoder
+    figures = []
+    with patched(plots, encode_figure=lambda fig, encoding='json': figures.append(fig) or ''):
+        for plot_request in plot_requests.values():
+            plots.build_plot(manager, plot_request)
+
+    for plot_type, fig in zip(plot_requests, figures):
+        for encoding in PLOT_ENCODINGS:
+            size = len(encode_figure(fig, encoding))
+            suite.bench('routes', f'encode_plot[{plot_type},{encoding}]', lambda: encode_figure(fig, encoding),
+                        payload_bytes=size)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: List[Dict], baseline_path: str):
+    """Print median timings next to a previous results file."""
+    with open(baseline_path) as f:
+        baseline = {(r['group'], r['name']): r for r in json.load(f)['results']}
+
+    print(f"\nComparison with {baseline_path}")
+    print(f"{'benchmark':<52} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for result in results:
+        before = baseline.get((result['group'], result['name']))
+        if not before:
+            continue
+        ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('nan')
+        print(f"{result['group'] + ' ' + result['name']:<52} {before['median_s'] * 1000:10.1f} "
+              f"{result['median_s'] * 1000:10.1f} {ratio:7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Weekly Export Sales benchmark suite')
+    add_scale_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repeats per benchmark')
+    parser.add_argument('--only', choices=['collector', 'manager', 'routes'], action='append',
+                        help='Run only these benchmark groups (default: all)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced peak-memory run')
+    parser.add_argument('--output', help='Write results JSON to this file')
+    parser.add_argument('--compare', help='Compare against a previous results JSON file')
+    parser.add_argument('--keep-db', help='Copy the generated database to this path')
+    parser.add_argument('--base-url', help='Collect from this ESR API instead of starting a local stub')
+    parser.add_argument('--client-timeout', type=float, default=5.0, help='Collector request timeout (seconds)')
+    parser.add_argument('--retry-delay', type=float, default=0.05, help='Collector retry base delay (seconds)')
+    parser.add_argument('--engine', choices=['sync', 'async', 'both'], default='sync', help='Collector engine')
+    parser.add_argument('--concurrency', type=int, help='Maximum requests in flight for the async engine')
+    stub_options = parser.add_argument_group('stub API behavior')
+    add_behavior_arguments(stub_options)
+    args = parser.parse_args()
+
+    # Keep benchmark runs out of the application and collector logs, and
+    # don't warm the real plot cache when the app is created
+    logging.basicConfig(level=logging.ERROR)
+    os.environ.setdefault('PLOT_WARMUP_ON_STARTUP', 'False')
+
+    scale = scale_from_args(args)
+    groups = args.only or ['collector', 'manager', 'routes']
+    suite = BenchmarkSuite(repeat=args.repeat, trace_memory=not args.no_memory)
+
+    workdir = tempfile.mkdtemp(prefix='esr_bench_')
+    try:
+        db_path = os.path.join(workdir, 'weekly_export_sales.db')
+        start = time.perf_counter()
+        dataset = build_database(db_path, scale)
+        build_seconds = time.perf_counter() - start
+        print(f"Built synthetic database: ~{scale.expected_rows:,} rows, "
+              f"{os.path.getsize(db_path) / 1e6:.1f} MB in {build_seconds:.1f}s")
+
+        if args.keep_db:
+            shutil.copy(db_path, args.keep_db)
+
+        if 'collector' in groups:
+            engines = ['sync', 'async'] if args.engine == 'both' else [args.engine]
+            for engine in engines:
+                bench_collector(suite, dataset, workdir, behavior_from_args(args), args.base_url,
+                                args.client_timeout, args.retry_delay, engine, args.concurrency)
+        if 'manager' in groups:
+            bench_manager(suite, db_path, dataset)
+        if 'routes' in groups:
+            bench_routes(suite, db_path, dataset, workdir)
+
+        output = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'scale': vars(scale),
+            'database_mb': round(os.path.getsize(db_path) / 1e6, 3),
+            'build_seconds': round(build_seconds, 3),
+            'results': suite.results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"Wrote results to {args.output}")
+
+    if args.compare:
+        compare(suite.results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
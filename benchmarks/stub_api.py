@@ -0,0 +1,248 @@
+"""
+Local stand-in for the USDA ESR API.
+Serves a SyntheticESR dataset over HTTP on localhost so the collector can be
+run, load tested and timed without network access or API quota.
+
+Latency, per-key X-Ratelimit-Remaining quotas, injected 429s, server errors
+and stalled (timed out) responses are configurable through StubBehavior.
+Payload size follows the dataset scale: each /exports response carries
+countries x weeks records. Metadata endpoints send an ETag and answer
+If-None-Match with 304 Not Modified.
+
+Example:
+    python -m benchmarks.stub_api --port 8765 --latency 0.05 --rate-limit-rate 0.02
+    python data_collectors/weekly_export_sales/run.py --base-url http://127.0.0.1:8765
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from benchmarks.generate import SyntheticESR, add_scale_arguments, scale_from_args
+
+EXPORTS_PATH = re.compile(r'^/exports/commodityCode/(\d+)/allCountries/marketYear/(\d+)$')
+METADATA_PATHS = ('/regions', '/unitsOfMeasure', '/commodities', '/countries')
+
+
+@dataclass
+class StubBehavior:
+    """How the stub server responds, beyond serving the dataset."""
+    # Seconds added to every response, plus up to `jitter` seconds at random
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Requests each API key may make before it is rate limited
+    quota: int = 100000
+    # Seconds after which every key's quota is refilled (0 = never)
+    quota_reset: float = 0.0
+    # Probability of an injected 429, 500 or stalled response per request
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    # How long a stalled response hangs before it is sent
+    stall_seconds: float = 10.0
+    # Latest marketing years of each commodity that are released but have
+    # no export rows yet, as at the start of a season
+    empty_years: int = 0
+    seed: int = 0
+
+
+class StubESRServer:
+    """Threaded HTTP server serving ESR endpoints from a synthetic dataset."""
+
+    def __init__(self, dataset: SyntheticESR, host: str = '127.0.0.1', port: int = 0,
+                 behavior: StubBehavior = None):
+        self.dataset = dataset
+        self.behavior = behavior or StubBehavior()
+        self.stats = Counter()
+        self._quota: Dict[str, int] = {}
+        self._quota_window = time.monotonic()
+        self._random = random.Random(self.behavior.seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return self.stats['requests']
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-esr-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def payload(self, path: str):
+        """Return the JSON payload for an endpoint path, or None if unknown."""
+        static = {
+            '/regions': self.dataset.regions,
+            '/unitsOfMeasure': self.dataset.units,
+            '/commodities': self.dataset.commodities,
+            '/countries': self.dataset.countries,
+            '/datareleasedates': self.dataset.release_dates,
+        }
+        if path in static:
+            return static[path]()
+
+        match = EXPORTS_PATH.match(path)
+        if match:
+            commodity_code, market_year = int(match.group(1)), int(match.group(2))
+            if (commodity_code, market_year) not in self.dataset.export_pairs():
+                return []
+            if market_year > self.dataset.scale.market_years[-1] - self.behavior.empty_years:
+                return []
+            return self.dataset.exports(commodity_code, market_year).to_dict('records')
+        return None
+
+    def decide(self, api_key: str):
+        """
+        Consume one request of quota for an API key and pick the response.
+
+        Returns (outcome, remaining, delay) where outcome is one of 'ok',
+        'rate_limited', 'error' or 'stall'.
+        """
+        behavior = self.behavior
+        with self._lock:
+            self.stats['requests'] += 1
+
+            now = time.monotonic()
+            if behavior.quota_reset and now - self._quota_window >= behavior.quota_reset:
+                self._quota.clear()
+                self._quota_window = now
+
+            remaining = self._quota.get(api_key, behavior.quota)
+            if remaining <= 0:
+                outcome = 'rate_limited'
+            else:
+                remaining -= 1
+                self._quota[api_key] = remaining
+                roll = self._random.random()
+                if roll < behavior.rate_limit_rate:
+                    outcome = 'rate_limited'
+                elif roll < behavior.rate_limit_rate + behavior.error_rate:
+                    outcome = 'error'
+                elif roll < behavior.rate_limit_rate + behavior.error_rate + behavior.timeout_rate:
+                    outcome = 'stall'
+                else:
+                    outcome = 'ok'
+
+            delay = behavior.latency + (self._random.uniform(0, behavior.jitter) if behavior.jitter else 0)
+            if outcome == 'stall':
+                delay += behavior.stall_seconds
+            self.stats[outcome] += 1
+        return outcome, remaining, delay
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outcome, remaining, delay = server.decide(self.headers.get('X-Api-Key', ''))
+                if delay:
+                    time.sleep(delay)
+
+                if outcome == 'rate_limited':
+                    self._send_json(429, {'error': 'API rate limit exceeded'}, remaining)
+                    return
+                if outcome == 'error':
+                    self._send_json(500, {'error': 'Injected server error'}, remaining)
+                    return
+
+                path = self.path.split('?')[0].rstrip('/')
+                payload = server.payload(path)
+                if payload is None:
+                    self._send_json(404, {'error': 'Not found'}, remaining)
+                    return
+                if path in METADATA_PATHS:
+                    server.stats['metadata'] += 1
+                    etag = f'"{hashlib.sha1(json.dumps(payload).encode()).hexdigest()[:16]}"'
+                    if self.headers.get('If-None-Match') == etag:
+                        server.stats['not_modified'] += 1
+                        self._send_json(304, None, remaining, etag)
+                        return
+                    self._send_json(200, payload, remaining, etag)
+                    return
+                self._send_json(200, payload, remaining)
+
+            def _send_json(self, status, payload, remaining, etag=None):
+                body = json.dumps(payload).encode() if status != 304 else b''
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.send_header('X-Ratelimit-Remaining', str(remaining))
+                    if etag:
+                        self.send_header('ETag', etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on a stalled response
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def add_behavior_arguments(parser: argparse.ArgumentParser):
+    """Add stub behavior options to a command line parser."""
+    defaults = StubBehavior()
+    for item in fields(StubBehavior):
+        if item.name == 'seed':
+            # Shared with the dataset --seed option
+            continue
+        parser.add_argument(f"--{item.name.replace('_', '-')}", dest=f"stub_{item.name}",
+                            type=type(getattr(defaults, item.name)), default=getattr(defaults, item.name))
+
+
+def behavior_from_args(args) -> StubBehavior:
+    options = {item.name: getattr(args, f"stub_{item.name}") for item in fields(StubBehavior) if item.name != 'seed'}
+    return StubBehavior(seed=getattr(args, 'seed', 0), **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic dataset as a local ESR API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_scale_arguments(parser)
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubESRServer(SyntheticESR(scale_from_args(args)), args.host, args.port, behavior_from_args(args))
+    print(f"Stub ESR API listening on {server.base_url} (Ctrl+C to stop)")
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"Served: {dict(server.stats)}")
+
+
+if __name__ == '__main__':
+    main()
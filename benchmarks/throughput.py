@@ -0,0 +1,220 @@
+"""
+Throughput test for the app's serving modes.
+
+Starts the app in a server subprocess over a synthetic database and runs a
+mixed workload from concurrent clients for a fixed time: fast metadata
+requests (get_years, get_countries) and, with probability --plot-share,
+plot requests. Plot parameters cycle through every combination of
+commodity, year range, plot type and metric, so plots are built rather
+than served from the plot cache until the combinations run out. For each
+server it reports requests/sec and latency percentiles by request kind;
+the metadata latencies show how much slow plots hold up fast requests.
+
+Servers:
+    dev       the Flask development server (flask run, threaded)
+    gunicorn  gunicorn with gunicorn.conf.py
+    uvicorn   uvicorn with asgi.py
+
+Example:
+    python -m benchmarks.throughput --server dev gunicorn --clients 8 --duration 20
+    python -m benchmarks.throughput --server dev --env PLOT_EXECUTOR=process
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+# Add project root to path when run as a script
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.generate import SyntheticESR, add_scale_arguments, build_database, scale_from_args
+
+PLOT_TYPES = ['weekly', 'country', 'my_comparison']
+METRICS = ['weeklyExports', 'accumulatedExports', 'outstandingSales', 'grossNewSales', 'netSales',
+           'totalCommitment']
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server: str, port: int, workers: int) -> List[str]:
+    """Command line that serves the app on port."""
+    if server == 'dev':
+        return [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                '--host', '127.0.0.1', '--port', str(port), '--no-reload', '--no-debugger']
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+    if server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:application',
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+    raise ValueError(f"Unknown server '{server}'")
+
+
+def wait_until_ready(process: subprocess.Popen, base_url: str, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/metrics", timeout=2).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+
+
+def request_factory(dataset: SyntheticESR, plot_share: float, seed: int):
+    """Return a function that picks the next (kind, path, form) for a client."""
+    codes = [c['commodityCode'] for c in dataset.commodities()]
+    years = dataset.scale.market_years
+    year_ranges = [(start, end) for start in years for end in years if 0 <= end - start <= 3]
+    plot_forms = [
+        {'commodity_code': code, 'start_year': start, 'end_year': end, 'metric': metric,
+         'plot_type': plot_type, 'countries[]': ['All Countries']}
+        for code, (start, end), plot_type, metric in itertools.product(codes, year_ranges, PLOT_TYPES, METRICS)
+    ]
+    random.Random(seed).shuffle(plot_forms)
+    plots = itertools.cycle(plot_forms)
+    lock = threading.Lock()
+
+    def next_request(rng: random.Random):
+        if rng.random() < plot_share:
+            with lock:
+                return 'plot', '/weekly_export_sales/get_plot', next(plots)
+        code = rng.choice(codes)
+        if rng.random() < 0.5:
+            return 'metadata', '/weekly_export_sales/get_years', {'commodity_code': code}
+        start, end = rng.choice(year_ranges)
+        return 'metadata', '/weekly_export_sales/get_countries', {
+            'commodity_code': code, 'start_year': start, 'end_year': end}
+
+    return next_request, len(plot_forms)
+
+
+def run_clients(base_url: str, next_request, clients: int, duration: float, seed: int) -> Dict[str, List]:
+    """Send requests from concurrent clients for duration seconds; return (latency, ok) by kind."""
+    samples = {'metadata': [], 'plot': []}
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(i):
+        rng = random.Random(seed + i)
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                kind, path, form = next_request(rng)
+                start = time.perf_counter()
+                try:
+                    response = session.post(base_url + path, data=form, timeout=300)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                with samples_lock:
+                    samples[kind].append((time.perf_counter() - start, ok))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def summarize(samples: Dict[str, List], elapsed: float) -> Dict:
+    result = {'total_rps': sum(len(kind_samples) for kind_samples in samples.values()) / elapsed}
+    for kind, kind_samples in samples.items():
+        latencies = sorted(latency * 1000 for latency, _ in kind_samples)
+        if not latencies:
+            continue
+        cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        result[kind] = {
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'p50_ms': cuts[49],
+            'p95_ms': cuts[94],
+            'p99_ms': cuts[98],
+            'errors': sum(not ok for _, ok in kind_samples),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure requests/sec of the app under each serving mode')
+    add_scale_arguments(parser)
+    parser.add_argument('--server', nargs='+', default=['dev'], choices=['dev', 'gunicorn', 'uvicorn'])
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes for gunicorn and uvicorn')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds to run each server')
+    parser.add_argument('--plot-share', type=float, default=0.2, help='Fraction of requests that are plots')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='Environment variable for the server (repeatable)')
+    parser.add_argument('--output', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='esr_throughput_')
+    dataset = SyntheticESR(scale_from_args(args))
+    build_database(os.path.join(workdir, 'weekly_export_sales', 'weekly_export_sales.db'), dataset=dataset)
+    next_request, plot_combinations = request_factory(dataset, args.plot_share, args.seed)
+
+    env = dict(os.environ, DATA_DIR=workdir, PLOT_WARMUP_ON_STARTUP='False')
+    env.update(item.split('=', 1) for item in args.env)
+
+    results = {}
+    try:
+        for server in args.server:
+            # Each server starts with an empty plot cache
+            shutil.rmtree(os.path.join(workdir, 'weekly_export_sales', 'plot_cache'), ignore_errors=True)
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = subprocess.Popen(server_command(server, port, args.workers), cwd=project_root, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_ready(process, base_url)
+                start = time.perf_counter()
+                samples = run_clients(base_url, next_request, args.clients, args.duration, args.seed)
+                results[server] = summarize(samples, time.perf_counter() - start)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.clients} clients, {args.duration:.0f}s per server, {args.plot_share:.0%} plots "
+          f"({plot_combinations} distinct), env: {' '.join(args.env) or '-'}")
+    print(f"{'server':<10} {'kind':<10} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7}")
+    for server, result in results.items():
+        for kind in ('metadata', 'plot'):
+            if kind in result:
+                row = result[kind]
+                print(f"{server:<10} {kind:<10} {row['requests']:>9} {row['rps']:>8.1f} {row['p50_ms']:>9.1f} "
+                      f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['errors']:>7}")
+        print(f"{server:<10} {'total':<10} {'':>9} {result['total_rps']:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'scale': vars(dataset.scale), 'clients': args.clients, 'duration': args.duration,
+                       'plot_share': args.plot_share, 'env': args.env, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,5 +17,52 @@ class Config:
     DEBUG = os.environ.get('DEBUG', 'True') == 'True'
     
     # Path definitions
-    DATA_DIR = os.path.join(BASEDIR, 'data')
-    LOGS_DIR = os.path.join(BASEDIR, 'logs')
\ No newline at end of file
+    DATA_DIR = os.environ.get('DATA_DIR', os.path.join(BASEDIR, 'data'))
+    LOGS_DIR = os.path.join(BASEDIR, 'logs')
+
+    # Logging (see logging_config.py): the app log is written from a queue by a
+    # listener thread, as JSON lines or LOG_FORMAT=text, and rotated by size.
+    # LOG_LEVELS sets per-module levels, e.g. "werkzeug=WARNING,instrumentation=DEBUG"
+    LOG_PATH = os.path.join(LOGS_DIR, 'app', 'app.log')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+
+    # Instrumentation
+    SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'True') == 'True'
+    # Per-request profiling is triggered by an "X-Profile" header or "profile"
+    # query flag ("pstats" for cProfile, any other value for a sampled flamegraph)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+    PROFILE_DIR = os.path.join(LOGS_DIR, 'profiles')
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+
+    # Production server (gunicorn.conf.py, asgi.py): worker processes, request
+    # threads per worker and the seconds a worker may spend on one request.
+    # Plot builds run in each worker's plot pool, so request threads mostly
+    # wait and a generous count keeps metadata requests from queueing behind plots
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', str(min(4, os.cpu_count() or 1))))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '16'))
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', '120'))
+
+
+class ProductionConfig(Config):
+    """Configuration for serving from a WSGI or ASGI server."""
+
+    DEBUG = os.environ.get('DEBUG', 'False') == 'True'
+
+
+CONFIGS = {
+    'development': Config,
+    'production': ProductionConfig,
+}
+
+
+def get_config(name: str = None):
+    """Get the configuration class by name, or from the APP_CONFIG environment variable."""
+    name = name or os.environ.get('APP_CONFIG', 'development')
+    if name not in CONFIGS:
+        raise ValueError(f"Unknown APP_CONFIG '{name}', expected one of {', '.join(CONFIGS)}")
+    return CONFIGS[name]
\ No newline at end of file
@@ -17,5 +17,14 @@ class CollectorConfig:
     DEBUG = os.environ.get('DEBUG', 'True') == 'True'
 
     # Path definitions
-    DATA_DIR = os.path.join(os.path.abspath(os.path.join(BASEDIR, "..")), 'data')
-    LOGS_DIR = os.path.join(BASEDIR, 'logs')
\ No newline at end of file
+    # Read from the same DATA_DIR variable as the web app, so both use one database
+    DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.abspath(os.path.join(BASEDIR, "..")), 'data'))
+    LOGS_DIR = os.path.join(BASEDIR, 'logs')
+
+    # Logging (see logging_config.py): collector logs are written from a queue
+    # by a listener thread, as JSON lines or LOG_FORMAT=text, and rotated by size
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
\ No newline at end of file
@@ -0,0 +1,380 @@
+"""
+Asyncio engine for the Weekly Export Sales data collector.
+Fetches commodity / marketing year exports with many requests in flight,
+backs off and waits for quota without blocking the event loop, and hands
+JSON parsing and database writes to executors so downloads overlap with
+processing. Produces the same tables as the synchronous collector.
+
+Requires the optional aiohttp dependency.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import aiohttp
+except ImportError:  # The async engine is optional
+    aiohttp = None
+
+# Add project root to path for relative imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from data_collectors.weekly_export_sales.config import WeeklyExportCollectorConfig
+from data_collectors.weekly_export_sales.collector import (
+    APIKey, RunMetrics, EmptyResponseError, NOT_MODIFIED, DATA_RELEASES_DDL, METADATA_ENDPOINTS,
+    conditional_headers, exports_endpoint, plan_updates, record_release, refresh_metadata, request_log_fields,
+    update_validators, warm_plot_cache, write_run_metrics
+)
+from data_collectors.weekly_export_sales.export_facts import write_export_facts, update_week_columns
+from data_collectors.weekly_export_sales.empty_responses import record_empty_response, clear_empty_response
+from data_collectors.weekly_export_sales.metadata_refresh import load_metadata_state, validators_for
+from data_collectors.weekly_export_sales.migrations import migrate
+from data_collectors.weekly_export_sales.publish import prepare_staging, record_publish, publish_database, discard_staging
+from modules.weekly_export_sales.periods import update_period_exports
+from modules.weekly_export_sales.reports import build_weekly_reports
+
+
+def async_available() -> bool:
+    """Check whether the optional aiohttp dependency is installed."""
+    return aiohttp is not None
+
+
+class AsyncQuotaGate:
+    """
+    Hands out API keys to concurrent requests.
+
+    Each request reserves one call of a key's last reported quota, so many
+    in-flight requests can't all spend the same remaining calls. When every
+    key is below the threshold, one task waits for the quota refresh while the
+    others wait on it instead of each sleeping separately.
+    """
+
+    def __init__(self, api_keys: List[str], rate_limit_threshold: int, check_quota):
+        self.api_keys = deque([APIKey(key) for key in api_keys])
+        self.rate_limit_threshold = rate_limit_threshold
+        self._check_quota = check_quota
+        self._refresh_lock = asyncio.Lock()
+
+    def _has_quota(self, api_key: APIKey) -> bool:
+        return api_key.rate_limit_remaining is None or api_key.rate_limit_remaining >= self.rate_limit_threshold
+
+    async def acquire(self) -> APIKey:
+        while True:
+            for _ in range(len(self.api_keys)):
+                api_key = self.api_keys[0]
+                self.api_keys.rotate(-1)
+                if self._has_quota(api_key):
+                    if api_key.rate_limit_remaining is not None:
+                        api_key.rate_limit_remaining -= 1
+                    return api_key
+
+            async with self._refresh_lock:
+                # Another task may have refreshed the quotas while we waited
+                if any(self._has_quota(api_key) for api_key in self.api_keys):
+                    continue
+                logging.info("All API keys exhausted. Waiting for quota refresh...")
+                await asyncio.sleep(WeeklyExportCollectorConfig.QUOTA_REFRESH_WAIT)
+                await asyncio.gather(*(self._check_quota(api_key) for api_key in self.api_keys))
+
+
+class AsyncESRDataCollector:
+    def __init__(self, session, api_keys: List[str],
+                 rate_limit_threshold: int = WeeklyExportCollectorConfig.RATE_LIMIT_THRESHOLD,
+                 base_url: str = None, concurrency: int = WeeklyExportCollectorConfig.ASYNC_CONCURRENCY,
+                 parse_executor: ThreadPoolExecutor = None):
+        self.session = session
+        self.base_url = (base_url or WeeklyExportCollectorConfig.BASE_URL).rstrip('/')
+        self.retry_delay = WeeklyExportCollectorConfig.RETRY_DELAY
+        self.quota = AsyncQuotaGate(api_keys, rate_limit_threshold, self._check_quota)
+        self.in_flight = asyncio.Semaphore(concurrency)
+        self.parse_executor = parse_executor
+        self.run_metrics = RunMetrics()
+
+    @property
+    def api_keys(self):
+        return self.quota.api_keys
+
+    async def _check_quota(self, api_key: APIKey) -> int:
+        try:
+            headers = {'X-Api-Key': api_key.key, "accept": "application/json"}
+            async with self.session.get(f"{self.base_url}/regions", headers=headers,
+                                        timeout=aiohttp.ClientTimeout(total=30)) as response:
+                response.raise_for_status()
+                remaining = int(response.headers.get('X-Ratelimit-Remaining', 0))
+                api_key.update_quota(remaining)
+                return remaining
+        except Exception:
+            return 0
+
+    async def _backoff(self, retries: int, message: str):
+        wait_time = self.retry_delay * (1.5 ** retries)
+        logging.warning(f"{message}. Waiting {wait_time:.1f} seconds")
+        await asyncio.sleep(wait_time)
+
+    async def _make_request(self, endpoint: str, validators: Dict[str, str] = None) -> Optional[Dict]:
+        """GET an endpoint with retries, conditionally when validators are given (see ESRDataCollector)."""
+        url = f"{self.base_url}{endpoint}"
+        max_retries = WeeklyExportCollectorConfig.MAX_RETRIES
+        loop = asyncio.get_running_loop()
+        empty_responses = 0
+
+        for retries in range(max_retries):
+            if retries:
+                self.run_metrics.retries += 1
+            try:
+                async with self.in_flight:
+                    # Pick the key once a slot is free so queued requests don't reserve quota
+                    api_key = await self.quota.acquire()
+                    headers = {'X-Api-Key': api_key.key, "accept": "application/json"}
+                    headers.update(conditional_headers(validators))
+                    self.run_metrics.requests += 1
+                    request_start = time.perf_counter()
+                    try:
+                        async with self.session.get(url, headers=headers) as response:
+                            if response.status == 429:
+                                self.run_metrics.rate_limited += 1
+                                # Later attempts rotate to the next key with quota
+                                if 'X-Ratelimit-Remaining' in response.headers:
+                                    api_key.update_quota(int(response.headers['X-Ratelimit-Remaining']))
+                                status = 429
+                            else:
+                                response.raise_for_status()
+                                status = response.status
+                                remaining = int(response.headers.get('X-Ratelimit-Remaining', 0))
+                                api_key.update_quota(remaining)
+                                if status != 304 and validators is not None:
+                                    update_validators(validators, response.headers)
+                                body = await response.read()
+                    finally:
+                        duration = time.perf_counter() - request_start
+                        self.run_metrics.request_seconds += duration
+
+            except asyncio.TimeoutError:
+                self.run_metrics.request_errors += 1
+                await self._backoff(retries, f"Request timeout on attempt {retries + 1}")
+                continue
+            except aiohttp.ClientConnectionError:
+                self.run_metrics.request_errors += 1
+                await self._backoff(retries, f"Connection error on attempt {retries + 1}")
+                continue
+            except aiohttp.ClientError as e:
+                self.run_metrics.request_errors += 1
+                if retries < max_retries - 1:
+                    await self._backoff(retries, f"Request failed on attempt {retries + 1}: {str(e)}")
+                    continue
+                logging.error(f"Request failed after {max_retries} attempts: {str(e)}")
+                raise
+
+            logging.info(f"Request attempt {retries + 1}/{max_retries} to {url}: {status} in {duration * 1000:.0f} ms",
+                         extra=request_log_fields(endpoint, retries + 1, status, duration))
+
+            if status == 429:
+                await self._backoff(retries, "Rate limit hit. Rotating API key")
+                continue
+
+            if status == 304:
+                return NOT_MODIFIED
+
+            try:
+                data = await loop.run_in_executor(self.parse_executor, json.loads, body)
+            except ValueError:
+                await self._backoff(retries + 1, f"Invalid JSON response on attempt {retries + 1}")
+                continue
+
+            if data is None:
+                await self._backoff(retries + 1, f"Null response on attempt {retries + 1}")
+                continue
+
+            if (isinstance(data, (list, dict)) and not data and
+                not any(x in endpoint for x in ['/regions', '/countries', '/commodities'])):
+                empty_responses += 1
+                if '/exports/' in endpoint and empty_responses >= WeeklyExportCollectorConfig.EMPTY_CONFIRM_ATTEMPTS:
+                    raise EmptyResponseError(endpoint)
+                await self._backoff(retries + 1, f"Empty response on attempt {retries + 1}")
+                continue
+
+            return data
+
+        logging.error(f"Failed to get valid data from {url} after {max_retries} attempts")
+        raise Exception(f"Maximum retries ({max_retries}) exceeded for {url}")
+
+    async def get_data(self, endpoint: str) -> pd.DataFrame:
+        logging.info(f"Fetching data from {endpoint}...")
+        data = await self._make_request(endpoint)
+        return pd.DataFrame(data if data else [])
+
+    async def get_metadata(self, endpoint: str, validators: Dict[str, str]):
+        """Fetch a metadata payload, or NOT_MODIFIED if the stored copy is current."""
+        logging.info(f"Fetching metadata from {endpoint}...")
+        return await self._make_request(endpoint, validators)
+
+    async def get_commodity_data(self, commodity_code: int, market_year: int) -> pd.DataFrame:
+        df = await self.get_data(exports_endpoint(commodity_code, market_year))
+        if not df.empty:
+            df['commodity_code'] = commodity_code
+            df['market_year'] = market_year
+        return df
+
+
+class DatabaseWriter:
+    """Serializes all database work onto one thread with its own connection."""
+
+    def __init__(self, db_path: str):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='esr-db-writer')
+        self.conn = self.executor.submit(sqlite3.connect, db_path, check_same_thread=False).result()
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, self.conn, *args)
+
+    def close(self):
+        if self.conn is not None:
+            self.executor.submit(self.conn.close).result()
+            self.conn = None
+        self.executor.shutdown()
+
+
+def _prepare_database(conn: sqlite3.Connection) -> Dict[str, Dict]:
+    conn.execute(DATA_RELEASES_DDL)
+    migrate(conn)
+    return load_metadata_state(conn)
+
+
+def _write_exports(conn: sqlite3.Connection, export_data: pd.DataFrame, release_info: Dict,
+                   commodity_code: int, market_year: int) -> int:
+    rows_written = 0
+    if not export_data.empty:
+        rows_written = write_export_facts(conn, export_data, commodity_code, market_year)
+        record_release(conn.cursor(), release_info, commodity_code, market_year)
+        update_week_columns(conn, commodity_code, market_year)
+        update_period_exports(conn, commodity_code, market_year)
+        clear_empty_response(conn, exports_endpoint(commodity_code, market_year))
+    conn.commit()
+    return rows_written
+
+
+def _write_empty_response(conn: sqlite3.Connection, endpoint: str, release_timestamp: str):
+    record_empty_response(conn, endpoint, release_timestamp)
+    conn.commit()
+
+
+async def _collect(base_url: str = None, concurrency: int = None, staged: bool = None) -> AsyncESRDataCollector:
+    concurrency = concurrency or WeeklyExportCollectorConfig.ASYNC_CONCURRENCY
+    staged = WeeklyExportCollectorConfig.STAGED_PUBLISH if staged is None else staged
+    timeout = aiohttp.ClientTimeout(total=WeeklyExportCollectorConfig.TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    parse_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='esr-parse')
+    live_path = WeeklyExportCollectorConfig.DB_PATH
+    db_path = prepare_staging(live_path) if staged else live_path
+    writer = DatabaseWriter(db_path)
+    collector = None
+    success = False
+
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            collector = AsyncESRDataCollector(session, WeeklyExportCollectorConfig.API_KEYS, base_url=base_url,
+                                              concurrency=concurrency, parse_executor=parse_executor)
+
+            # Update metadata, rewriting only the tables whose content changed
+            logging.info("Updating metadata tables")
+            metadata_state = await writer.run(_prepare_database)
+            names = list(METADATA_ENDPOINTS)
+            validators = {name: validators_for(metadata_state.get(name)) for name in names}
+            payloads = await asyncio.gather(*(collector.get_metadata(METADATA_ENDPOINTS[name], validators[name])
+                                              for name in names))
+            for name, data in zip(names, payloads):
+                if not data:
+                    raise Exception(f"Failed to fetch {name} data")
+            await writer.run(refresh_metadata, dict(zip(names, payloads)), validators, metadata_state,
+                             collector.run_metrics)
+
+            # Get current releases
+            releases_df = await collector.get_data('/datareleasedates')
+            if releases_df.empty:
+                raise Exception("Failed to fetch release dates")
+
+            # Find records that need updating, current marketing years first
+            release_plan = await writer.run(plan_updates, releases_df)
+            collector.run_metrics.pairs_planned = len(release_plan.queue)
+            collector.run_metrics.requests_skipped_empty = release_plan.skipped_empty
+
+            async def update(commodity_code, market_year):
+                release_info = release_plan.release(commodity_code, market_year)
+                try:
+                    logging.info(f"Fetching data for commodity {commodity_code}, year {market_year}")
+                    export_data = await collector.get_commodity_data(commodity_code, market_year)
+                    rows_written = await writer.run(_write_exports, export_data, release_info,
+                                                    commodity_code, market_year)
+                    collector.run_metrics.rows_written += rows_written
+                    collector.run_metrics.pairs_updated += 1
+                except EmptyResponseError as e:
+                    logging.info(f"No export data for commodity {commodity_code}, year {market_year} "
+                                 f"at release {release_info['releaseTimeStamp']}, "
+                                 f"skipping until the next release")
+                    await writer.run(_write_empty_response, e.endpoint, release_info['releaseTimeStamp'])
+                    collector.run_metrics.pairs_empty += 1
+                except Exception as e:
+                    logging.error(f"Error processing commodity {commodity_code}, year {market_year}: {str(e)}")
+                    collector.run_metrics.pairs_failed += 1
+
+            # Requests are bounded by the collector's in-flight semaphore, which
+            # admits waiting tasks in the order they were started: queue order
+            await asyncio.gather(*(update(commodity_code, market_year)
+                                   for commodity_code, market_year in release_plan.pairs))
+
+        # Rebuild the materialized weekly reports for all commodities
+        try:
+            await writer.run(build_weekly_reports)
+        except Exception as e:
+            logging.error(f"Error building weekly reports: {str(e)}")
+
+        version = await writer.run(record_publish, collector.run_metrics, staged)
+        writer.close()
+        if staged:
+            publish_database(db_path, live_path)
+        logging.info(f"Published data version {version}")
+
+        success = True
+        await asyncio.get_running_loop().run_in_executor(None, warm_plot_cache)
+        return collector
+
+    except Exception as e:
+        logging.error(f"Error in main execution: {str(e)}")
+        raise
+    finally:
+        writer.close()
+        parse_executor.shutdown()
+        if staged and not success:
+            discard_staging(db_path)
+        if collector:
+            write_run_metrics(collector, success)
+
+
+def collect_data_async(base_url: str = None, concurrency: int = None, staged: bool = None):
+    """
+    Run the data collection process on the asyncio engine.
+
+    Args:
+        base_url: ESR API base URL, defaults to WeeklyExportCollectorConfig.BASE_URL
+        concurrency: Maximum requests in flight, defaults to ASYNC_CONCURRENCY
+        staged: Collect into a staging copy and swap it in when done,
+            defaults to WeeklyExportCollectorConfig.STAGED_PUBLISH
+    """
+    if not async_available():
+        raise RuntimeError("The async collector requires aiohttp (pip install aiohttp)")
+    asyncio.run(_collect(base_url, concurrency, staged))
+
+
+if __name__ == "__main__":
+    collect_data_async()
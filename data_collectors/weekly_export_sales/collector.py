@@ -6,8 +6,8 @@ Fetches data from the USDA API and stores it in the database.
 import requests
 import pandas as pd
 import time
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass, field, asdict
 from datetime import datetime
 from requests.exceptions import RequestException
 from collections import deque
@@ -24,16 +24,33 @@ if project_root not in sys.path:
 
 from data_collectors.weekly_export_sales.config import WeeklyExportCollectorConfig
 from modules.weekly_export_sales.utils import calculate_weeks_into_my, calculate_weeks_into_my_for_df
+from data_collectors.weekly_export_sales.export_facts import write_export_facts, update_week_columns
+from data_collectors.weekly_export_sales.empty_responses import (
+    load_empty_responses, record_empty_response, clear_empty_response)
+from data_collectors.weekly_export_sales.metadata_refresh import (
+    get_metadata_version, load_metadata_state, refresh_metadata_table, validators_for)
+from data_collectors.weekly_export_sales.migrations import migrate
+from data_collectors.weekly_export_sales.release_plan import ReleasePlan, estimate_budget, plan_releases
+from data_collectors.weekly_export_sales.publish import prepare_staging, record_publish, publish_database, discard_staging
+from modules.weekly_export_sales.periods import update_period_exports
+from modules.weekly_export_sales.reports import build_weekly_reports
+import logging_config
+import metrics
 
 from .config import WeeklyExportCollectorConfig
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename=WeeklyExportCollectorConfig.LOG_PATH,
-    filemode='a'
-)
+# Configure logging: records are written to the collector log off the fetch threads
+logging_config.configure_logging(WeeklyExportCollectorConfig)
+
+# Returned by _make_request when a conditional request finds the stored copy current
+NOT_MODIFIED = object()
+
+class EmptyResponseError(Exception):
+    """An exports endpoint confirmed to have no rows."""
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"No data at {endpoint}")
+        self.endpoint = endpoint
 
 @dataclass
 class APIKey:
@@ -45,19 +62,56 @@ class APIKey:
         self.rate_limit_remaining = remaining
         self.last_used = time.time()
 
+@dataclass
+class RunMetrics:
+    """Counters for a single collection run, written to the run metrics file."""
+    started_at: float = field(default_factory=time.time)
+    requests: int = 0
+    request_errors: int = 0
+    rate_limited: int = 0
+    retries: int = 0
+    request_seconds: float = 0.0
+    pairs_planned: int = 0
+    pairs_updated: int = 0
+    pairs_failed: int = 0
+    pairs_empty: int = 0
+    requests_skipped_empty: int = 0
+    metadata_updated: int = 0
+    metadata_unchanged: int = 0
+    rows_written: int = 0
+
+    def as_dict(self, success: bool, api_keys: List[APIKey]) -> Dict:
+        duration = time.time() - self.started_at
+        run_metrics = asdict(self)
+        run_metrics.update({
+            'finished_at': time.time(),
+            'duration_seconds': round(duration, 3),
+            'success': success,
+            'rows_per_second': round(self.rows_written / duration, 3) if duration > 0 else 0,
+            'requests_per_second': round(self.requests / duration, 3) if duration > 0 else 0,
+            # Only the key suffix is exposed, never the key itself
+            'api_keys': [{'key': f"...{api_key.key[-4:]}", 'rate_limit_remaining': api_key.rate_limit_remaining}
+                         for api_key in api_keys]
+        })
+        return run_metrics
+
 class ESRDataCollector:
-    def __init__(self, api_keys: List[str], rate_limit_threshold: int = WeeklyExportCollectorConfig.RATE_LIMIT_THRESHOLD):
+    def __init__(self, api_keys: List[str], rate_limit_threshold: int = WeeklyExportCollectorConfig.RATE_LIMIT_THRESHOLD,
+                 base_url: str = None):
         self.api_keys = deque([APIKey(key) for key in api_keys])
         self.current_key = self.api_keys[0]
-        self.base_url = WeeklyExportCollectorConfig.BASE_URL
+        self.base_url = (base_url or WeeklyExportCollectorConfig.BASE_URL).rstrip('/')
         self.rate_limit_threshold = rate_limit_threshold
         self.retry_delay = WeeklyExportCollectorConfig.RETRY_DELAY
+        self.run_metrics = RunMetrics()
 
-    def _get_headers(self) -> Dict[str, str]:
-        return {
+    def _get_headers(self, validators: Dict[str, str] = None) -> Dict[str, str]:
+        headers = {
             'X-Api-Key': self.current_key.key,
             "accept": "application/json"
         }
+        headers.update(conditional_headers(validators))
+        return headers
 
     def _rotate_api_key(self):
         initial_key = self.current_key
@@ -67,7 +121,7 @@ class ESRDataCollector:
 
             if self.current_key == initial_key:
                 logging.info("All API keys exhausted. Waiting for quota refresh...")
-                time.sleep(300)
+                time.sleep(WeeklyExportCollectorConfig.QUOTA_REFRESH_WAIT)
                 self._check_all_quotas()
                 continue
 
@@ -92,23 +146,42 @@ class ESRDataCollector:
         for api_key in self.api_keys:
             self._check_quota(api_key)
 
-    def _make_request(self, endpoint: str) -> Optional[Dict]:
+    def _make_request(self, endpoint: str, validators: Dict[str, str] = None) -> Optional[Dict]:
+        """
+        GET an endpoint with retries and return its parsed JSON.
+
+        With validators (the stored copy's etag and last_modified), the request
+        is conditional: NOT_MODIFIED is returned if the server reports the copy
+        current, and validators is updated from the response otherwise.
+        """
         url = f"{self.base_url}{endpoint}"
         retries = 0
         max_retries = WeeklyExportCollectorConfig.MAX_RETRIES
         backoff_factor = 1.5
+        empty_responses = 0
 
         while retries < max_retries:
             try:
-                logging.info(f"Request attempt {retries + 1}/{max_retries} to {url}")
+                if retries:
+                    self.run_metrics.retries += 1
 
-                response = requests.get(
-                    url,
-                    headers=self._get_headers(),
-                    timeout=WeeklyExportCollectorConfig.TIMEOUT
-                )
+                self.run_metrics.requests += 1
+                request_start = time.perf_counter()
+                try:
+                    response = requests.get(
+                        url,
+                        headers=self._get_headers(validators),
+                        timeout=WeeklyExportCollectorConfig.TIMEOUT
+                    )
+                finally:
+                    duration = time.perf_counter() - request_start
+                    self.run_metrics.request_seconds += duration
+                logging.info(f"Request attempt {retries + 1}/{max_retries} to {url}: {response.status_code} "
+                             f"in {duration * 1000:.0f} ms",
+                             extra=request_log_fields(endpoint, retries + 1, response.status_code, duration))
 
                 if response.status_code == 429:
+                    self.run_metrics.rate_limited += 1
                     self._rotate_api_key()
                     wait_time = self.retry_delay * (backoff_factor ** retries)
                     logging.info(f"Rate limit hit. Rotating API key and waiting {wait_time:.1f} seconds")
@@ -121,6 +194,11 @@ class ESRDataCollector:
                 remaining = int(response.headers.get('X-Ratelimit-Remaining', 0))
                 self.current_key.update_quota(remaining)
 
+                if response.status_code == 304:
+                    return NOT_MODIFIED
+                if validators is not None:
+                    update_validators(validators, response.headers)
+
                 try:
                     data = response.json()
                 except json.JSONDecodeError:
@@ -137,6 +215,9 @@ class ESRDataCollector:
 
                 if (isinstance(data, (list, dict)) and not data and
                     not any(x in endpoint for x in ['/regions', '/countries', '/commodities'])):
+                    empty_responses += 1
+                    if '/exports/' in endpoint and empty_responses >= WeeklyExportCollectorConfig.EMPTY_CONFIRM_ATTEMPTS:
+                        raise EmptyResponseError(endpoint)
                     logging.warning(f"Empty response on attempt {retries + 1}")
                     retries += 1
                     time.sleep(self.retry_delay * (backoff_factor ** retries))
@@ -148,18 +229,21 @@ class ESRDataCollector:
                 return data
 
             except requests.exceptions.Timeout:
+                self.run_metrics.request_errors += 1
                 wait_time = self.retry_delay * (backoff_factor ** retries)
                 logging.warning(f"Request timeout on attempt {retries + 1}. Waiting {wait_time:.1f} seconds")
                 time.sleep(wait_time)
                 retries += 1
 
             except requests.exceptions.ConnectionError:
+                self.run_metrics.request_errors += 1
                 wait_time = self.retry_delay * (backoff_factor ** retries)
                 logging.warning(f"Connection error on attempt {retries + 1}. Waiting {wait_time:.1f} seconds")
                 time.sleep(wait_time)
                 retries += 1
 
             except requests.exceptions.RequestException as e:
+                self.run_metrics.request_errors += 1
                 if retries < max_retries - 1:
                     wait_time = self.retry_delay * (backoff_factor ** retries)
                     logging.warning(f"Request failed on attempt {retries + 1}: {str(e)}. Waiting {wait_time:.1f} seconds")
@@ -180,19 +264,66 @@ class ESRDataCollector:
             logging.info(f"Retrieved {len(df)} records with columns: {df.columns.tolist()}")
         return df
 
+    def get_metadata(self, endpoint: str, validators: Dict[str, str]):
+        """Fetch a metadata payload, or NOT_MODIFIED if the stored copy is current."""
+        logging.info(f"Fetching metadata from {endpoint}...")
+        return self._make_request(endpoint, validators)
+
     def get_commodity_data(self, commodity_code: int, market_year: int) -> pd.DataFrame:
-        endpoint = f"/exports/commodityCode/{commodity_code}/allCountries/marketYear/{market_year}"
-        df = self.get_data(endpoint)
+        df = self.get_data(exports_endpoint(commodity_code, market_year))
         if not df.empty:
             df['commodity_code'] = commodity_code
             df['market_year'] = market_year
         return df
 
+def request_log_fields(endpoint: str, attempt: int, status: int, duration: float) -> Dict:
+    """Structured log fields of a request attempt."""
+    return {'endpoint': endpoint, 'attempt': attempt, 'status': status, 'duration_ms': round(duration * 1000, 1)}
+
+def conditional_headers(validators: Dict[str, str] = None) -> Dict[str, str]:
+    """Conditional request headers for a stored copy's validators."""
+    headers = {}
+    if validators and validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators and validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+def update_validators(validators: Dict[str, str], response_headers):
+    """Store the validators a response was sent with."""
+    validators['etag'] = response_headers.get('ETag')
+    validators['last_modified'] = response_headers.get('Last-Modified')
+
+def refresh_metadata(conn: sqlite3.Connection, payloads: Dict[str, object], validators: Dict[str, Dict],
+                     state: Dict[str, Dict], run_metrics: RunMetrics):
+    """
+    Rewrite the metadata tables whose payload changed and count updated and unchanged tables.
+
+    Tables rewritten in one run share a single new metadata version.
+    """
+    version = get_metadata_version(conn) + 1
+    for name, data in payloads.items():
+        if data is NOT_MODIFIED:
+            logging.info(f"Metadata table metadata_{name} not modified")
+            run_metrics.metadata_unchanged += 1
+        elif refresh_metadata_table(conn, name, data, validators[name], state.get(name), version):
+            run_metrics.metadata_updated += 1
+        else:
+            run_metrics.metadata_unchanged += 1
+
+def exports_endpoint(commodity_code: int, market_year: int) -> str:
+    """Endpoint of the export rows of a commodity and marketing year."""
+    return f"/exports/commodityCode/{commodity_code}/allCountries/marketYear/{market_year}"
+
 def process_table_data(df: pd.DataFrame, table_name: str, conn: sqlite3.Connection):
     if df.empty:
         logging.info(f"No data to process for table {table_name}")
         return
 
+    # Export rows have a fixed schema, see export_facts.write_export_facts
+    if table_name == 'commodity_exports':
+        raise ValueError("commodity_exports is a view, write export rows with write_export_facts")
+
     try:
         cursor = conn.cursor()
         current_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -232,42 +363,9 @@ def process_table_data(df: pd.DataFrame, table_name: str, conn: sqlite3.Connecti
                 logging.info(f"Adding new column: {alter_sql}")
                 cursor.execute(alter_sql)
 
-        # For commodity_exports: Handle duplicates and update data
-        if table_name == 'commodity_exports':
-            if 'commodity_code' in df.columns and 'market_year' in df.columns:
-                commodity_years = df[['commodity_code', 'market_year']].drop_duplicates().values
-                for commodity_code, market_year in commodity_years:
-                    # First, check for duplicates in the new data
-                    duplicate_check = df[(df['commodity_code'] == commodity_code) &
-                                        (df['market_year'] == market_year)]
-
-                    if duplicate_check.duplicated(['weekEndingDate', 'countryCode']).any():
-                        # Keep only the last (newest) occurrence of each duplicate
-                        logging.warning(f"Found duplicates in import data for commodity {commodity_code}, year {market_year}")
-                        # Sort by weekEndingDate to ensure we're keeping the newest
-                        sorted_df = df.sort_values('weekEndingDate', ascending=True)  # Sort so newest is last
-                        df = sorted_df.drop_duplicates(['commodity_code', 'market_year', 'weekEndingDate', 'countryCode'], keep='last')
-
-                    # Now delete existing records
-                    cursor.execute("""
-                        DELETE FROM commodity_exports
-                        WHERE commodity_code = ? AND market_year = ?
-                    """, (commodity_code, market_year))
-                    logging.info(f"Deleted existing records for commodity {commodity_code}, year {market_year}")
-
-        # For metadata tables: Drop and recreate
-        elif table_name.startswith('metadata_'):
-            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-            columns = [f"{col} {dtype_map.get(str(dtype), 'TEXT')}"
-                     for col, dtype in df.dtypes.items()]
-            columns.append("updated_at TIMESTAMP")
-
-            create_table_sql = f"""
-            CREATE TABLE {table_name} (
-                {', '.join(columns)}
-            )
-            """
-            cursor.execute(create_table_sql)
+        # For metadata tables: Replace the rows in place, keeping the table
+        if table_name.startswith('metadata_'):
+            cursor.execute(f"DELETE FROM {table_name}")
 
         # Insert new data
         insert_df = df.copy()
@@ -281,107 +379,235 @@ def process_table_data(df: pd.DataFrame, table_name: str, conn: sqlite3.Connecti
         logging.error(f"Error processing data for table {table_name}: {str(e)}")
         raise
 
-def collect_data():
-    """Run the data collection process."""
+# Metadata tables refreshed on every run: table suffix -> endpoint
+METADATA_ENDPOINTS = {
+    'regions': '/regions',
+    'units': '/unitsOfMeasure',
+    'commodities': '/commodities',
+    'countries': '/countries'
+}
+
+DATA_RELEASES_DDL = """
+CREATE TABLE IF NOT EXISTS data_releases (
+    commodityCode INTEGER,
+    marketYear INTEGER,
+    releaseTimeStamp TEXT,
+    recorded_at TIMESTAMP,
+    marketYearStart TEXT,
+    marketYearEnd TEXT,
+    PRIMARY KEY (commodityCode, marketYear)
+)
+"""
+
+def load_commodity_views() -> Dict[int, int]:
+    """Plot requests per commodity from the web app's usage log, for release planning."""
+    try:
+        from modules.weekly_export_sales.config import WeeklyExportConfig
+        from modules.weekly_export_sales.plot_cache import UsageLog
+
+        return UsageLog(WeeklyExportConfig.USAGE_DB_PATH).commodity_views()
+    except Exception as e:
+        logging.warning(f"Could not read plot usage, planning without it: {str(e)}")
+        return {}
+
+def plan_updates(conn: sqlite3.Connection, releases_df: pd.DataFrame) -> ReleasePlan:
+    """Plan the pairs to fetch, skipping those known to be empty at their current release."""
+    release_plan = plan_releases(conn, releases_df, load_empty_responses(conn), load_commodity_views())
+    logging.info(f"Found {len(release_plan.queue)} records requiring updates "
+                 f"({int(release_plan.queue['current'].sum())} current marketing years), "
+                 f"skipped {release_plan.skipped_empty} known to be empty")
+    return release_plan
+
+def record_release(cursor: sqlite3.Cursor, release_info: Dict, commodity_code: int, market_year: int):
+    """Store the release timestamp a commodity and market year was collected at."""
+    cursor.execute("""
+    INSERT OR REPLACE INTO data_releases
+    (commodityCode, marketYear, releaseTimeStamp, recorded_at, marketYearStart, marketYearEnd)
+    VALUES (?, ?, ?, datetime('now'), ?, ?)
+    """, (
+        commodity_code,
+        market_year,
+        release_info['releaseTimeStamp'],
+        release_info.get('marketYearStart'),
+        release_info.get('marketYearEnd')
+    ))
+
+def collect_data(base_url: str = None, staged: bool = None):
+    """Run the data collection process.
+
+    Args:
+        base_url: ESR API base URL, defaults to WeeklyExportCollectorConfig.BASE_URL
+        staged: Collect into a staging copy and swap it in when done,
+            defaults to WeeklyExportCollectorConfig.STAGED_PUBLISH
+    """
 
     # Initialize conn as None so it's always defined
     conn = None
+    db_path = None
+    success = False
+    staged = WeeklyExportCollectorConfig.STAGED_PUBLISH if staged is None else staged
 
-    collector = ESRDataCollector(WeeklyExportCollectorConfig.API_KEYS)
+    collector = ESRDataCollector(WeeklyExportCollectorConfig.API_KEYS, base_url=base_url)
 
     try:
-        conn = sqlite3.connect(WeeklyExportCollectorConfig.DB_PATH)
+        live_path = WeeklyExportCollectorConfig.DB_PATH
+        db_path = prepare_staging(live_path) if staged else live_path
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
 
-        # Create releases tracking table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS data_releases (
-            commodityCode INTEGER,
-            marketYear INTEGER,
-            releaseTimeStamp TEXT,
-            recorded_at TIMESTAMP,
-            marketYearStart TEXT,
-            marketYearEnd TEXT,
-            PRIMARY KEY (commodityCode, marketYear)
-        )
-        """)
-
-        # Update metadata
-        logging.info("Updating metadata tables")
-        metadata_endpoints = {
-            'regions': '/regions',
-            'units': '/unitsOfMeasure',
-            'commodities': '/commodities',
-            'countries': '/countries'
-        }
+        # Create releases tracking table and bring the schema up to date
+        cursor.execute(DATA_RELEASES_DDL)
+        migrate(conn)
 
-        for name, endpoint in metadata_endpoints.items():
-            df = collector.get_data(endpoint)
-            if df.empty:
+        # Update metadata, rewriting only the tables whose content changed
+        logging.info("Updating metadata tables")
+        metadata_state = load_metadata_state(conn)
+        validators = {name: validators_for(metadata_state.get(name)) for name in METADATA_ENDPOINTS}
+        payloads = {}
+        for name, endpoint in METADATA_ENDPOINTS.items():
+            payloads[name] = collector.get_metadata(endpoint, validators[name])
+            if not payloads[name]:
                 raise Exception(f"Failed to fetch {name} data")
-            process_table_data(df, f"metadata_{name}", conn)
+        refresh_metadata(conn, payloads, validators, metadata_state, collector.run_metrics)
 
         # Get current releases
         releases_df = collector.get_data('/datareleasedates')
         if releases_df.empty:
             raise Exception("Failed to fetch release dates")
 
-        # Get existing release records
-        cursor.execute("SELECT commodityCode, marketYear, releaseTimeStamp FROM data_releases")
-        existing_releases = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
-
-        # Find records that need updating
-        updates_needed = []
-        for _, row in releases_df.iterrows():
-            commodity_code = row['commodityCode']
-            market_year = row['marketYear']
-            release_timestamp = row['releaseTimeStamp']
-
-            last_release = existing_releases.get((commodity_code, market_year))
-            if not last_release or release_timestamp > last_release:
-                updates_needed.append((commodity_code, market_year))
-
-        logging.info(f"Found {len(updates_needed)} records requiring updates")
+        # Find records that need updating, current marketing years first
+        release_plan = plan_updates(conn, releases_df)
+        collector.run_metrics.pairs_planned = len(release_plan.queue)
+        collector.run_metrics.requests_skipped_empty = release_plan.skipped_empty
 
         # Process updates
-        for commodity_code, market_year in updates_needed:
+        for commodity_code, market_year in release_plan.pairs:
+            release_info = release_plan.release(commodity_code, market_year)
             try:
                 logging.info(f"Fetching data for commodity {commodity_code}, year {market_year}")
                 export_data = collector.get_commodity_data(commodity_code, market_year)
 
                 if not export_data.empty:
-                    process_table_data(export_data, 'commodity_exports', conn)
-
-                    # Update release timestamp
-                    release_info = releases_df[
-                        (releases_df['commodityCode'] == commodity_code) &
-                        (releases_df['marketYear'] == market_year)
-                    ].iloc[0]
-
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO data_releases
-                    (commodityCode, marketYear, releaseTimeStamp, recorded_at, marketYearStart, marketYearEnd)
-                    VALUES (?, ?, ?, datetime('now'), ?, ?)
-                    """, (
-                        commodity_code,
-                        market_year,
-                        release_info['releaseTimeStamp'],
-                        release_info.get('marketYearStart'),
-                        release_info.get('marketYearEnd')
-                    ))
+                    collector.run_metrics.rows_written += write_export_facts(conn, export_data, commodity_code,
+                                                                             market_year)
 
+                    # Update release timestamp and the derived week columns that depend on it
+                    record_release(cursor, release_info, commodity_code, market_year)
+                    update_week_columns(conn, commodity_code, market_year)
+                    update_period_exports(conn, commodity_code, market_year)
+                    clear_empty_response(conn, exports_endpoint(commodity_code, market_year))
+
+                conn.commit()
+                collector.run_metrics.pairs_updated += 1
+
+            except EmptyResponseError as e:
+                logging.info(f"No export data for commodity {commodity_code}, year {market_year} "
+                             f"at release {release_info['releaseTimeStamp']}, skipping until the next release")
+                record_empty_response(conn, e.endpoint, release_info['releaseTimeStamp'])
                 conn.commit()
+                collector.run_metrics.pairs_empty += 1
 
             except Exception as e:
                 logging.error(f"Error processing commodity {commodity_code}, year {market_year}: {str(e)}")
+                collector.run_metrics.pairs_failed += 1
                 continue
 
+        # Rebuild the materialized weekly reports for all commodities
+        try:
+            build_weekly_reports(conn)
+        except Exception as e:
+            logging.error(f"Error building weekly reports: {str(e)}")
+
+        version = record_publish(conn, collector.run_metrics, staged)
+        conn.close()
+        conn = None
+        if staged:
+            publish_database(db_path, live_path)
+        logging.info(f"Published data version {version}")
+
+        success = True
+        warm_plot_cache()
+
     except Exception as e:
         logging.error(f"Error in main execution: {str(e)}")
         raise
     finally:
         if conn:
             conn.close()
+        if staged and db_path and not success:
+            discard_staging(db_path)
+        write_run_metrics(collector, success)
+
+def average_request_seconds() -> float:
+    """Average request time of the last run, from its run metrics file."""
+    try:
+        with open(WeeklyExportCollectorConfig.METRICS_PATH) as f:
+            last_run = json.load(f)
+        if last_run.get('requests'):
+            return last_run['request_seconds'] / last_run['requests']
+    except (OSError, ValueError, KeyError):
+        pass
+    return WeeklyExportCollectorConfig.PLAN_REQUEST_SECONDS
+
+def plan_collection(base_url: str = None, concurrency: int = 1) -> Tuple[ReleasePlan, Dict]:
+    """
+    Plan a collection run without writing anything: the work queue and its budget.
+
+    Fetches /datareleasedates and diffs it against the live database.
+
+    Args:
+        base_url: ESR API base URL, defaults to WeeklyExportCollectorConfig.BASE_URL
+        concurrency: Requests in flight, for the time estimate
+    """
+    collector = ESRDataCollector(WeeklyExportCollectorConfig.API_KEYS, base_url=base_url)
+    releases_df = collector.get_data('/datareleasedates')
+    if releases_df.empty:
+        raise Exception("Failed to fetch release dates")
+
+    db_path = WeeklyExportCollectorConfig.DB_PATH
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(':memory:')
+    try:
+        try:
+            empty_responses = load_empty_responses(conn)
+        except sqlite3.OperationalError:
+            # Read-only database from before the empty_responses table
+            empty_responses = {}
+        release_plan = plan_releases(conn, releases_df, empty_responses, load_commodity_views())
+    finally:
+        conn.close()
+
+    api_keys = WeeklyExportCollectorConfig.API_KEYS
+    budget = estimate_budget(release_plan, len(METADATA_ENDPOINTS) + 1, average_request_seconds(), concurrency,
+                             WeeklyExportCollectorConfig.API_HOURLY_LIMIT * len(api_keys))
+    return release_plan, budget
+
+def warm_plot_cache():
+    """Precompute the web app's most requested plots for the newly published data."""
+    if not WeeklyExportCollectorConfig.WARM_PLOT_CACHE:
+        return
+    try:
+        from modules.weekly_export_sales.admission import AdmissionController
+        from modules.weekly_export_sales.config import WeeklyExportConfig
+        from modules.weekly_export_sales.manager import ExportDataManager
+        from modules.weekly_export_sales.plot_cache import PlotCache, UsageLog, warm_up
+
+        warm_up(ExportDataManager(WeeklyExportCollectorConfig.DB_PATH),
+                PlotCache(WeeklyExportConfig.PLOT_CACHE_DIR),
+                UsageLog(WeeklyExportConfig.USAGE_DB_PATH),
+                admission=AdmissionController.from_config('warm_up'))
+    except Exception as e:
+        logging.error(f"Error warming plot cache: {str(e)}")
+
+def write_run_metrics(collector: ESRDataCollector, success: bool):
+    """Write the run metrics file exposed by the web app's /metrics endpoint."""
+    try:
+        metrics.write_run_metrics(WeeklyExportCollectorConfig.METRICS_PATH,
+                                  collector.run_metrics.as_dict(success, list(collector.api_keys)))
+    except OSError as e:
+        logging.error(f"Error writing run metrics: {str(e)}")
 
 if __name__ == "__main__":
     # If run directly, execute the data collection process
@@ -20,9 +20,17 @@ class WeeklyExportCollectorConfig(CollectorConfig):
     MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
     DB_PATH = os.path.join(CollectorConfig.DATA_DIR, 'weekly_export_sales', 'weekly_export_sales.db')
     LOG_PATH = os.path.join(CollectorConfig.LOGS_DIR, 'weekly_export_sales.log')
+    METRICS_PATH = os.path.join(CollectorConfig.DATA_DIR, 'weekly_export_sales', 'collector_metrics.json')
 
-    # API settings
-    BASE_URL = "https://api.fas.usda.gov/api/esr"
+    # Collect into a staging copy of the database and swap it in atomically when done,
+    # so the web app never reads a half-written database
+    STAGED_PUBLISH = os.environ.get('ESR_STAGED_PUBLISH', 'True') == 'True'
+
+    # Precompute the web app's most requested plots after each publish
+    WARM_PLOT_CACHE = os.environ.get('ESR_WARM_PLOT_CACHE', 'True') == 'True'
+
+    # API settings (ESR_BASE_URL points the collector at another server, e.g. the local stub API)
+    BASE_URL = os.environ.get('ESR_BASE_URL', "https://api.fas.usda.gov/api/esr")
     API_KEYS = [
         "sXXbup7bXhySZZJBQv5VmmugtL3iW1UoRyjfeHJX",
         "O3NXAWRBr9DTb9EzpgzXcfB0FDhUWnyWSMZaT21u",
@@ -31,8 +39,21 @@ class WeeklyExportCollectorConfig(CollectorConfig):
         "H6UpwAmkElhx1Vjv3N3f0aBcBGND5KekrBTEXoFP"
     ]
     RATE_LIMIT_THRESHOLD = 50
+    # Requests per hour allowed for each API key (the api.data.gov default)
+    API_HOURLY_LIMIT = 1000
+    # Seconds to wait for a quota refresh once every API key is exhausted
+    QUOTA_REFRESH_WAIT = 300
 
     # Request settings
     TIMEOUT = 120
     RETRY_DELAY = 5
     MAX_RETRIES = 5
+    # Empty responses from an exports endpoint that confirm it has no rows yet;
+    # confirmed endpoints are skipped until their release timestamp changes
+    EMPTY_CONFIRM_ATTEMPTS = 2
+
+    # Async engine: maximum requests in flight
+    ASYNC_CONCURRENCY = 8
+
+    # Seconds per request assumed by the --plan estimate before any run metrics exist
+    PLAN_REQUEST_SECONDS = 1.0
@@ -0,0 +1,40 @@
+"""
+Negative cache of empty ESR export endpoints.
+
+Commodity / marketing year pairs are listed in /datareleasedates before the
+API has any export rows for them, e.g. a new marketing year at the start of
+the season. Once an exports endpoint is confirmed empty it is recorded here
+with the pair's release timestamp, and later runs skip the request until a
+new release changes the timestamp. The table lives in the collected database,
+so it is published and staged along with the data.
+"""
+
+import sqlite3
+from typing import Dict
+
+EMPTY_RESPONSES_DDL = """
+CREATE TABLE IF NOT EXISTS empty_responses (
+    endpoint TEXT PRIMARY KEY,
+    releaseTimeStamp TEXT,
+    recorded_at TIMESTAMP
+)
+"""
+
+
+def load_empty_responses(conn: sqlite3.Connection) -> Dict[str, str]:
+    """Get the release timestamp each endpoint was last found empty at, keyed by endpoint."""
+    conn.execute(EMPTY_RESPONSES_DDL)
+    return dict(conn.execute("SELECT endpoint, releaseTimeStamp FROM empty_responses"))
+
+
+def record_empty_response(conn: sqlite3.Connection, endpoint: str, release_timestamp: str):
+    """Record that an endpoint returned no rows at a release."""
+    conn.execute("""
+        INSERT OR REPLACE INTO empty_responses (endpoint, releaseTimeStamp, recorded_at)
+        VALUES (?, ?, datetime('now'))
+    """, (endpoint, release_timestamp))
+
+
+def clear_empty_response(conn: sqlite3.Connection, endpoint: str):
+    """Forget an endpoint that has returned rows."""
+    conn.execute("DELETE FROM empty_responses WHERE endpoint = ?", (endpoint,))
@@ -0,0 +1,175 @@
+"""
+Export fact storage for the Weekly Export Sales database.
+
+Export rows are stored in export_facts, a WITHOUT ROWID table clustered on
+(commodityCode, market_year, week_ending_day, countryCode) with a fixed
+typed schema: integer keys, week ending dates as day numbers since
+1970-01-01 and NUMERIC metric columns, which store whole quantities as
+integers and fractional ones as REAL. Commodity, country and unit names
+live only in the metadata dimension tables.
+
+The commodity_exports view exposes the facts in the original API column
+layout, with ISO weekEndingDate strings, for readers that don't need the
+compact format.
+"""
+
+import logging
+import sqlite3
+
+import pandas as pd
+
+# API metric columns stored on every fact row
+METRIC_COLUMNS = [
+    'weeklyExports',
+    'accumulatedExports',
+    'outstandingSales',
+    'grossNewSales',
+    'currentMYNetSales',
+    'currentMYTotalCommitment',
+    'nextMYOutstandingSales',
+    'nextMYNetSales',
+]
+
+KEY_COLUMNS = ['commodityCode', 'market_year', 'week_ending_day', 'countryCode']
+
+FACT_COLUMNS = KEY_COLUMNS + ['unitId'] + METRIC_COLUMNS
+
+# julianday() of 1970-01-01, the origin of the week_ending_day numbers
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+EXPORT_FACTS_DDL = f"""
+CREATE TABLE IF NOT EXISTS export_facts (
+    commodityCode INTEGER NOT NULL,
+    market_year INTEGER NOT NULL,
+    week_ending_day INTEGER NOT NULL,
+    countryCode INTEGER NOT NULL,
+    unitId INTEGER,
+    {', '.join(f'{col} NUMERIC' for col in METRIC_COLUMNS)},
+    weeks_into_my INTEGER,
+    next_my_weeks_into_my INTEGER,
+    PRIMARY KEY (commodityCode, market_year, week_ending_day, countryCode)
+) WITHOUT ROWID
+"""
+
+COMMODITY_EXPORTS_VIEW_DDL = f"""
+CREATE VIEW IF NOT EXISTS commodity_exports AS
+SELECT
+    commodityCode,
+    countryCode,
+    {', '.join(METRIC_COLUMNS)},
+    unitId,
+    strftime('%Y-%m-%dT%H:%M:%S', week_ending_day + {UNIX_EPOCH_JULIAN_DAY}) AS weekEndingDate,
+    commodityCode AS commodity_code,
+    market_year,
+    date(week_ending_day + {UNIX_EPOCH_JULIAN_DAY}) AS week_ending,
+    weeks_into_my,
+    next_my_weeks_into_my
+FROM export_facts
+"""
+
+
+def _weeks_sql(start_expr: str) -> str:
+    """
+    SQL for the weeks between a fact's week ending day and a marketing year start.
+
+    Matches utils.calculate_weeks_into_my: floor division of the day
+    difference by 7, and NULL when the date is over a year before the start.
+    """
+    days = (f"(export_facts.week_ending_day - "
+            f"CAST(julianday(substr({start_expr}, 1, 10)) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER))")
+    # SQLite's % truncates towards zero, so floor explicitly for negative days
+    return f"CASE WHEN {days} < -368 THEN NULL ELSE ({days} - ((({days}) % 7) + 7) % 7) / 7 END"
+
+
+# Start of the row's marketing year
+CURRENT_WEEKS_SQL = f"""(
+    SELECT {_weeks_sql('r.marketYearStart')}
+    FROM data_releases r
+    WHERE r.commodityCode = export_facts.commodityCode
+    AND r.marketYear = export_facts.market_year
+)"""
+
+# Start of the following marketing year, or one year after the row's start
+# when the next marketing year hasn't been released yet
+NEXT_WEEKS_SQL = f"""(
+    SELECT {_weeks_sql("COALESCE(n.marketYearStart, date(substr(r.marketYearStart, 1, 10), '+1 year'))")}
+    FROM data_releases r
+    LEFT JOIN data_releases n
+        ON n.commodityCode = r.commodityCode AND n.marketYear = r.marketYear + 1
+    WHERE r.commodityCode = export_facts.commodityCode
+    AND r.marketYear = export_facts.market_year
+)"""
+
+
+def ensure_export_facts(conn: sqlite3.Connection):
+    """Create the export_facts table and the commodity_exports view if missing."""
+    conn.execute(EXPORT_FACTS_DDL)
+    conn.execute(COMMODITY_EXPORTS_VIEW_DDL)
+
+
+def to_day_numbers(dates: pd.Series) -> pd.Series:
+    """Convert API weekEndingDate values to day numbers since 1970-01-01."""
+    dates = pd.to_datetime(dates.astype(str).str[:10], format='%Y-%m-%d')
+    return (dates - pd.Timestamp('1970-01-01')).dt.days
+
+
+def write_export_facts(conn: sqlite3.Connection, df: pd.DataFrame, commodity_code: int, market_year: int) -> int:
+    """
+    Replace the export facts of a commodity and marketing year with an API response.
+
+    Values are converted to the fixed fact schema before they are written;
+    where the response repeats a week and country, the last row wins.
+    Returns the number of rows written.
+    """
+    facts = pd.DataFrame({
+        'commodityCode': int(commodity_code),
+        'market_year': int(market_year),
+        'week_ending_day': to_day_numbers(df['weekEndingDate']),
+        'countryCode': pd.to_numeric(df['countryCode'], errors='coerce'),
+        'unitId': pd.to_numeric(df['unitId'], errors='coerce') if 'unitId' in df.columns else None,
+    })
+    for col in METRIC_COLUMNS:
+        facts[col] = pd.to_numeric(df[col], errors='coerce') if col in df.columns else None
+
+    if facts.duplicated(KEY_COLUMNS).any():
+        logging.warning(f"Found duplicates in import data for commodity {commodity_code}, year {market_year}")
+        facts = facts.drop_duplicates(KEY_COLUMNS, keep='last')
+
+    rows = facts[FACT_COLUMNS].astype(object).where(facts[FACT_COLUMNS].notna(), None)
+
+    conn.execute("DELETE FROM export_facts WHERE commodityCode = ? AND market_year = ?",
+                 (int(commodity_code), int(market_year)))
+    conn.executemany(f"""
+        INSERT INTO export_facts ({', '.join(FACT_COLUMNS)})
+        VALUES ({', '.join('?' for _ in FACT_COLUMNS)})
+    """, rows.itertuples(index=False, name=None))
+    logging.info(f"Wrote {len(rows)} export facts for commodity {commodity_code}, year {market_year}")
+    return len(rows)
+
+
+def update_week_columns(conn: sqlite3.Connection, commodity_code: int = None, market_year: int = None):
+    """
+    Compute weeks_into_my and next_my_weeks_into_my from data_releases.
+
+    With a commodity and marketing year, updates that marketing year's rows
+    and the next MY weeks of the year before it, whose next marketing year
+    start may only now be known. Without them, updates every row.
+    """
+    if commodity_code is None:
+        conn.execute(f"""
+            UPDATE export_facts SET
+                weeks_into_my = {CURRENT_WEEKS_SQL},
+                next_my_weeks_into_my = {NEXT_WEEKS_SQL}
+        """)
+        return
+
+    conn.execute(f"""
+        UPDATE export_facts SET
+            weeks_into_my = {CURRENT_WEEKS_SQL},
+            next_my_weeks_into_my = {NEXT_WEEKS_SQL}
+        WHERE commodityCode = ? AND market_year = ?
+    """, (commodity_code, market_year))
+    conn.execute(f"""
+        UPDATE export_facts SET next_my_weeks_into_my = {NEXT_WEEKS_SQL}
+        WHERE commodityCode = ? AND market_year = ?
+    """, (commodity_code, market_year - 1))
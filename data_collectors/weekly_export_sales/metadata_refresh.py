@@ -0,0 +1,95 @@
+"""
+Conditional refresh of the Weekly Export Sales metadata tables.
+
+The regions, units, commodities and countries payloads almost never change.
+metadata_versions keeps a content hash of each payload, the HTTP validators
+(ETag / Last-Modified) the API sent with it, and the metadata version the
+table was last rewritten at. Each run sends the validators as conditional
+request headers. When the API answers 304 Not Modified, or the payload hashes
+the same, the table is left alone; otherwise it is rewritten in place and
+gets the next metadata version.
+
+Readers check get_metadata_version(), a single query on a four-row table, to
+tell whether cached dimension data is still current.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+METADATA_VERSIONS_DDL = """
+CREATE TABLE IF NOT EXISTS metadata_versions (
+    name TEXT PRIMARY KEY,
+    content_hash TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    version INTEGER,
+    updated_at TIMESTAMP
+)
+"""
+
+
+def load_metadata_state(conn: sqlite3.Connection) -> Dict[str, Dict]:
+    """Get the stored hash, validators and version of each metadata table, keyed by name."""
+    conn.execute(METADATA_VERSIONS_DDL)
+    cursor = conn.execute("SELECT name, content_hash, etag, last_modified, version FROM metadata_versions")
+    return {name: {'content_hash': content_hash, 'etag': etag, 'last_modified': last_modified, 'version': version}
+            for name, content_hash, etag, last_modified, version in cursor}
+
+
+def get_metadata_version(conn: sqlite3.Connection) -> int:
+    """Get the current metadata version (0 if metadata was never recorded)."""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM metadata_versions").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def validators_for(state: Optional[Dict]) -> Dict[str, str]:
+    """The stored HTTP validators of a table, for a conditional request."""
+    state = state or {}
+    return {'etag': state.get('etag'), 'last_modified': state.get('last_modified')}
+
+
+def content_hash(data: List[Dict]) -> str:
+    """Hash a metadata payload independently of key order and formatting."""
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _table_exists(conn: sqlite3.Connection, table_name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (table_name,)).fetchone() is not None
+
+
+def refresh_metadata_table(conn: sqlite3.Connection, name: str, data: List[Dict], validators: Dict[str, str],
+                           state: Optional[Dict], version: int) -> bool:
+    """
+    Rewrite metadata_<name> from a payload if its content changed.
+
+    Records the payload's hash and validators either way; a rewritten table
+    is recorded at the given (new) metadata version. Returns whether it was.
+    """
+    table_name = f"metadata_{name}"
+    new_hash = content_hash(data)
+    changed = state is None or state['content_hash'] != new_hash or not _table_exists(conn, table_name)
+
+    if changed:
+        from data_collectors.weekly_export_sales.collector import process_table_data
+        process_table_data(pd.DataFrame(data), table_name, conn)
+        logging.info(f"Metadata table {table_name} changed, now at metadata version {version}")
+    else:
+        version = state['version']
+        logging.info(f"Metadata table {table_name} unchanged")
+
+    conn.execute("""
+        INSERT OR REPLACE INTO metadata_versions (name, content_hash, etag, last_modified, version, updated_at)
+        VALUES (?, ?, ?, ?, ?, datetime('now'))
+    """, (name, new_hash, validators.get('etag'), validators.get('last_modified'), version))
+    conn.commit()
+    return changed
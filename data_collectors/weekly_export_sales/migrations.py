@@ -0,0 +1,107 @@
+"""
+Schema migrations for the Weekly Export Sales database.
+
+Databases written before export_facts kept export rows in a commodity_exports
+table with the API payload columns as-is. migrate() copies those rows into
+the typed export_facts table, computes the derived week columns, replaces
+the old table with the commodity_exports view and vacuums the file. It
+also builds the calendar period aggregates of databases collected before
+they were added.
+
+Run directly to migrate the configured database:
+    python data_collectors/weekly_export_sales/migrations.py
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+# Add project root to path for relative imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from data_collectors.weekly_export_sales.config import WeeklyExportCollectorConfig
+from data_collectors.weekly_export_sales.export_facts import (
+    EXPORT_FACTS_DDL, METRIC_COLUMNS, UNIX_EPOCH_JULIAN_DAY, ensure_export_facts, update_week_columns)
+from modules.weekly_export_sales.periods import ensure_period_tables, update_period_exports
+
+
+def _table_columns(conn: sqlite3.Connection, table_name: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+def _object_type(conn: sqlite3.Connection, name: str) -> str:
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def migrate_export_table(conn: sqlite3.Connection) -> int:
+    """
+    Move rows from a legacy commodity_exports table into export_facts.
+
+    Returns the number of rows copied, 0 if there was no legacy table.
+    """
+    if _object_type(conn, 'commodity_exports') != 'table':
+        return 0
+
+    columns = _table_columns(conn, 'commodity_exports')
+    metrics_sql = ', '.join(f"CAST({col} AS NUMERIC)" if col in columns else "NULL" for col in METRIC_COLUMNS)
+    unit_sql = "CAST(unitId AS INTEGER)" if 'unitId' in columns else "NULL"
+
+    conn.execute(EXPORT_FACTS_DDL)
+
+    # Later rows replace earlier duplicates, as the old collector kept the newest
+    cursor = conn.execute(f"""
+        INSERT OR REPLACE INTO export_facts (
+            commodityCode, market_year, week_ending_day, countryCode, unitId, {', '.join(METRIC_COLUMNS)}
+        )
+        SELECT
+            CAST(commodityCode AS INTEGER),
+            CAST(market_year AS INTEGER),
+            CAST(julianday(substr(weekEndingDate, 1, 10)) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER),
+            CAST(countryCode AS INTEGER),
+            {unit_sql},
+            {metrics_sql}
+        FROM commodity_exports
+        WHERE weekEndingDate IS NOT NULL
+        ORDER BY rowid
+    """)
+    copied = cursor.rowcount
+    conn.execute("DROP TABLE commodity_exports")
+    return copied
+
+
+def migrate(conn: sqlite3.Connection):
+    """Bring a database up to the current schema, converting legacy export rows."""
+    start = time.perf_counter()
+    copied = migrate_export_table(conn)
+    ensure_export_facts(conn)
+    if copied:
+        update_week_columns(conn)
+    if ensure_period_tables(conn) or copied:
+        rows = update_period_exports(conn)
+        logging.info(f"Built {rows} calendar period aggregate rows")
+    conn.commit()
+    if not copied:
+        return
+
+    logging.info(f"Migrated {copied} export rows to export_facts in {time.perf_counter() - start:.2f}s")
+
+    # Give the legacy table's pages back to the file system
+    conn.execute("VACUUM")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = sqlite3.connect(WeeklyExportCollectorConfig.DB_PATH)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Build-then-swap publishing for the Weekly Export Sales database.
+A collection run writes into a staging copy of the live database, which is
+renamed over the live file once the run has finished. Readers open a new
+connection per request, so they keep reading the previous file until the
+rename and pick up the new one on their next query, without locks on the
+live database or a restart of the web app.
+
+Every publish is recorded in the publish_log table, whose latest version
+identifies the data a reader is looking at.
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+PUBLISH_LOG_DDL = """
+CREATE TABLE IF NOT EXISTS publish_log (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    published_at TIMESTAMP,
+    pairs_updated INTEGER,
+    rows_written INTEGER,
+    staged INTEGER
+)
+"""
+
+
+def prepare_staging(live_path: str) -> str:
+    """
+    Create a staging copy of the live database next to it.
+
+    The copy is taken with SQLite's online backup API, so it is consistent
+    even while the web app is reading the live file. The staging file lives
+    in the same directory so the final rename is atomic.
+    """
+    directory = os.path.dirname(os.path.abspath(live_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, staging_path = tempfile.mkstemp(prefix=f"{os.path.basename(live_path)}.", suffix='.staging', dir=directory)
+    os.close(fd)
+
+    start = time.perf_counter()
+    target = sqlite3.connect(staging_path)
+    try:
+        if os.path.exists(live_path):
+            source = sqlite3.connect(f"file:{live_path}?mode=ro", uri=True)
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+    finally:
+        target.close()
+
+    logging.info(f"Prepared staging database {staging_path} in {time.perf_counter() - start:.2f}s")
+    return staging_path
+
+
+def record_publish(conn: sqlite3.Connection, run_metrics, staged: bool) -> int:
+    """Add a publish_log entry for a collection run and return the new data version."""
+    conn.execute(PUBLISH_LOG_DDL)
+    cursor = conn.execute("""
+        INSERT INTO publish_log (published_at, pairs_updated, rows_written, staged)
+        VALUES (datetime('now'), ?, ?, ?)
+    """, (run_metrics.pairs_updated, run_metrics.rows_written, int(staged)))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def publish_database(staging_path: str, live_path: str):
+    """Atomically replace the live database with a finished staging database."""
+    with open(staging_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(staging_path, live_path)
+
+    # Persist the rename itself
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(live_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    logging.info(f"Published {live_path}")
+
+
+def discard_staging(staging_path: str):
+    """Remove a staging database left by a failed run."""
+    for path in (staging_path, f"{staging_path}-journal"):
+        if path and os.path.exists(path):
+            os.remove(path)
+            logging.info(f"Discarded staging database {path}")
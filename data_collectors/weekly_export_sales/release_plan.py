@@ -0,0 +1,138 @@
+"""
+Release planning for the Weekly Export Sales collector.
+
+plan_releases diffs the API's /datareleasedates against the data_releases
+table in one merge and returns the commodity / marketing year pairs to
+fetch as a priority-ordered work queue: each commodity's current marketing
+year first, then the commodities most viewed in the web app, then the most
+recent marketing years. A full release is fetched current years first, so
+the numbers people are waiting for on release morning land early.
+
+estimate_budget and format_plan back the collector's --plan dry run.
+"""
+
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+KEY_COLUMNS = ['commodityCode', 'marketYear']
+
+
+@dataclass
+class ReleasePlan:
+    """Pairs to fetch, one row each in fetch order, and the number skipped as known empty."""
+    queue: pd.DataFrame
+    skipped_empty: int = 0
+    _releases: Dict[tuple, Dict] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._releases = self.queue.set_index(KEY_COLUMNS).to_dict('index')
+
+    @property
+    def pairs(self) -> List[Tuple[int, int]]:
+        """(commodity, market year) pairs in fetch order."""
+        return list(zip(self.queue['commodityCode'].tolist(), self.queue['marketYear'].tolist()))
+
+    def release(self, commodity_code: int, market_year: int) -> Dict:
+        """The /datareleasedates record of a planned pair."""
+        return self._releases[(commodity_code, market_year)]
+
+
+def _stored_releases(conn: sqlite3.Connection) -> pd.DataFrame:
+    try:
+        stored = pd.read_sql("""
+            SELECT commodityCode, marketYear, releaseTimeStamp AS storedTimeStamp FROM data_releases
+        """, conn)
+    except (pd.errors.DatabaseError, sqlite3.OperationalError):
+        stored = pd.DataFrame(columns=KEY_COLUMNS + ['storedTimeStamp'])
+    return stored.astype({'commodityCode': 'int64', 'marketYear': 'int64'})
+
+
+def current_market_years(releases: pd.DataFrame, today: pd.Timestamp = None) -> pd.Series:
+    """
+    Mark each commodity's current marketing year.
+
+    That is the latest marketing year that has started by today, or the
+    latest listed one where the release dates have no marketYearStart.
+    """
+    latest = releases.groupby('commodityCode')['marketYear'].transform('max')
+    if 'marketYearStart' in releases.columns:
+        today = today or pd.Timestamp.now()
+        starts = pd.to_datetime(releases['marketYearStart'], errors='coerce')
+        started = releases['marketYear'].where(starts.isna() | (starts <= today))
+        latest = started.groupby(releases['commodityCode']).transform('max').fillna(latest)
+    return releases['marketYear'] == latest
+
+
+def plan_releases(conn: sqlite3.Connection, releases_df: pd.DataFrame, empty_responses: Dict[str, str],
+                  commodity_views: Optional[Dict[int, int]] = None, today: pd.Timestamp = None) -> ReleasePlan:
+    """
+    Plan the pairs with a release newer than the one stored in data_releases.
+
+    Pairs whose exports endpoint was found empty at their current release
+    are left out. commodity_views (plot requests per commodity) orders the
+    commodities within each priority level.
+    """
+    from data_collectors.weekly_export_sales.collector import exports_endpoint
+
+    releases = releases_df.drop_duplicates(KEY_COLUMNS).astype({'commodityCode': 'int64', 'marketYear': 'int64'})
+    releases = releases.assign(current=current_market_years(releases, today))
+    merged = releases.merge(_stored_releases(conn), on=KEY_COLUMNS, how='left')
+
+    release_ts = merged['releaseTimeStamp'].fillna('').astype(str)
+    stored_ts = merged['storedTimeStamp'].fillna('').astype(str)
+    stale = merged[(stored_ts == '') | (release_ts > stored_ts)]
+
+    endpoints = pd.Series([exports_endpoint(code, year) for code, year in zip(stale['commodityCode'],
+                                                                                 stale['marketYear'])],
+                          index=stale.index, dtype=object)
+    known_empty = endpoints.map(empty_responses) == stale['releaseTimeStamp']
+    queue = stale[~known_empty]
+
+    queue = queue.assign(views=queue['commodityCode'].map(commodity_views or {}).fillna(0).astype('int64'))
+    queue = queue.sort_values(['current', 'views', 'marketYear', 'commodityCode'],
+                              ascending=[False, False, False, True], kind='stable').reset_index(drop=True)
+    return ReleasePlan(queue, int(known_empty.sum()))
+
+
+def estimate_budget(plan: ReleasePlan, extra_requests: int, request_seconds: float, concurrency: int,
+                    hourly_quota: int) -> Dict:
+    """
+    Estimate the requests, share of the hourly API quota and time a plan needs.
+
+    Assumes one request per pair, no retries, and concurrency requests of
+    request_seconds each in flight at a time.
+    """
+    requests = len(plan.queue) + extra_requests
+    return {
+        'requests': requests,
+        'hourly_quota': hourly_quota,
+        'quota_share': requests / hourly_quota if hourly_quota else None,
+        'request_seconds': request_seconds,
+        'concurrency': concurrency,
+        'seconds': requests * request_seconds / max(1, concurrency),
+    }
+
+
+def format_plan(plan: ReleasePlan, budget: Dict, limit: int = 20) -> str:
+    """Human readable summary of a plan and its budget, listing the first limit pairs."""
+    queue = plan.queue
+    lines = [f"{len(queue)} commodity / marketing year pairs to fetch "
+             f"({int(queue['current'].sum()) if len(queue) else 0} current), "
+             f"{plan.skipped_empty} skipped as known empty"]
+    if len(queue):
+        lines.append(f"{'#':>4} {'commodity':>9} {'MY':>5} {'current':>7} {'views':>6}  release")
+        for position, row in enumerate(queue.head(limit).itertuples(), 1):
+            lines.append(f"{position:>4} {row.commodityCode:>9} {row.marketYear:>5} "
+                         f"{'yes' if row.current else '':>7} {row.views:>6}  {row.releaseTimeStamp}")
+        if len(queue) > limit:
+            lines.append(f"     ... {len(queue) - limit} more")
+
+    quota = (f"{budget['quota_share']:.0%} of the {budget['hourly_quota']} requests/hour quota"
+             if budget['quota_share'] is not None else "no quota configured")
+    lines.append(f"Requests: {budget['requests']} ({quota})")
+    lines.append(f"Time: ~{budget['seconds']:.0f}s at {budget['request_seconds']:.2f}s/request, "
+                 f"{budget['concurrency']} in flight")
+    return '\n'.join(lines)
@@ -8,8 +8,22 @@ Example cron entry (runs every Thursday at 1:00 AM):
 
 Make sure to set execution permissions:
 chmod +x /path/to/market_research_platform/data_collectors/weekly_export_sales/run.py
+
+To collect from another ESR server (e.g. the local stub API in benchmarks/),
+pass --base-url or set the ESR_BASE_URL environment variable:
+python run.py --base-url http://127.0.0.1:8765
+
+--engine async runs the asyncio collector (requires aiohttp), which keeps
+several requests in flight instead of fetching one at a time:
+python run.py --engine async --concurrency 16
+
+--plan prints the work queue of the next run, current marketing years first,
+with its request count and estimated quota and time budget, without
+collecting or writing anything:
+python run.py --plan --engine async
 """
 
+import argparse
 import os
 import sys
 import logging
@@ -21,25 +35,42 @@ project_root = os.path.abspath(os.path.join(current_dir, '../..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from data_collectors.weekly_export_sales.collector import collect_data
+from data_collectors.weekly_export_sales.collector import collect_data, plan_collection
+from data_collectors.weekly_export_sales.async_collector import collect_data_async
 from data_collectors.weekly_export_sales.config import WeeklyExportCollectorConfig
+from data_collectors.weekly_export_sales.release_plan import format_plan
+import logging_config
 
 def main():
     """Main function to run the data collection process."""
+    parser = argparse.ArgumentParser(description='Collect USDA Weekly Export Sales data')
+    parser.add_argument('--base-url', help='ESR API base URL (default: ESR_BASE_URL or the USDA API)')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync', help='Collector engine')
+    parser.add_argument('--concurrency', type=int, default=WeeklyExportCollectorConfig.ASYNC_CONCURRENCY,
+                        help='Maximum requests in flight for the async engine')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Write directly into the live database instead of a staging copy')
+    parser.add_argument('--plan', action='store_true',
+                        help='Print the planned requests and their budget instead of collecting')
+    args = parser.parse_args()
+    staged = False if args.in_place else None
 
+    if args.plan:
+        concurrency = args.concurrency if args.engine == 'async' else 1
+        release_plan, budget = plan_collection(base_url=args.base_url, concurrency=concurrency)
+        print(format_plan(release_plan, budget))
+        return 0
 
-    # Configure logging for direct execution
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        filename=WeeklyExportCollectorConfig.LOG_PATH,
-        filemode='a'
-    )
+    # Configure logging for direct execution (a no-op once the collector has)
+    logging_config.configure_logging(WeeklyExportCollectorConfig)
 
-    logging.info(f"=== Starting Weekly Export Sales data collection at {datetime.now()} ===")
+    logging.info(f"=== Starting Weekly Export Sales data collection ({args.engine} engine) at {datetime.now()} ===")
 
     try:
-        collect_data()
+        if args.engine == 'async':
+            collect_data_async(base_url=args.base_url, concurrency=args.concurrency, staged=staged)
+        else:
+            collect_data(base_url=args.base_url, staged=staged)
         logging.info(f"=== Weekly Export Sales data collection completed successfully at {datetime.now()} ===")
         return 0
     except Exception as e:
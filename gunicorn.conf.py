@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for the Market Research Platform.
+
+    gunicorn -c gunicorn.conf.py
+
+Serves wsgi:application from threaded (gthread) workers. The app is loaded
+once in the master before the workers fork, so pandas, plotly and the module
+setup are imported once and shared copy-on-write. Each worker builds plots
+in its own process pool (PLOT_EXECUTOR=process), keeping slow plots from
+holding up the metadata requests on its threads.
+
+Worker, thread, bind and timeout settings come from Config and can be set
+with the SERVER_* environment variables. Log rotation is off unless
+LOG_MAX_BYTES is set; rotate logs/app/app.log externally (logrotate with
+copytruncate).
+"""
+
+import os
+
+os.environ.setdefault('APP_CONFIG', 'production')
+os.environ.setdefault('PLOT_EXECUTOR', 'process')
+
+# Every worker appends to the same app log; a RotatingFileHandler in each
+# would rotate it under the others, so leave rotation to logrotate
+os.environ.setdefault('LOG_MAX_BYTES', '0')
+
+# Warm the plot cache from the first worker rather than the preloading
+# master, whose warm-up threads would still be running when it forks
+warm_plot_cache = os.environ.get('PLOT_WARMUP_ON_STARTUP', 'True') == 'True'
+os.environ['PLOT_WARMUP_ON_STARTUP'] = 'False'
+
+from config import Config
+
+wsgi_app = 'wsgi:application'
+bind = Config.SERVER_BIND
+workers = Config.SERVER_WORKERS
+worker_class = 'gthread'
+threads = Config.SERVER_THREADS
+timeout = Config.SERVER_TIMEOUT
+preload_app = True
+
+accesslog = os.path.join(Config.LOGS_DIR, 'app', 'access.log')
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """Start the plot cache warm-up in the first worker."""
+    if warm_plot_cache and worker.age == 1:
+        from modules.weekly_export_sales import weekly_exports_bp
+        from modules.weekly_export_sales.plot_cache import start_warm_up
+        start_warm_up(weekly_exports_bp.export_manager, weekly_exports_bp.plot_cache, weekly_exports_bp.usage_log,
+                      weekly_exports_bp.admission)
+
+
+def worker_exit(server, worker):
+    """Stop the worker's plot process pool."""
+    from modules.weekly_export_sales import weekly_exports_bp
+    weekly_exports_bp.plot_executor.shutdown()
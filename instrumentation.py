@@ -0,0 +1,223 @@
+"""
+Request instrumentation for the Market Research Platform.
+Provides per-stage timers for hot paths, a Server-Timing response header,
+structured per-request timing logs and an opt-in per-request profiler.
+"""
+
+import cProfile
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from flask import g, request
+
+from config import Config
+
+logger = logging.getLogger('instrumentation')
+
+_current_timings = contextvars.ContextVar('stage_timings', default=None)
+
+
+class StageTimings:
+    """Accumulates the time spent in each named stage of a single request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = defaultdict(lambda: [0.0, 0])
+
+    def add(self, name: str, duration: float):
+        with self._lock:
+            stage = self._stages[name]
+            stage[0] += duration
+            stage[1] += 1
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        """Stage durations in milliseconds with call counts, in first-seen order."""
+        with self._lock:
+            return {name: {'ms': round(duration * 1000, 2), 'count': count}
+                    for name, (duration, count) in self._stages.items()}
+
+    def server_timing_header(self) -> str:
+        """Format the stages as a Server-Timing header value."""
+        with self._lock:
+            parts = [f"{name};dur={duration * 1000:.1f}"
+                     for name, (duration, _) in self._stages.items()]
+        parts.append(f"total;dur={self.total() * 1000:.1f}")
+        return ', '.join(parts)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the current request (no-op outside one)."""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def timed_stage(name: str):
+    """Decorator form of stage() for functions and methods."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate_context(func):
+    """Wrap a callable so it records stages into the caller's request when run on another thread."""
+    context = contextvars.copy_context()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call
+        # runs in its own copy; the copies share the same StageTimings
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler for a single thread.
+
+    Samples the target thread's stack at a fixed interval and writes the
+    result in the collapsed-stack format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write_folded(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def _profiling_requested() -> str:
+    """Return the requested profiler mode ('pstats' or 'sample'), or '' if none."""
+    if not Config.PROFILING_ENABLED:
+        return ''
+    flag = request.headers.get('X-Profile') or request.args.get('profile') or ''
+    if flag.lower() in ('', '0', 'false', 'no'):
+        return ''
+    return 'pstats' if flag.lower() == 'pstats' else 'sample'
+
+
+def _start_request():
+    g.stage_timings = StageTimings()
+    g.stage_timings_token = _current_timings.set(g.stage_timings)
+
+    mode = _profiling_requested()
+    if mode == 'pstats':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    elif mode == 'sample':
+        g.profiler = SamplingProfiler(threading.get_ident(), Config.PROFILE_SAMPLE_INTERVAL)
+        g.profiler.start()
+
+
+def _finish_request(response):
+    timings = g.pop('stage_timings', None)
+    if timings is None:
+        return response
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-Output'] = os.path.basename(_write_profile(profiler))
+
+    if Config.SERVER_TIMING_ENABLED:
+        response.headers['Server-Timing'] = timings.server_timing_header()
+
+    stages = timings.as_dict()
+    if stages:
+        total_ms = round(timings.total() * 1000, 2)
+        logger.info(f"{request.method} {request.path} {response.status_code} in {total_ms} ms", extra={
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'total_ms': total_ms,
+            'stages': stages
+        })
+    return response
+
+
+def _teardown_request(exc):
+    # A profiler is normally finished in _finish_request; make sure a sampler
+    # thread never outlives its request
+    profiler = g.pop('profiler', None)
+    if isinstance(profiler, SamplingProfiler):
+        profiler.stop()
+    elif profiler is not None:
+        profiler.disable()
+
+    token = g.pop('stage_timings_token', None)
+    if token is not None:
+        _current_timings.reset(token)
+
+
+def _write_profile(profiler) -> str:
+    """Write a finished profile to Config.PROFILE_DIR and return its path."""
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{request.endpoint or 'request'}"
+
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        path = os.path.join(Config.PROFILE_DIR, f"{name}.pstats")
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = os.path.join(Config.PROFILE_DIR, f"{name}.folded")
+        profiler.write_folded(path)
+
+    logger.info(f"Wrote request profile to {path}")
+    return path
+
+
+def init_app(app):
+    """Register the request timing and profiling hooks with the Flask app."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
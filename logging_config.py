@@ -0,0 +1,194 @@
+"""
+Logging setup for the Market Research Platform.
+
+The app and the collectors log through the root logger. configure_logging
+puts a QueueHandler on it, so a logging call only renders the message and
+enqueues the record; a QueueListener thread formats records and writes
+them to a size-rotated log file, keeping file I/O off request and fetch
+threads.
+
+Records are written as one JSON object per line by default, with the
+standard fields plus any `extra` fields of the call (e.g. duration_ms), or
+in the plain text format with LOG_FORMAT=text. Levels can be set per
+module: LOG_LEVELS="werkzeug=WARNING,data_collectors.weekly_export_sales=DEBUG"
+applies to named loggers and to root logger calls made from those modules.
+
+Each process writes and rotates the file on its own. With several gunicorn
+workers logging to one file, set LOG_MAX_BYTES=0 and rotate externally.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+_listener: Optional[QueueListener] = None
+
+
+def _level(name: str) -> int:
+    level = logging.getLevelName(name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level '{name}'")
+    return level
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse "module=LEVEL,module=LEVEL" into a dict of levels."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        module, _, level = item.partition('=')
+        levels[module.strip()] = _level(level)
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    Apply per-module levels to records.
+
+    A record belongs to its logger's name or, for root logger calls, to the
+    dotted path of the module it was logged from; the longest matching
+    module prefix decides its level.
+    """
+
+    def __init__(self, level: int, module_levels: Dict[str, int]):
+        super().__init__()
+        self.level = level
+        self.module_levels = sorted(module_levels.items(), key=lambda item: -len(item[0]))
+        self._thresholds = {}
+
+    def _module_path(self, record: logging.LogRecord) -> str:
+        if record.name != 'root':
+            return record.name
+        path = os.path.relpath(os.path.splitext(record.pathname)[0], PROJECT_ROOT)
+        return path.replace(os.sep, '.')
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.pathname)
+        threshold = self._thresholds.get(key)
+        if threshold is None:
+            module = self._module_path(record)
+            threshold = next((level for prefix, level in self.module_levels
+                              if module == prefix or module.startswith(prefix + '.')), self.level)
+            self._thresholds[key] = threshold
+        return record.levelno >= threshold
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback on the calling thread, as they may
+        # change or hold frames alive; keep the other fields for JsonFormatter
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(config, force: bool = False) -> bool:
+    """
+    Send root logger records through a queue to config.LOG_PATH.
+
+    Uses the LOG_PATH, LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_MAX_BYTES and
+    LOG_BACKUP_COUNT settings of a config class. Like logging.basicConfig,
+    does nothing if the root logger already has handlers, unless force is
+    set. Returns whether logging was configured.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return False
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    os.makedirs(os.path.dirname(config.LOG_PATH), exist_ok=True)
+    file_handler = RotatingFileHandler(config.LOG_PATH, maxBytes=config.LOG_MAX_BYTES,
+                                       backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+    file_handler.setFormatter(JsonFormatter() if config.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    level = _level(config.LOG_LEVEL)
+    module_levels = parse_levels(config.LOG_LEVELS)
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(ModuleLevelFilter(level, module_levels))
+    root.addHandler(queue_handler)
+    # The filter applies the levels; the root logger only drops what no module wants
+    root.setLevel(min([level, *module_levels.values()]))
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    return True
+
+
+def stop_logging():
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def _pause_before_fork():
+    # Drain the queue and stop the listener so that no thread is inside the
+    # file handler's stream when the process forks
+    if _listener is not None:
+        _listener.stop()
+
+
+def _resume_after_fork():
+    if _listener is not None:
+        _listener.start()
+
+
+def _restart_after_fork():
+    # A forked child (e.g. a gunicorn worker of a preloaded app) inherits the
+    # queue but not the listener thread: give it a queue and listener of its own
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _QueueHandler):
+            handler.queue = log_queue
+    _listener.queue = log_queue
+    _listener.start()
+
+
+os.register_at_fork(before=_pause_before_fork, after_in_parent=_resume_after_fork,
+                    after_in_child=_restart_after_fork)
+atexit.register(stop_logging)
@@ -0,0 +1,293 @@
+"""
+Metrics for the Market Research Platform.
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format at /metrics, plus helpers for the
+run-metrics files written by the data collectors.
+
+Metrics are kept per process; under a multi-worker server each worker
+reports its own values.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import Response, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    metric_type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {counts[-1]}"
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(name, documentation, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route'))
+REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+CACHE_REQUESTS = REGISTRY.counter(
+    'cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+SQLITE_QUERIES = REGISTRY.counter(
+    'sqlite_queries_total', 'SQLite statements executed by the web app', ('database',))
+ROWS_LOADED = REGISTRY.histogram(
+    'rows_loaded', 'Rows loaded per data load', ('loader',),
+    buckets=(100, 1000, 10000, 50000, 100000, 250000, 500000, 1000000))
+SINGLE_FLIGHT_REQUESTS = REGISTRY.counter(
+    'single_flight_requests_total', 'Coalesced computations by group and role (leader or follower)',
+    ('group', 'role'))
+SINGLE_FLIGHT_TIMEOUTS = REGISTRY.counter(
+    'single_flight_timeouts_total', 'Followers that stopped waiting for a leader after the group timeout', ('group',))
+SINGLE_FLIGHT_IN_FLIGHT = REGISTRY.gauge(
+    'single_flight_in_flight', 'Computations currently running in a single-flight group', ('group',))
+OFFLOADED_TASKS = REGISTRY.gauge(
+    'offloaded_tasks_in_flight', 'Tasks submitted to an offload executor and not yet finished', ('executor',))
+ADMISSION_LIMITS = REGISTRY.gauge(
+    'admission_limit', 'Configured admission control limits by controller and limit', ('controller', 'limit'))
+ADMISSION_DECISIONS = REGISTRY.counter(
+    'admission_decisions_total', 'Admission decisions by controller and decision '
+    '(light, heavy, downgraded or rejected)', ('controller', 'decision'))
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    'admission_rejections_total', 'Rejected requests by controller and reason', ('controller', 'reason'))
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    'admission_heavy_in_flight', 'Heavy requests currently running', ('controller',))
+ADMISSION_QUEUED = REGISTRY.gauge(
+    'admission_heavy_queued', 'Heavy requests waiting for a slot', ('controller',))
+ADMISSION_WAIT = REGISTRY.histogram(
+    'admission_wait_seconds', 'Time heavy requests waited for a slot', ('controller',))
+ADMISSION_ESTIMATED_ROWS = REGISTRY.histogram(
+    'admission_estimated_rows', 'Estimated rows per admitted request, before any downgrade', ('controller',),
+    buckets=(100, 1000, 10000, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000))
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup as a hit or a miss."""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def record_single_flight(group: str, shared: bool):
+    """Count a single-flight call as the leader that computes or a follower that shares its result."""
+    SINGLE_FLIGHT_REQUESTS.inc(group=group, role='follower' if shared else 'leader')
+
+
+def count_queries(conn, database: str):
+    """Count every statement executed on an SQLite connection."""
+    conn.set_trace_callback(lambda statement: SQLITE_QUERIES.inc(database=database))
+    return conn
+
+
+# ===== Collector run metrics =====
+
+def write_run_metrics(path: str, run_metrics: Dict):
+    """Atomically write a collector's run metrics file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(run_metrics, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def read_run_metrics(path: str) -> Optional[Dict]:
+    """Read a collector's run metrics file, or None if it doesn't exist yet."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read collector metrics from {path}: {str(e)}")
+        return None
+
+
+def render_run_metrics(collector: str, run_metrics: Dict) -> str:
+    """Render a collector run-metrics file as gauges in exposition format."""
+    lines = []
+    label = f'collector="{_escape(collector)}"'
+
+    for key, value in run_metrics.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        name = f"collector_last_run_{key}"
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{{{label}}} {_format_value(value)}")
+
+    api_keys = run_metrics.get('api_keys') or []
+    if api_keys:
+        lines.append("# TYPE collector_api_quota_remaining gauge")
+        for api_key in api_keys:
+            if api_key.get('rate_limit_remaining') is None:
+                continue
+            lines.append(f'collector_api_quota_remaining{{{label},key="{_escape(api_key["key"])}"}} '
+                         f'{_format_value(api_key["rate_limit_remaining"])}')
+
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+# ===== Flask integration =====
+
+def _start_timer():
+    request.environ['metrics.start'] = time.perf_counter()
+
+
+def _record_request(response):
+    start = request.environ.get('metrics.start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route)
+        REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    return response
+
+
+# Collector name -> run metrics file exposed alongside the app's own metrics
+_collector_files = {}
+
+
+def register_collector(collector: str, path: str):
+    """Expose a collector's run metrics file at /metrics."""
+    _collector_files[collector] = path
+
+
+def init_app(app):
+    """Register request metrics and the /metrics endpoint with the Flask app."""
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+
+    @app.route('/metrics')
+    def metrics():
+        """Expose metrics in the Prometheus text format."""
+        body = REGISTRY.render()
+        for collector, path in _collector_files.items():
+            run_metrics = read_run_metrics(path)
+            if run_metrics:
+                body += render_run_metrics(collector, run_metrics)
+        return Response(body, mimetype='text/plain; version=0.0.4')
@@ -15,10 +15,46 @@ weekly_exports_bp = Blueprint(
     static_folder='static'
 )
 
-# Attach the data manager to the blueprint
+# Attach the data manager to the blueprint, sharing loaded frames between worker processes
 from .config import WeeklyExportConfig
+from .frame_cache import FrameCache
 from .manager import ExportDataManager
-weekly_exports_bp.export_manager = ExportDataManager(WeeklyExportConfig.DB_PATH)
+weekly_exports_bp.export_manager = ExportDataManager(
+    WeeklyExportConfig.DB_PATH,
+    FrameCache(WeeklyExportConfig.FRAME_CACHE_DIR, WeeklyExportConfig.FRAME_CACHE_MAX_MB * 1024 * 1024)
+    if WeeklyExportConfig.FRAME_CACHE_ENABLED else None
+)
+
+# Plot cache shared by all workers, and the usage counts that drive its warm-up
+from .plot_cache import PlotCache, UsageLog, start_warm_up
+weekly_exports_bp.plot_cache = PlotCache(WeeklyExportConfig.PLOT_CACHE_DIR)
+weekly_exports_bp.usage_log = UsageLog(WeeklyExportConfig.USAGE_DB_PATH, WeeklyExportConfig.USAGE_FLUSH_SECONDS)
+
+# Concurrent requests for the same plot wait on a single build
+from .single_flight import SingleFlight
+weekly_exports_bp.plot_flights = (
+    SingleFlight('plot', WeeklyExportConfig.ADMISSION_QUEUE_TIMEOUT + WeeklyExportConfig.PLOT_BUILD_TIMEOUT)
+    if WeeklyExportConfig.PLOT_COALESCE_REQUESTS else None
+)
+
+# Plot builds run off the request thread when an executor pool is configured
+from .plot_executor import PlotExecutor
+weekly_exports_bp.plot_executor = PlotExecutor(WeeklyExportConfig.PLOT_EXECUTOR, WeeklyExportConfig.PLOT_EXECUTOR_WORKERS)
+
+# Plot requests are sized before they are built; heavy ones are queued, oversized ones downgraded
+from .admission import AdmissionController
+weekly_exports_bp.admission = AdmissionController.from_config('plot')
+
+@weekly_exports_bp.record_once
+def _warm_plot_cache(state):
+    """Precompute popular plots in the background when the app starts."""
+    if WeeklyExportConfig.PLOT_WARMUP_ON_STARTUP:
+        start_warm_up(weekly_exports_bp.export_manager, weekly_exports_bp.plot_cache, weekly_exports_bp.usage_log,
+                      weekly_exports_bp.admission)
+
+# Expose the collector's run metrics at /metrics
+import metrics
+metrics.register_collector('weekly_export_sales', WeeklyExportConfig.COLLECTOR_METRICS_PATH)
 
 # Import routes AFTER creating the blueprint to avoid circular imports
 from . import routes
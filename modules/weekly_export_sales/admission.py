@@ -0,0 +1,211 @@
+"""
+Admission control for Weekly Export Sales plot requests.
+
+Loading every marketing year of a commodity for all countries can take
+hundreds of megabytes per request (about 0.5 KB per stored export fact
+row, which loading splits into two marketing year records), so a few such
+requests at once can exhaust a worker's memory. Before a plot is built, an
+AdmissionController sizes it in fact rows from the manager's row statistics:
+
+    light     at most heavy_rows rows: built right away
+    heavy     built once one of max_heavy slots is free; up to queue_size
+              requests wait for a slot, for at most queue_timeout seconds
+    over      more than max_rows rows: downgraded to fit, or rejected
+
+A country plot over the budget keeps its top countries by weekly exports;
+other plots, and country plots still over it, keep their latest marketing
+years. The response says what was left out.
+
+Limits apply per worker process, like the metrics that report them.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import metrics
+
+from .config import WeeklyExportConfig
+from .plots import PlotRequest
+from .query_plan import LoadPlan
+
+
+class AdmissionRejected(Exception):
+    """A request that is over the row budget or found no free slot in time."""
+
+    def __init__(self, message: str, status: int, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+@dataclass
+class Admission:
+    """A sized plot request, possibly downgraded from the one asked for."""
+    plot_request: PlotRequest
+    rows: int
+    heavy: bool
+    downgraded: Optional[Dict] = None
+
+
+class AdmissionController:
+    """Size plot requests and cap the number of heavy ones running at once."""
+
+    def __init__(self, name: str, heavy_rows: int, max_rows: int, max_heavy: int, queue_size: int,
+                 queue_timeout: float, downgrade: bool = True, top_countries: int = 20):
+        self.name = name
+        self.heavy_rows = heavy_rows
+        self.max_rows = max_rows
+        self.max_heavy = max(1, max_heavy)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.downgrade = downgrade
+        self.top_countries = top_countries
+        self._slots = threading.BoundedSemaphore(self.max_heavy)
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+        for limit, value in (('heavy_rows', heavy_rows), ('max_rows', max_rows), ('max_heavy', self.max_heavy),
+                             ('queue_size', queue_size), ('queue_timeout_seconds', queue_timeout)):
+            metrics.ADMISSION_LIMITS.set(value, controller=name, limit=limit)
+
+    @classmethod
+    def from_config(cls, name: str) -> Optional['AdmissionController']:
+        """A controller with the ADMISSION_* settings, or None if admission control is off."""
+        if not WeeklyExportConfig.ADMISSION_CONTROL:
+            return None
+        return cls(
+            name,
+            heavy_rows=WeeklyExportConfig.ADMISSION_HEAVY_ROWS,
+            max_rows=WeeklyExportConfig.ADMISSION_MAX_ROWS,
+            max_heavy=WeeklyExportConfig.ADMISSION_MAX_HEAVY,
+            queue_size=WeeklyExportConfig.ADMISSION_QUEUE_SIZE,
+            queue_timeout=WeeklyExportConfig.ADMISSION_QUEUE_TIMEOUT,
+            downgrade=WeeklyExportConfig.ADMISSION_DOWNGRADE,
+            top_countries=WeeklyExportConfig.ADMISSION_TOP_COUNTRIES
+        )
+
+    # ===== Sizing =====
+
+    def _commodity_codes(self, plot_request: PlotRequest) -> List[int]:
+        codes = [plot_request.commodity_code]
+        if plot_request.plot_type == 'commodity_comparison':
+            codes += list(plot_request.compare_commodities)
+        return codes[:WeeklyExportConfig.COMPARISON_MAX_COMMODITIES]
+
+    def estimate_rows(self, data_manager, plot_request: PlotRequest) -> int:
+        """Estimate the export fact rows building a plot request would load (see ExportDataManager.estimate_rows)."""
+        plan = LoadPlan.create(plot_request.countries, [plot_request.metric])
+        return sum(data_manager.estimate_rows(code, plot_request.start_year, plot_request.end_year, plan)
+                   for code in self._commodity_codes(plot_request))
+
+    def _top_countries(self, data_manager, plot_request: PlotRequest, limit: int) -> List[str]:
+        stats = data_manager.get_row_statistics(plot_request.commodity_code)
+        stats = stats[stats['market_year'].between(plot_request.start_year, plot_request.end_year)]
+        totals = stats.groupby('countryName')['weekly_exports'].sum()
+        return totals.sort_values(ascending=False, kind='stable').index[:limit].tolist()
+
+    def _latest_years(self, data_manager, plot_request: PlotRequest) -> Optional[PlotRequest]:
+        # The latest start year whose range up to end_year fits the budget
+        for start_year in range(plot_request.start_year + 1, plot_request.end_year + 1):
+            shorter = PlotRequest.create(**dict(plot_request.to_dict(), start_year=start_year))
+            if self.estimate_rows(data_manager, shorter) <= self.max_rows:
+                return shorter
+        return None
+
+    def _downgrade(self, data_manager, plot_request: PlotRequest, rows: int) -> Optional[Admission]:
+        request = plot_request
+        changes = []
+        all_countries = not request.countries or 'All Countries' in request.countries
+        if request.plot_type == 'country' and all_countries:
+            countries = self._top_countries(data_manager, request, self.top_countries)
+            if countries:
+                request = PlotRequest.create(**dict(request.to_dict(), countries=countries))
+                changes.append(f"the top {len(countries)} countries by weekly exports")
+        if self.estimate_rows(data_manager, request) > self.max_rows:
+            request = self._latest_years(data_manager, request)
+            if request is None:
+                return None
+            changes.append(f"marketing years {request.start_year - 1}/{request.start_year} "
+                           f"to {request.end_year - 1}/{request.end_year}")
+
+        downgraded_rows = self.estimate_rows(data_manager, request)
+        downgraded = {
+            'message': (f"Showing {' and '.join(changes)}: the full selection is about {rows:,} rows, "
+                        f"over the limit of {self.max_rows:,}."),
+            'estimated_rows': rows,
+            'max_rows': self.max_rows,
+            'countries': list(request.countries),
+            'start_year': request.start_year,
+            'end_year': request.end_year,
+        }
+        return Admission(request, downgraded_rows, downgraded_rows > self.heavy_rows, downgraded)
+
+    def plan(self, data_manager, plot_request: PlotRequest) -> Admission:
+        """
+        Size a plot request, downgrading it if it is over max_rows.
+
+        Raises:
+            AdmissionRejected: if the request is over the budget and cannot
+                (or may not) be downgraded to fit
+        """
+        rows = self.estimate_rows(data_manager, plot_request)
+        metrics.ADMISSION_ESTIMATED_ROWS.observe(rows, controller=self.name)
+        if rows <= self.max_rows:
+            admission = Admission(plot_request, rows, rows > self.heavy_rows)
+            metrics.ADMISSION_DECISIONS.inc(controller=self.name, decision='heavy' if admission.heavy else 'light')
+            return admission
+
+        admission = self._downgrade(data_manager, plot_request, rows) if self.downgrade else None
+        if admission is None:
+            metrics.ADMISSION_DECISIONS.inc(controller=self.name, decision='rejected')
+            metrics.ADMISSION_REJECTIONS.inc(controller=self.name, reason='row_budget')
+            raise AdmissionRejected(f"The selection is about {rows:,} rows, over the limit of {self.max_rows:,}. "
+                                    f"Select fewer marketing years or countries.", 413)
+        metrics.ADMISSION_DECISIONS.inc(controller=self.name, decision='downgraded')
+        return admission
+
+    # ===== Concurrency =====
+
+    def _reject_busy(self, reason: str):
+        metrics.ADMISSION_REJECTIONS.inc(controller=self.name, reason=reason)
+        raise AdmissionRejected("The server is busy with other large requests, please try again shortly.", 503,
+                                retry_after=max(1, int(self.queue_timeout)))
+
+    @contextmanager
+    def admit(self, admission: Admission):
+        """
+        Hold a heavy request's slot while it runs; light requests pass straight through.
+
+        Raises:
+            AdmissionRejected: if the queue is full or no slot frees up within queue_timeout
+        """
+        if not admission.heavy:
+            yield
+            return
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.queue_size:
+                    self._reject_busy('queue_full')
+                self._waiting += 1
+            metrics.ADMISSION_QUEUED.inc(controller=self.name)
+            start = time.perf_counter()
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+                metrics.ADMISSION_QUEUED.dec(controller=self.name)
+                metrics.ADMISSION_WAIT.observe(time.perf_counter() - start, controller=self.name)
+            if not acquired:
+                self._reject_busy('queue_timeout')
+
+        metrics.ADMISSION_IN_FLIGHT.inc(controller=self.name)
+        try:
+            yield
+        finally:
+            metrics.ADMISSION_IN_FLIGHT.dec(controller=self.name)
+            self._slots.release()
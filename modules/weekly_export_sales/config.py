@@ -13,6 +13,9 @@ class WeeklyExportConfig:
     
     # Path to SQLite database
     DB_PATH = os.path.join(Config.DATA_DIR, 'weekly_export_sales', 'weekly_export_sales.db')
+
+    # Run metrics written by the collector after each run
+    COLLECTOR_METRICS_PATH = os.path.join(Config.DATA_DIR, 'weekly_export_sales', 'collector_metrics.json')
     
     # UI Settings
     DEFAULT_METRIC = 'weeklyExports'
@@ -28,6 +31,98 @@ class WeeklyExportConfig:
         'totalCommitment': 'Total Commitment'
     }
     
+    # Source columns in commodity_exports for each metric (current marketing year)
+    METRIC_COLUMNS = {
+        'netSales': 'currentMYNetSales',
+        'totalCommitment': 'currentMYTotalCommitment',
+        'outstandingSales': 'outstandingSales',
+        'accumulatedExports': 'accumulatedExports',
+        'weeklyExports': 'weeklyExports',
+        'grossNewSales': 'grossNewSales'
+    }
+
+    # Source columns carrying next marketing year values
+    NEXT_MY_METRIC_COLUMNS = {
+        'netSales': 'nextMYNetSales',
+        'outstandingSales': 'nextMYOutstandingSales',
+    }
+
+    # Multi-commodity comparison
+    COMPARISON_MAX_COMMODITIES = 6
+    COMPARISON_MAX_WORKERS = 4
+
+    # Units are normalized to COMPARISON_UNIT when comparing commodities.
+    # Keys are lower-cased metadata_units.unitNames; factors convert to the
+    # comparison unit. Units not listed here are left as reported.
+    COMPARISON_UNIT = 'Metric Tons'
+    UNIT_CONVERSIONS = {
+        'metric tons': 1.0,
+        'running bales': 0.21772,  # 480 lb. statistical bales
+        '480 lb. bales': 0.21772,
+    }
+
+    # Traces per line of a streamed plot (get_plot_stream)
+    PLOT_STREAM_BATCH_TRACES = int(os.environ.get('PLOT_STREAM_BATCH_TRACES', '8'))
+
+    # Rows fetched per batch by the load_data fact reader
+    READ_BATCH_SIZE = 8192
+
+    # Loaded frames shared by every app worker process through memory-mapped
+    # files, per data version (FRAME_CACHE_DIR may point at e.g. /dev/shm);
+    # least recently used frames are evicted above FRAME_CACHE_MAX_MB
+    FRAME_CACHE_ENABLED = os.environ.get('FRAME_CACHE_ENABLED', 'True') == 'True'
+    FRAME_CACHE_DIR = os.environ.get('FRAME_CACHE_DIR', os.path.join(Config.DATA_DIR, 'weekly_export_sales', 'frame_cache'))
+    FRAME_CACHE_MAX_MB = int(os.environ.get('FRAME_CACHE_MAX_MB', '512'))
+
+    # Data export
+    EXPORT_CHUNK_SIZE = 5000
+    EXPORT_FORMATS = ('csv', 'parquet')
+
+    # Reports
+    REPORT_TOP_BUYERS = 10
+    # Report types built from the calendar period aggregates -> period
+    PERIOD_REPORTS = {
+        'monthly': 'month',
+        'quarterly': 'quarter'
+    }
+
+    # Plot cache (per data version) and the usage table that drives warm-up
+    PLOT_CACHE_DIR = os.path.join(Config.DATA_DIR, 'weekly_export_sales', 'plot_cache')
+    USAGE_DB_PATH = os.path.join(Config.DATA_DIR, 'weekly_export_sales', 'usage.db')
+    USAGE_FLUSH_SECONDS = 30
+    PLOT_WARMUP_ON_STARTUP = os.environ.get('PLOT_WARMUP_ON_STARTUP', 'True') == 'True'
+    PLOT_WARMUP_TOP_N = 50
+    PLOT_WARMUP_WINDOW_DAYS = 30
+    PLOT_WARMUP_WORKERS = 4
+
+    # Concurrent identical plot requests share one build instead of each building it.
+    # Requests waiting on another's build give up after the build's longest
+    # admission queue wait plus PLOT_BUILD_TIMEOUT seconds of building
+    PLOT_COALESCE_REQUESTS = os.environ.get('PLOT_COALESCE_REQUESTS', 'True') == 'True'
+    PLOT_BUILD_TIMEOUT = float(os.environ.get('PLOT_BUILD_TIMEOUT', '60'))
+
+    # Where plots are built: 'inline' on the request thread, or a bounded
+    # 'thread' or 'process' pool so slow plots don't hold up other requests
+    PLOT_EXECUTOR = os.environ.get('PLOT_EXECUTOR', 'inline')
+    PLOT_EXECUTOR_WORKERS = int(os.environ.get('PLOT_EXECUTOR_WORKERS', '2'))
+
+    # Admission control of plot requests, per worker process, sized in
+    # export fact rows as stored. Loading reshapes each fact row into a current
+    # and a next marketing year record, so the frame holds about twice as many
+    # rows; peak memory is about 0.5 KB per fact row, reshape included. Requests over
+    # ADMISSION_HEAVY_ROWS run at most ADMISSION_MAX_HEAVY at a time, with up
+    # to ADMISSION_QUEUE_SIZE more waiting ADMISSION_QUEUE_TIMEOUT seconds for
+    # a slot; requests over ADMISSION_MAX_ROWS are cut to their top countries
+    # or latest marketing years when ADMISSION_DOWNGRADE is set, else rejected
+    ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'True') == 'True'
+    ADMISSION_HEAVY_ROWS = int(os.environ.get('ADMISSION_HEAVY_ROWS', '100000'))
+    ADMISSION_MAX_ROWS = int(os.environ.get('ADMISSION_MAX_ROWS', '1000000'))
+    ADMISSION_MAX_HEAVY = int(os.environ.get('ADMISSION_MAX_HEAVY', '2'))
+    ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '8'))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '30'))
+    ADMISSION_DOWNGRADE = os.environ.get('ADMISSION_DOWNGRADE', 'True') == 'True'
+    ADMISSION_TOP_COUNTRIES = int(os.environ.get('ADMISSION_TOP_COUNTRIES', '20'))
+
     # Ensure the data directory exists
     @classmethod
     def ensure_directories(cls):
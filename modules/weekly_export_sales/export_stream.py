@@ -0,0 +1,108 @@
+"""
+Streaming writers for Weekly Export Sales data exports.
+Turn chunks of database rows into CSV text or Parquet row groups as they are
+read, so large exports are never held in memory in full.
+"""
+
+import csv
+import io
+from typing import Iterator, List, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+# Column types for Parquet output; metric columns are always float64
+TEXT_COLUMNS = {'weekEndingDate', 'commodityName', 'countryName', 'unit'}
+INTEGER_COLUMNS = {'marketYear', 'countryCode'}
+
+RowChunks = Iterator[Tuple[List[str], List[tuple]]]
+
+
+def parquet_available() -> bool:
+    """Check whether the optional pyarrow dependency is installed."""
+    return pq is not None
+
+
+def stream_csv(chunks: RowChunks) -> Iterator[str]:
+    """Yield CSV text, one piece per row chunk, starting with the header row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+
+    for columns, rows in chunks:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the caller."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema(columns: List[str]):
+    fields = []
+    for col in columns:
+        if col in TEXT_COLUMNS:
+            fields.append(pa.field(col, pa.string()))
+        elif col in INTEGER_COLUMNS:
+            fields.append(pa.field(col, pa.int64()))
+        else:
+            fields.append(pa.field(col, pa.float64()))
+    return pa.schema(fields)
+
+
+def stream_parquet(chunks: RowChunks) -> Iterator[bytes]:
+    """Yield a Parquet file incrementally, writing one row group per row chunk."""
+    if not parquet_available():
+        raise RuntimeError("Parquet export requires the pyarrow package")
+
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+
+    for columns, rows in chunks:
+        if writer is None:
+            schema = _parquet_schema(columns)
+            writer = pq.ParquetWriter(sink, schema)
+        if rows:
+            arrays = [pa.array(values, type=field.type)
+                      for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
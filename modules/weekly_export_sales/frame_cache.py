@@ -0,0 +1,222 @@
+"""
+Shared frame cache for the Weekly Export Sales module.
+
+load_data results are published as flat column files, one directory per
+data version (see the collector's publish_log), and every app worker
+process, plot pool process included, attaches them with a memory map
+instead of loading the data again. Numeric and date columns are views of
+the mapped file, so the pages are shared through the OS page cache rather
+than copied into each process; the maps are copy-on-write, so a frame can
+still be modified in place without touching the file or other processes.
+Text columns are stored as codes into their distinct values and rebuilt on
+attach.
+
+A new data version replaces the previous version's files, and the least
+recently used frames are evicted to keep the cache under max_bytes.
+"""
+
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # No cross-process build lock on Windows
+    fcntl = None
+
+MAGIC = b'ESRFRAME'
+ALIGNMENT = 64
+
+# Serializes evictions within a process (FrameCache itself stays picklable
+# for the plot process pool)
+_evict_lock = threading.Lock()
+
+# Seconds a version directory newer than the current data version is kept
+# without being written to, in case it is for a publish not yet seen here
+NEWER_VERSION_GRACE = 600
+
+
+def prune_versions(root: str, version: int):
+    """
+    Remove the v<N> data version directories under root other than version's.
+
+    Older versions are removed at once. A newer one usually belongs to a
+    publish that other workers already read, so it is only removed once it
+    has gone NEWER_VERSION_GRACE seconds without a write, as happens when an
+    older database is restored.
+    """
+    if not os.path.isdir(root):
+        return
+    now = time.time()
+    for name in os.listdir(root):
+        number = name[1:]
+        if not (name.startswith('v') and number.isdigit()) or int(number) == version:
+            continue
+        path = os.path.join(root, name)
+        try:
+            if int(number) > version and now - os.stat(path).st_mtime < NEWER_VERSION_GRACE:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _encode_column(series: pd.Series):
+    """Column values as a fixed width array plus its header entry."""
+    values = series.to_numpy()
+    if values.dtype.kind in 'biufcmM':
+        return np.ascontiguousarray(values), {'kind': 'array'}
+    # Text and other object columns: codes into the distinct values
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return codes.astype(np.int32), {'kind': 'codes', 'values': [None if pd.isna(v) else v for v in uniques]}
+
+
+def write_frame(path: str, df: pd.DataFrame):
+    """Write a frame in the cache file format: header, then 64-byte aligned column buffers."""
+    columns, buffers = [], []
+    for name in df.columns:
+        values, entry = _encode_column(df[name])
+        entry.update(name=name, dtype=values.dtype.str, pandas_dtype=str(df[name].dtype))
+        columns.append(entry)
+        buffers.append(values)
+
+    # Offsets are relative to the end of the header
+    offset = 0
+    for entry, values in zip(columns, buffers):
+        offset = _aligned(offset)
+        entry['offset'] = offset
+        offset += values.nbytes
+    header = json.dumps({'rows': len(df), 'columns': columns}, default=str).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        for entry, values in zip(columns, buffers):
+            f.seek(data_start + entry['offset'])
+            f.write(values.tobytes())
+        f.truncate(data_start + offset)
+
+
+def read_frame(path: str) -> pd.DataFrame:
+    """Attach a cache file written by write_frame, mapping its numeric columns."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a frame cache file")
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length))
+    data_start = _aligned(len(MAGIC) + 8 + header_length)
+    rows = header['rows']
+    mapped = np.memmap(path, mode='c') if rows else None
+
+    data = {}
+    for entry in header['columns']:
+        dtype = np.dtype(entry['dtype'])
+        values = (np.frombuffer(mapped, dtype=dtype, count=rows, offset=data_start + entry['offset'])
+                  if rows else np.empty(0, dtype=dtype))
+        if entry['kind'] == 'codes':
+            uniques = pd.array(entry['values'] + [None], dtype=entry['pandas_dtype'])
+            # The NA code -1 takes the trailing None
+            data[entry['name']] = pd.Series(uniques.take(values), copy=False)
+        else:
+            data[entry['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+class FrameCache:
+    """Loaded frames in memory-mapped files, one directory per data version."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, version: int, key: str) -> str:
+        return os.path.join(self.root, f"v{version}", f"{key}.frame")
+
+    def _ensure_version_dir(self, version: int):
+        # The first frame of a new data version replaces the older versions
+        directory = os.path.join(self.root, f"v{version}")
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            self.prune(version)
+
+    def get(self, version: int, key: str) -> Optional[pd.DataFrame]:
+        path = self._path(version, key)
+        try:
+            df = read_frame(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not attach cached frame {path}: {str(e)}")
+            return None
+        try:
+            # Mark the frame used for least recently used eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def put(self, version: int, key: str, df: pd.DataFrame):
+        path = self._path(version, key)
+        self._ensure_version_dir(version)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            write_frame(tmp_path, df)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not cache frame {path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict(version)
+
+    @contextmanager
+    def build_lock(self, version: int, key: str):
+        """Hold a lock on a key across processes while its frame is built."""
+        if fcntl is None:
+            yield
+            return
+        path = f"{self._path(version, key)}.lock"
+        self._ensure_version_dir(version)
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self, version: int):
+        """Remove the least recently used frames of a version until the cache fits in max_bytes."""
+        directory = os.path.join(self.root, f"v{version}")
+        with _evict_lock:
+            try:
+                entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.frame')]
+            except FileNotFoundError:
+                return
+            stats: Dict[str, os.stat_result] = {entry.path: entry.stat() for entry in entries}
+            total = sum(stat.st_size for stat in stats.values())
+            for path in sorted(stats, key=lambda p: stats[p].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    # Processes that attached the frame keep their mapping
+                    os.remove(path)
+                    total -= stats[path].st_size
+                except OSError:
+                    pass
+
+    def prune(self, version: int):
+        """Remove cached frames for other data versions (see prune_versions)."""
+        prune_versions(self.root, version)
@@ -4,20 +4,73 @@ Handles database interactions and data processing for visualization.
 """
 
 import os
+import hashlib
 import logging
 import sqlite3
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Iterator, Tuple
 from .config import WeeklyExportConfig
+from .frame_cache import FrameCache
+from .query_plan import LoadPlan
 from .utils import calculate_weeks_into_my, calculate_weeks_into_my_for_df
+from . import periods, reports
+from instrumentation import stage, timed_stage, propagate_context
+import metrics
+from data_collectors.weekly_export_sales import metadata_refresh
 
 class ExportDataManager:
     """Data manager class for export sales data, handling database operations."""
+
+    # Typed schema of the export_facts columns read by load_data, in table order.
+    # 'key' columns are never NULL; 'int' columns are int64 unless they hold NULLs
+    # and 'number' columns int64 when every value is whole, as read_sql returns them.
+    FACT_SCHEMA = {
+        'commodityCode': 'key',
+        'market_year': 'key',
+        'week_ending_day': 'key',
+        'countryCode': 'key',
+        'unitId': 'int',
+        'weeklyExports': 'number',
+        'accumulatedExports': 'number',
+        'outstandingSales': 'number',
+        'grossNewSales': 'number',
+        'currentMYNetSales': 'number',
+        'currentMYTotalCommitment': 'number',
+        'nextMYOutstandingSales': 'number',
+        'nextMYNetSales': 'number',
+        'weeks_into_my': 'int',
+        'next_my_weeks_into_my': 'int',
+    }
     
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, frame_cache: FrameCache = None):
         self.db_path = db_path or WeeklyExportConfig.DB_PATH
         self._ensure_db_directory()
         self.metrics = WeeklyExportConfig.METRICS
+        # Loaded frames shared with the other worker processes, if configured
+        self.frame_cache = frame_cache
+        self._export_facts_seen = False
+        # (metadata version, countries, units) of the last dimension read
+        self._dimensions = None
+        # Commodity code -> (data version, row statistics)
+        self._row_statistics = {}
+        # (commodity code, period) -> (data version, period totals per country)
+        self._period_exports = {}
+
+    def __getstate__(self):
+        # The manager is pickled with every plot built in a process pool
+        # (PLOT_EXECUTOR=process); its caches stay behind and start empty there
+        state = self.__dict__.copy()
+        for name in ('_dimensions', '_row_statistics', '_period_exports'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._dimensions = None
+        self._row_statistics = {}
+        self._period_exports = {}
     
     def _ensure_db_directory(self):
         """Ensure the database directory exists."""
@@ -25,7 +78,21 @@ class ExportDataManager:
     
     def get_connection(self):
         """Get a database connection."""
-        return sqlite3.connect(self.db_path)
+        return metrics.count_queries(sqlite3.connect(self.db_path), 'weekly_export_sales')
+
+    def get_data_version(self) -> int:
+        """Get the version of the published data, from the collector's publish log (0 if never published)."""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute("SELECT MAX(version) FROM publish_log").fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return row[0] or 0
+
+    def get_metadata_version(self) -> int:
+        """Get the version of the metadata tables, from the collector's metadata_versions (0 if never recorded)."""
+        with self.get_connection() as conn:
+            return metadata_refresh.get_metadata_version(conn)
     
     def get_commodities(self) -> pd.DataFrame:
         """Get all available commodities."""
@@ -62,18 +129,64 @@ class ExportDataManager:
 
             return df['countryName'].tolist()
             
-    def get_marketing_year_info(self, commodity_code: int) -> pd.DataFrame:
-        """Get marketing year information for a commodity."""
+    def get_row_statistics(self, commodity_code: int) -> pd.DataFrame:
+        """
+        Get the rows and weekly export totals of a commodity per marketing year and country.
+
+        Sizes requests before they are loaded; kept per commodity until the
+        collector publishes a new data version.
+        """
+        version = self.get_data_version()
+        cached = self._row_statistics.get(commodity_code)
+        if version and cached is not None and cached[0] == version:
+            return cached[1]
+
         with self.get_connection() as conn:
-            my_dates = pd.read_sql("""
+            stats = pd.read_sql("""
                 SELECT
-                    marketYear,
-                    marketYearStart,
-                    marketYearEnd
-                FROM data_releases
+                    market_year,
+                    countryCode,
+                    COUNT(*) AS row_count,
+                    SUM(COALESCE(weeklyExports, 0)) AS weekly_exports
+                FROM commodity_exports
                 WHERE commodityCode = ?
-                ORDER BY marketYear
+                GROUP BY market_year, countryCode
             """, conn, params=(commodity_code,))
+            countries, _ = self._get_dimensions(conn)
+
+        # Rows without country metadata are not loaded, so they are not counted
+        stats['countryName'] = stats['countryCode'].map(countries['countryName'])
+        stats = stats.dropna(subset=['countryName']).reset_index(drop=True)
+        if version:
+            self._row_statistics[commodity_code] = (version, stats)
+        return stats
+
+    def estimate_rows(self, commodity_code: int, start_my: int, end_my: int, plan: LoadPlan = None) -> int:
+        """
+        Estimate the export fact rows load_data would read for a commodity, years and plan.
+
+        These are stored rows; the frame load_data returns has about twice as
+        many, as each row is split into current and next marketing year records.
+        """
+        stats = self.get_row_statistics(commodity_code)
+        selected = stats['market_year'].between(start_my, end_my)
+        if plan is not None and plan.countries is not None:
+            selected &= stats['countryName'].isin(plan.countries)
+        return int(stats.loc[selected, 'row_count'].sum())
+
+    def get_marketing_year_info(self, commodity_code: int) -> pd.DataFrame:
+        """Get marketing year information for a commodity."""
+        with self.get_connection() as conn:
+            with stage('sql'):
+                my_dates = pd.read_sql("""
+                    SELECT
+                        marketYear,
+                        marketYearStart,
+                        marketYearEnd
+                    FROM data_releases
+                    WHERE commodityCode = ?
+                    ORDER BY marketYear
+                """, conn, params=(commodity_code,))
 
             if my_dates.empty:
                 raise ValueError(f"No marketing year data for commodity {commodity_code}")
@@ -95,29 +208,115 @@ class ExportDataManager:
     def get_unit_info(self, commodity_code: int) -> dict:
         """Get unit information for a commodity."""
         with self.get_connection() as conn:
-            info = pd.read_sql("""
-                SELECT
-                    m.commodityCode,
-                    m.commodityName,
-                    m.unitId,
-                    u.unitNames
-                FROM metadata_commodities m
-                JOIN metadata_units u ON m.unitId = u.unitId
-                WHERE m.commodityCode = ?
-            """, conn, params=(commodity_code,))
+            with stage('sql'):
+                info = pd.read_sql("""
+                    SELECT
+                        m.commodityCode,
+                        m.commodityName,
+                        m.unitId,
+                        u.unitNames
+                    FROM metadata_commodities m
+                    JOIN metadata_units u ON m.unitId = u.unitId
+                    WHERE m.commodityCode = ?
+                """, conn, params=(commodity_code,))
 
             if info.empty:
                 raise ValueError(f"No commodity found with code {commodity_code}")
 
             return {
-                'commodity_code': info['commodityCode'].iloc[0],
+                'commodity_code': int(info['commodityCode'].iloc[0]),
                 'commodity_name': info['commodityName'].iloc[0],
-                'unit_id': info['unitId'].iloc[0],
+                'unit_id': int(info['unitId'].iloc[0]),
                 'unit_name': info['unitNames'].iloc[0]
             }
 
-    def load_data(self, commodity_code: int, start_my: int, end_my: int) -> pd.DataFrame:
-        """Load export data for a commodity and time period."""
+    def get_weekly_report(self, commodity_code: int) -> Optional[Dict]:
+        """Get the latest materialized weekly report for a commodity."""
+        with self.get_connection() as conn:
+            report = reports.get_weekly_report(conn, commodity_code, WeeklyExportConfig.REPORT_TOP_BUYERS)
+        metrics.record_cache('weekly_report', report is not None)
+        return report
+
+    def get_period_exports(self, commodity_code: int, period: str = 'month', start: str = None, end: str = None,
+                           countries: List[str] = None) -> pd.DataFrame:
+        """
+        Get a commodity's calendar month or quarter totals per country, across marketing years.
+
+        Reads the period aggregates the collector keeps up to date, kept per
+        commodity and period until it publishes a new data version. start
+        and end select periods by their start date (YYYY-MM-DD); countries
+        limits the countries by name, all countries if None or 'All Countries'.
+        """
+        df = self._get_period_totals(commodity_code, period)
+        selected = pd.Series(True, index=df.index)
+        if start is not None:
+            selected &= df['period_start'] >= pd.Timestamp(start)
+        if end is not None:
+            selected &= df['period_start'] <= pd.Timestamp(end)
+        if countries and 'All Countries' not in countries:
+            selected &= df['countryName'].isin(countries)
+        return df[selected].reset_index(drop=True)
+
+    def _get_period_totals(self, commodity_code: int, period: str) -> pd.DataFrame:
+        """Every period total per country of a commodity, cached per data version."""
+        version = self.get_data_version()
+        cached = self._period_exports.get((commodity_code, period))
+        if version and cached is not None and cached[0] == version:
+            metrics.record_cache('period_exports', True)
+            return cached[1]
+
+        with self.get_connection() as conn:
+            df = periods.get_period_exports(conn, commodity_code, period)
+            countries, _ = self._get_dimensions(conn)
+
+        # Like load_data, leave out rows without country metadata
+        df.insert(2, 'countryName', df['countryCode'].map(countries['countryName']))
+        df = df.dropna(subset=['countryName']).reset_index(drop=True)
+        metrics.record_cache('period_exports', False)
+        if version:
+            self._period_exports[(commodity_code, period)] = (version, df)
+        return df
+
+    def get_period_report(self, commodity_code: int, period: str = 'month') -> Optional[Dict]:
+        """Get the report of a commodity's latest complete calendar month or quarter."""
+        with self.get_connection() as conn:
+            report = periods.get_period_report(conn, commodity_code, period, WeeklyExportConfig.REPORT_TOP_BUYERS)
+        metrics.record_cache('period_report', report is not None)
+        return report
+
+    @timed_stage('load_data')
+    def load_data(self, commodity_code: int, start_my: int, end_my: int, plan: LoadPlan = None) -> pd.DataFrame:
+        """
+        Load export data for a commodity and time period.
+
+        A plan limits the load to its countries, filtered in SQL, and its
+        metric columns. Without one every country and metric is loaded.
+        With a frame cache, a frame another process already loaded for the
+        current data version is attached instead of loaded again.
+        """
+        plan = plan or LoadPlan()
+        version = self.get_data_version() if self.frame_cache is not None else 0
+        if not version:
+            return self._load_data(commodity_code, start_my, end_my, plan)
+
+        key = hashlib.sha1(repr((commodity_code, start_my, end_my, plan)).encode()).hexdigest()[:20]
+        with stage('frame_cache'):
+            cached = self.frame_cache.get(version, key)
+        if cached is None:
+            # One process loads the frame while the others wait to attach it
+            with self.frame_cache.build_lock(version, key):
+                cached = self.frame_cache.get(version, key)
+                if cached is None:
+                    metrics.record_cache('frame', False)
+                    data = self._load_data(commodity_code, start_my, end_my, plan)
+                    if not data.empty:
+                        with stage('frame_cache'):
+                            self.frame_cache.put(version, key, data)
+                    return data
+        metrics.record_cache('frame', True)
+        return cached
+
+    def _load_data(self, commodity_code: int, start_my: int, end_my: int, plan: LoadPlan) -> pd.DataFrame:
         my_dates = self.get_marketing_year_info(commodity_code)
         unit_info = self.get_unit_info(commodity_code)
         
@@ -128,55 +327,199 @@ class ExportDataManager:
             raise ValueError("Some specified marketing years not found in database")
         
         with self.get_connection() as conn:
-            exports_df = pd.read_sql("""
-                SELECT
-                    e.*,
-                    c.commodityName,
-                    mc.countryName,
-                    mc.countryDescription,
-                    mc.regionId,
-                    u.unitNames as unit
-                FROM commodity_exports e
-                JOIN metadata_commodities c ON e.commodityCode = c.commodityCode
-                JOIN metadata_countries mc ON e.countryCode = mc.countryCode
-                JOIN metadata_units u ON e.unitId = u.unitId
-                WHERE e.commodityCode = ?
-                AND e.market_year BETWEEN ? AND ?
-                ORDER BY weekEndingDate
-            """, conn, params=(commodity_code, start_my, end_my))
+            if self._has_export_facts(conn):
+                has_facts = True
+                exports_df = self._read_facts(conn, commodity_code, start_my, end_my, unit_info, plan)
+            else:
+                has_facts = False
+                country_sql, country_params = plan.country_filter('e.countryCode')
+                metric_sql = ''.join(f"e.{col},\n" for col in plan.source_columns())
+                with stage('sql'):
+                    exports_df = pd.read_sql(f"""
+                        SELECT
+                            e.commodityCode,
+                            e.countryCode,
+                            {metric_sql}
+                            e.unitId,
+                            e.weekEndingDate,
+                            e.market_year,
+                            c.commodityName,
+                            mc.countryName,
+                            mc.countryDescription,
+                            mc.regionId,
+                            u.unitNames as unit
+                        FROM commodity_exports e
+                        JOIN metadata_commodities c ON e.commodityCode = c.commodityCode
+                        JOIN metadata_countries mc ON e.countryCode = mc.countryCode
+                        JOIN metadata_units u ON e.unitId = u.unitId
+                        WHERE e.commodityCode = ?
+                        AND e.market_year BETWEEN ? AND ?
+                        {country_sql}
+                        ORDER BY weekEndingDate
+                    """, conn, params=[commodity_code, start_my, end_my] + country_params)
 
         if exports_df.empty:
             logging.warning(f"No export data for commodity {commodity_code} in years {start_my}-{end_my}")
             return pd.DataFrame()
 
-        exports_df['weekEndingDate'] = pd.to_datetime(exports_df['weekEndingDate'])
+        if has_facts:
+            with stage('parse_dates'):
+                # Day numbers since 1970-01-01, at the resolution pandas parses date strings to
+                week_ending = pd.to_datetime(exports_df.pop('week_ending_day'), unit='D')
+                exports_df.insert(0, 'weekEndingDate', week_ending.astype(my_dates['marketYearStart'].dtype))
+        else:
+            # Database not migrated yet: derive the columns the collector would have stored
+            exports_df = self._add_week_columns(exports_df, my_dates)
 
-        column_mappings = {
-            'current': {
-                'netSales': 'currentMYNetSales',
-                'totalCommitment': 'currentMYTotalCommitment',
-                'outstandingSales': 'outstandingSales',
-                'accumulatedExports': 'accumulatedExports',
-                'weeklyExports': 'weeklyExports',
-                'grossNewSales': 'grossNewSales'
-            },
-            'next': {
-                'netSales': 'nextMYNetSales',
-                'outstandingSales': 'nextMYOutstandingSales',
-            }
-        }
+        processed_data = self._reshape_marketing_years(exports_df, plan)
+
+        # Convert numeric columns (the fact reader already returns them typed)
+        if not has_facts:
+            numeric_columns = list(self.metrics.keys())
+            for col in numeric_columns:
+                if col in processed_data.columns:
+                    processed_data[col] = pd.to_numeric(processed_data[col], errors='coerce')
+
+        processed_data['display_units'] = unit_info['unit_name']
 
-        # Make a temporary copy to pre-calculate week numbers for marketing year transitions
-        temp_df = exports_df.copy()
+        # Attach marketing year dates
+        my_dates = my_dates.set_index('marketYear', drop=False)
+        for col in ['marketYear', 'marketYearStart', 'marketYearEnd']:
+            processed_data[col] = processed_data['market_year'].map(my_dates[col])
+        processed_data['weeks_into_my'] = processed_data.pop('weeks_into_my')
+
+        processed_data = processed_data.sort_values('weekEndingDate').reset_index(drop=True)
+        metrics.ROWS_LOADED.observe(len(processed_data), loader='load_data')
+        logging.info(f"Loaded {len(processed_data)} records for commodity {commodity_code}")
+        return processed_data
 
-        # Join with marketing year dates
-        temp_df = temp_df.merge(my_dates, left_on='market_year', right_on='marketYear', how='left')
+    @timed_stage('sql')
+    def _read_facts(self, conn: sqlite3.Connection, commodity_code: int, start_my: int, end_my: int,
+                    unit_info: dict, plan: LoadPlan = None) -> pd.DataFrame:
+        """
+        Read export facts for load_data straight into NumPy arrays.
+
+        Only the integer and numeric fact columns come from the large query,
+        in fetchmany batches copied into one preallocated float64 array, and
+        only the plan's countries and metric columns are read. Names are
+        filled in from the small metadata tables, and facts without country
+        or unit metadata are left out as the joined query did.
+        """
+        plan = plan or LoadPlan()
+        metric_columns = set(plan.source_columns())
+        schema = {column: kind for column, kind in self.FACT_SCHEMA.items()
+                  if kind != 'number' or column in metric_columns}
+        columns = list(schema)
+        country_sql, country_params = plan.country_filter('countryCode')
+        where = f"""
+            FROM export_facts
+            WHERE commodityCode = ?
+            AND market_year BETWEEN ? AND ?
+            AND countryCode IN (SELECT countryCode FROM metadata_countries)
+            AND unitId IN (SELECT unitId FROM metadata_units)
+            {country_sql}
+        """
+        params = [commodity_code, start_my, end_my] + country_params
+
+        n_rows = conn.execute(f"SELECT COUNT(*) {where}", params).fetchone()[0]
+        values = np.empty((n_rows, len(columns)), dtype=np.float64)
+        cursor = conn.execute(f"SELECT {', '.join(columns)} {where} ORDER BY week_ending_day", params)
+        batch_size = WeeklyExportConfig.READ_BATCH_SIZE
+        filled = 0
+        while filled < n_rows:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            # NULLs become NaN in the float64 array
+            values[filled:filled + len(rows)] = rows
+            filled += len(rows)
+        values = values[:filled]
+
+        data = {}
+        for i, (column, kind) in enumerate(schema.items()):
+            col_values = values[:, i]
+            if kind == 'key':
+                col_values = col_values.astype(np.int64)
+            elif not np.isnan(col_values).any() and (kind == 'int' or (np.mod(col_values, 1) == 0).all()):
+                col_values = col_values.astype(np.int64)
+            data[column] = col_values
+
+        countries, units = self._get_dimensions(conn)
+        country_rows = countries.index.get_indexer(data['countryCode'])
+        data['commodityName'] = np.full(filled, unit_info['commodity_name'], dtype=object)
+        for column in ['countryName', 'countryDescription', 'regionId']:
+            data[column] = countries[column].to_numpy()[country_rows]
+        data['unit'] = units.to_numpy()[units.index.get_indexer(data['unitId'])]
+
+        return pd.DataFrame(data, copy=False)
+
+    def _get_dimensions(self, conn: sqlite3.Connection) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Country and unit lookups for _read_facts, indexed by code.
+
+        They are kept until the collector records a new metadata version;
+        databases without metadata_versions are read every time.
+        """
+        version = metadata_refresh.get_metadata_version(conn)
+        cached = self._dimensions
+        if version and cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+        countries = pd.read_sql("""
+            SELECT countryCode, countryName, countryDescription, regionId FROM metadata_countries
+        """, conn).drop_duplicates('countryCode').set_index('countryCode')
+        units = pd.read_sql("SELECT unitId, unitNames FROM metadata_units", conn)
+        units = units.drop_duplicates('unitId').set_index('unitId')['unitNames']
+        if version:
+            self._dimensions = (version, countries, units)
+        return countries, units
+
+    def _has_export_facts(self, conn: sqlite3.Connection) -> bool:
+        """Whether the database stores exports in the collector's export_facts table."""
+        if not self._export_facts_seen:
+            self._export_facts_seen = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'export_facts'").fetchone() is not None
+        return self._export_facts_seen
+
+    @timed_stage('weeks_into_my')
+    def _add_week_columns(self, exports_df: pd.DataFrame, my_dates: pd.DataFrame) -> pd.DataFrame:
+        """
+        Parse weekEndingDate and compute weeks_into_my and next_my_weeks_into_my in pandas.
+
+        Only used for databases that predate the collector's export_facts table.
+        """
+        starts = my_dates.set_index('marketYear')['marketYearStart']
+        exports_df = exports_df.drop(columns=['commodity_code', 'updated_at', 'week_ending'], errors='ignore')
+        exports_df['weekEndingDate'] = pd.to_datetime(exports_df['weekEndingDate'])
 
-        # Calculate weeks into marketing year using our utility function
-        temp_df = calculate_weeks_into_my_for_df(temp_df)
+        weeks = pd.DataFrame({'date': exports_df['weekEndingDate'],
+                              'start': exports_df['market_year'].map(starts),
+                              'next_start': (exports_df['market_year'] + 1).map(starts)})
+        exports_df['weeks_into_my'] = calculate_weeks_into_my_for_df(
+            weeks, 'date', 'start', 'weeks')['weeks']
+        exports_df['next_my_weeks_into_my'] = calculate_weeks_into_my_for_df(
+            weeks, 'date', 'next_start', 'weeks')['weeks']
+        return exports_df
+
+    @timed_stage('my_reshape')
+    def _reshape_marketing_years(self, exports_df: pd.DataFrame, plan: LoadPlan = None) -> pd.DataFrame:
+        """
+        Split each row into current and next marketing year records.
+
+        Next MY columns are moved onto a copy of the row with market_year + 1 so
+        that every metric is reported against the marketing year it belongs to.
+        Each record takes its weeks_into_my from the stored column for its own
+        marketing year. Only the plan's metrics are carried into the result.
+        """
+        plan = plan or LoadPlan()
+        column_mappings = {
+            'current': plan.current_columns,
+            'next': plan.next_columns
+        }
+        next_source_columns = list(WeeklyExportConfig.NEXT_MY_METRIC_COLUMNS.values())
 
         # Process current marketing year data
-        current_my_data = exports_df.drop(columns=list(column_mappings['next'].values()), errors='ignore')
+        current_my_data = exports_df.drop(columns=next_source_columns + ['next_my_weeks_into_my'], errors='ignore')
         for std_col, source_col in column_mappings['current'].items():
             if source_col in current_my_data.columns and std_col != source_col:
                 current_my_data[std_col] = current_my_data[source_col]
@@ -185,22 +528,16 @@ class ExportDataManager:
                                             errors='ignore')
 
         # Process next marketing year data
-        next_my_data = exports_df.copy()
-
-        # Join next_my_data with temp_df to get the weeks_into_my column
-        next_my_data = next_my_data.merge(
-            temp_df[['weekEndingDate', 'market_year', 'countryCode', 'weeks_into_my']],
-            on=['weekEndingDate', 'market_year', 'countryCode'],
-            how='left'
-        )
+        next_my_data = exports_df
 
         # For week 1 data, only keep rows that have meaningful next MY data
-        week_one_data = next_my_data[next_my_data['weeks_into_my'] == 1]
-        other_weeks_data = next_my_data[next_my_data['weeks_into_my'] != 1]
+        week_one = next_my_data['weeks_into_my'] == 1
+        week_one_data = next_my_data[week_one]
+        other_weeks_data = next_my_data[~week_one]
 
         # For week 1, we'll be selective about which data to keep
-        filtered_week_one = week_one_data.copy()
-        for _, source_col in column_mappings['next'].items():
+        filtered_week_one = week_one_data
+        for source_col in next_source_columns:
             if source_col in filtered_week_one.columns:
                 # Keep rows where next MY data is meaningful (not null and not zero)
                 mask = pd.notna(filtered_week_one[source_col]) & (filtered_week_one[source_col] != 0)
@@ -209,19 +546,19 @@ class ExportDataManager:
         # Recombine with other weeks data
         next_my_data = pd.concat([filtered_week_one, other_weeks_data], ignore_index=True)
 
-        # Drop the current marketing year columns and weeks_into_my
+        # Drop the current marketing year columns and use the next MY week numbers
         next_my_data = next_my_data.drop(columns=['weeks_into_my'] +
                                         [col for col in list(column_mappings['current'].values())
                                         if col in next_my_data.columns],
                                         errors='ignore')
+        next_my_data = next_my_data.rename(columns={'next_my_weeks_into_my': 'weeks_into_my'})
 
         # Continue with normal processing for next MY data
         for std_col, source_col in column_mappings['next'].items():
             if source_col in next_my_data.columns and std_col != source_col:
                 next_my_data[std_col] = next_my_data[source_col]
 
-        next_my_data = next_my_data.drop(columns=[col for std_col, col in column_mappings['next'].items()
-                                        if std_col != col and col in next_my_data.columns],
+        next_my_data = next_my_data.drop(columns=[col for col in next_source_columns if col in next_my_data.columns],
                                         errors='ignore')
 
         # Adjust the marketing year for next MY data
@@ -233,22 +570,129 @@ class ExportDataManager:
         # Ensure no duplicates in the final dataset
         processed_data = processed_data.drop_duplicates(['weekEndingDate', 'market_year', 'countryCode'], keep='first')
 
-        # Convert numeric columns
-        numeric_columns = list(self.metrics.keys())
-        for col in numeric_columns:
-            if col in processed_data.columns:
-                processed_data[col] = pd.to_numeric(processed_data[col], errors='coerce')
-
-        processed_data['display_units'] = unit_info['unit_name']
-        processed_data = processed_data.merge(my_dates, left_on='market_year', right_on='marketYear', how='left')
-
-        # Calculate weeks into marketing year for final dataset using our utility function
-        processed_data = calculate_weeks_into_my_for_df(processed_data)
-
-        processed_data = processed_data.sort_values('weekEndingDate').reset_index(drop=True)
-        logging.info(f"Loaded {len(processed_data)} records for commodity {commodity_code}")
         return processed_data
         
+    def load_multiple(self, commodity_codes: List[int], start_my: int, end_my: int,
+                      normalize_units: bool = True, plan: LoadPlan = None) -> Dict[int, pd.DataFrame]:
+        """
+        Load export data for several commodities concurrently.
+
+        Each commodity is loaded in its own worker thread with its own SQLite
+        connection, so the total time is close to that of the slowest commodity.
+        Commodities without data for the requested years are skipped.
+
+        Args:
+            commodity_codes: Commodities to load
+            start_my: First marketing year
+            end_my: Last marketing year
+            normalize_units: Convert metric columns to WeeklyExportConfig.COMPARISON_UNIT
+                where a conversion is known
+            plan: Countries and metrics to load (default all)
+
+        Returns:
+            dict: Processed data frames keyed by commodity code, in request order
+        """
+        commodity_codes = list(dict.fromkeys(commodity_codes))
+        conversions = self.get_unit_conversions() if normalize_units else {}
+
+        def load_one(commodity_code):
+            try:
+                data = self.load_data(commodity_code, start_my, end_my, plan)
+            except ValueError as e:
+                logging.warning(f"Skipping commodity {commodity_code} in comparison: {str(e)}")
+                return commodity_code, pd.DataFrame()
+            if normalize_units and not data.empty:
+                data = self._normalize_units(data, commodity_code, conversions)
+            return commodity_code, data
+
+        max_workers = min(WeeklyExportConfig.COMPARISON_MAX_WORKERS, len(commodity_codes)) or 1
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='esr-load') as executor:
+            results = dict(executor.map(propagate_context(load_one), commodity_codes))
+
+        return {code: data for code, data in results.items() if not data.empty}
+
+    def get_unit_conversions(self) -> Dict[int, float]:
+        """Get conversion factors to the comparison unit keyed by unitId."""
+        with self.get_connection() as conn:
+            units = pd.read_sql("SELECT unitId, unitNames FROM metadata_units", conn)
+
+        conversions = {}
+        for unit_id, unit_name in zip(units['unitId'], units['unitNames']):
+            factor = WeeklyExportConfig.UNIT_CONVERSIONS.get(str(unit_name).strip().lower())
+            if factor is not None:
+                conversions[int(unit_id)] = factor
+        return conversions
+
+    def _normalize_units(self, df: pd.DataFrame, commodity_code: int,
+                         conversions: Dict[int, float]) -> pd.DataFrame:
+        """Convert metric columns to the comparison unit if the commodity's unit is convertible."""
+        unit_id = self.get_unit_info(commodity_code)['unit_id']
+        factor = conversions.get(unit_id)
+        if factor is None:
+            logging.info(f"No unit conversion for commodity {commodity_code}, keeping reported units")
+            return df
+
+        df = df.copy()
+        for col in self.metrics:
+            if col in df.columns:
+                df[col] = df[col] * factor
+        df['display_units'] = WeeklyExportConfig.COMPARISON_UNIT
+        return df
+
+    def iter_export_rows(self, commodity_code: int, start_my: int = None, end_my: int = None,
+                         countries: List[str] = None, metrics: List[str] = None,
+                         chunk_size: int = None) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        Stream raw export rows for a selection straight from the database cursor.
+
+        Yields (columns, rows) chunks of at most chunk_size rows so callers can
+        write large selections without holding the full result in memory.
+        """
+        metrics = [m for m in (metrics or self.metrics.keys()) if m in WeeklyExportConfig.METRIC_COLUMNS]
+        chunk_size = chunk_size or WeeklyExportConfig.EXPORT_CHUNK_SIZE
+
+        metric_sql = ', '.join(f"CAST(e.{WeeklyExportConfig.METRIC_COLUMNS[m]} AS REAL) AS {m}" for m in metrics)
+        where = ["e.commodityCode = ?"]
+        params = [commodity_code]
+        if start_my is not None:
+            where.append("e.market_year >= ?")
+            params.append(start_my)
+        if end_my is not None:
+            where.append("e.market_year <= ?")
+            params.append(end_my)
+        if countries and "All Countries" not in countries:
+            where.append(f"mc.countryName IN ({', '.join('?' for _ in countries)})")
+            params.extend(countries)
+
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(f"""
+                SELECT
+                    e.market_year AS marketYear,
+                    e.weekEndingDate,
+                    c.commodityName,
+                    e.countryCode,
+                    mc.countryName,
+                    u.unitNames AS unit{', ' + metric_sql if metric_sql else ''}
+                FROM commodity_exports e
+                JOIN metadata_commodities c ON e.commodityCode = c.commodityCode
+                JOIN metadata_countries mc ON e.countryCode = mc.countryCode
+                JOIN metadata_units u ON e.unitId = u.unitId
+                WHERE {' AND '.join(where)}
+                ORDER BY e.market_year, e.weekEndingDate, mc.countryName
+            """, params)
+            columns = [col[0] for col in cursor.description]
+
+            # Always yield at least one (possibly empty) chunk so callers get the columns
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                yield columns, rows
+                if len(rows) < chunk_size:
+                    break
+        finally:
+            conn.close()
+
+    @timed_stage('summary')
     def get_summary_data(self, df: pd.DataFrame, metric: str, countries: List[str] = None) -> Dict:
         """Get summary statistics for the specified metric and countries."""
         if df.empty:
@@ -282,6 +726,7 @@ class ExportDataManager:
             'latest_date': latest_date.strftime('%Y-%m-%d') if not pd.isna(latest_date) else 'N/A'
         }
         
+    @timed_stage('groupby')
     def get_weekly_data(self, df: pd.DataFrame, metric: str, countries: List[str] = None) -> pd.DataFrame:
         """Get weekly aggregated data for plotting."""
         if df.empty:
@@ -298,6 +743,7 @@ class ExportDataManager:
         weekly_data = filtered_df.groupby(['market_year', 'weekEndingDate'])[metric].sum().reset_index()
         return weekly_data
         
+    @timed_stage('groupby')
     def get_weekly_data_by_country(self, df: pd.DataFrame, metric: str, countries: List[str] = None) -> pd.DataFrame:
         """Get weekly data by country for plotting."""
         if df.empty:
@@ -314,6 +760,7 @@ class ExportDataManager:
         weekly_data = filtered_df.groupby(['market_year', 'weekEndingDate', 'countryName'])[metric].sum().reset_index()
         return weekly_data
         
+    @timed_stage('groupby')
     def get_marketing_year_data(self, df: pd.DataFrame, metric: str, countries: List[str] = None, 
                                start_my: int = None, end_my: int = None) -> Dict[int, pd.DataFrame]:
         """Get data organized by weeks into marketing year for comparison."""
@@ -0,0 +1,337 @@
+"""
+Calendar period aggregates for the Weekly Export Sales module.
+
+Export data is reported by week and marketing year. The period_exports
+table holds the weekly flow metrics summed per calendar month and quarter,
+for every commodity, country and marketing year; a week counts towards the
+period its week ending date falls in. Reads add up the marketing years, so
+a month or quarter that spans a marketing year boundary is whole.
+
+The collector updates a commodity and marketing year's rows whenever it
+writes that pair's export facts, so a new week only recomputes its own
+marketing year, and reading a commodity's periods is an indexed range read
+of the aggregates rather than a pass over its weekly facts.
+"""
+
+import calendar
+import sqlite3
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from .reports import _pct_change, _to_sql_value
+
+PERIOD_TABLE = 'period_exports'
+
+# Calendar periods and their length in months
+PERIOD_MONTHS = {
+    'month': 1,
+    'quarter': 3
+}
+
+# Weekly flow metrics, which add up over a period. Positions such as
+# accumulatedExports and outstandingSales don't and are left out.
+PERIOD_METRICS = ['weeklyExports', 'grossNewSales', 'currentMYNetSales', 'nextMYNetSales']
+
+# Columns of get_period_exports, after the period start and country
+SUMMED_COLUMNS = ['weeks', 'last_week_ending'] + PERIOD_METRICS
+
+
+def _day_sql(expr: str, *modifiers: str) -> str:
+    """SQL for a day number since 1970-01-01 as a date, shifted by SQLite date modifiers."""
+    return f"CAST(strftime('%s', {expr} * 86400, 'unixepoch', {', '.join(modifiers)}) AS INTEGER) / 86400"
+
+
+def _period_start_sql(months: int) -> str:
+    """SQL for the first day of the calendar period a fact's week ending day falls in, as a day number."""
+    month = "CAST(strftime('%m', week_ending_day * 86400, 'unixepoch') AS INTEGER)"
+    return _day_sql('week_ending_day', "'start of month'", f"'-' || (({month} - 1) % {months}) || ' months'")
+
+
+def _check_period(period: str):
+    if period not in PERIOD_MONTHS:
+        raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIOD_MONTHS)}")
+
+
+def _to_day_number(date) -> int:
+    return (pd.Timestamp(date) - pd.Timestamp('1970-01-01')).days
+
+
+def period_end(period_start: pd.Timestamp, period: str) -> pd.Timestamp:
+    """The last day of a calendar period."""
+    return period_start + pd.DateOffset(months=PERIOD_MONTHS[period]) - pd.Timedelta(days=1)
+
+
+def period_label(period_start: pd.Timestamp, period: str) -> str:
+    """A period's name, e.g. "March 2024" or "Q1 2024"."""
+    if period == 'quarter':
+        return f"Q{(period_start.month - 1) // 3 + 1} {period_start.year}"
+    return f"{calendar.month_name[period_start.month]} {period_start.year}"
+
+
+def ensure_period_tables(conn: sqlite3.Connection) -> bool:
+    """Create the period table and its index if they don't exist; return whether it was created."""
+    created = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                           (PERIOD_TABLE,)).fetchone() is None
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {PERIOD_TABLE} (
+        commodityCode INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        period_start_day INTEGER NOT NULL,
+        countryCode INTEGER NOT NULL,
+        market_year INTEGER NOT NULL,
+        weeks INTEGER,
+        last_week_ending_day INTEGER,
+        {', '.join(f'{col} NUMERIC' for col in PERIOD_METRICS)},
+        PRIMARY KEY (commodityCode, period, period_start_day, countryCode, market_year)
+    ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+    CREATE INDEX IF NOT EXISTS idx_{PERIOD_TABLE}_market_year
+    ON {PERIOD_TABLE} (commodityCode, market_year)
+    """)
+    return created
+
+
+def update_period_exports(conn: sqlite3.Connection, commodity_code: int = None, market_year: int = None) -> int:
+    """
+    Recompute the calendar period aggregates from export_facts.
+
+    With a commodity and marketing year, replaces that marketing year's
+    rows, as the collector does after writing its facts. Without them,
+    rebuilds every row. Returns the number of rows written.
+    """
+    ensure_period_tables(conn)
+    where, params = '', ()
+    if commodity_code is not None:
+        where, params = "WHERE commodityCode = ? AND market_year = ?", (int(commodity_code), int(market_year))
+
+    conn.execute(f"DELETE FROM {PERIOD_TABLE} {where}", params)
+    rows_written = 0
+    for period, months in PERIOD_MONTHS.items():
+        cursor = conn.execute(f"""
+            INSERT INTO {PERIOD_TABLE} (
+                commodityCode, period, period_start_day, countryCode, market_year, weeks, last_week_ending_day,
+                {', '.join(PERIOD_METRICS)}
+            )
+            SELECT
+                commodityCode,
+                ?,
+                {_period_start_sql(months)} AS period_start_day,
+                countryCode,
+                market_year,
+                COUNT(*),
+                MAX(week_ending_day),
+                {', '.join(f'SUM({col})' for col in PERIOD_METRICS)}
+            FROM export_facts
+            {where}
+            GROUP BY commodityCode, market_year, period_start_day, countryCode
+        """, (period,) + params)
+        rows_written += cursor.rowcount
+    return rows_written
+
+
+def get_period_exports(conn: sqlite3.Connection, commodity_code: int, period: str, start: str = None,
+                       end: str = None, country_codes: List[int] = None) -> pd.DataFrame:
+    """
+    Read a commodity's period totals per country, summed over marketing years.
+
+    The rows are numeric only, so they are read straight into a NumPy
+    array like load_data's facts.
+
+    Args:
+        conn: Connection to the export sales database
+        commodity_code: Commodity to read
+        period: 'month' or 'quarter'
+        start, end: First and last period start dates to read, inclusive
+        country_codes: Countries to read, all if None
+
+    Returns:
+        DataFrame: One row per period and country, with the number of weeks,
+        the last week ending date and the summed metrics. Empty if the
+        period aggregates have not been built.
+    """
+    _check_period(period)
+    conditions, params = ["commodityCode = ?", "period = ?"], [int(commodity_code), period]
+    if start is not None:
+        conditions.append("period_start_day >= ?")
+        params.append(_to_day_number(start))
+    if end is not None:
+        conditions.append("period_start_day <= ?")
+        params.append(_to_day_number(end))
+    if country_codes is not None:
+        conditions.append(f"countryCode IN ({', '.join('?' for _ in country_codes)})")
+        params.extend(int(code) for code in country_codes)
+
+    columns = ['period_start', 'countryCode'] + SUMMED_COLUMNS
+    try:
+        rows = conn.execute(f"""
+            SELECT
+                period_start_day,
+                countryCode,
+                SUM(weeks),
+                MAX(last_week_ending_day),
+                {', '.join(f'SUM({col})' for col in PERIOD_METRICS)}
+            FROM {PERIOD_TABLE}
+            WHERE {' AND '.join(conditions)}
+            GROUP BY period_start_day, countryCode
+            ORDER BY period_start_day, countryCode
+        """, params).fetchall()
+    except sqlite3.OperationalError:
+        # The period table is created by the first collection run
+        rows = []
+
+    # NULL sums become NaN in the float64 array
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+    data = {}
+    for i, column in enumerate(columns):
+        col_values = values[:, i]
+        if column in ('period_start', 'last_week_ending'):
+            col_values = pd.to_datetime(col_values.astype(np.int64), unit='D')
+        elif not np.isnan(col_values).any() and (np.mod(col_values, 1) == 0).all():
+            col_values = col_values.astype(np.int64)
+        data[column] = col_values
+    return pd.DataFrame(data)
+
+
+def _total_change(current, previous) -> float:
+    """Percent change between two totals, NULL when either is missing or the base is zero."""
+    return _pct_change(pd.Series([current], dtype=float), pd.Series([previous], dtype=float)).iloc[0]
+
+
+def _period_totals(conn: sqlite3.Connection, commodity_code: int, period: str) -> pd.DataFrame:
+    """Every period of a commodity with its last week ending date, oldest first."""
+    rows = conn.execute(f"""
+        SELECT period_start_day, MAX(last_week_ending_day)
+        FROM {PERIOD_TABLE}
+        WHERE commodityCode = ? AND period = ?
+        GROUP BY period_start_day
+        ORDER BY period_start_day
+    """, (int(commodity_code), period)).fetchall()
+    days = np.array(rows, dtype=np.int64).reshape(len(rows), 2)
+    return pd.DataFrame({
+        'period_start': pd.to_datetime(days[:, 0], unit='D'),
+        'last_week_ending': pd.to_datetime(days[:, 1], unit='D')
+    })
+
+
+def get_period_report(conn: sqlite3.Connection, commodity_code: int, period: str, top_n: int) -> Optional[Dict]:
+    """
+    Build the report of a commodity's latest complete calendar period.
+
+    A period is complete once the data reaches its last week, the week
+    ending in its last 7 days. The report compares the period with the one
+    before it and its calendar year to date with the same periods of the
+    year before; a later period with only some of its weeks reported is
+    summarized as period to date.
+
+    Args:
+        conn: Connection to the export sales database
+        commodity_code: Commodity to report
+        period: 'month' or 'quarter'
+        top_n: Number of top buyers to include
+
+    Returns:
+        dict: Report summary and top buyers, or None if there is no period data
+    """
+    _check_period(period)
+    try:
+        totals = _period_totals(conn, commodity_code, period)
+    except sqlite3.OperationalError:
+        return None
+    if totals.empty:
+        return None
+
+    starts = totals['period_start']
+    ends = starts.map(lambda start: period_end(start, period))
+    complete = totals['last_week_ending'] + pd.Timedelta(days=7) > ends
+    position = complete[complete].index[-1] if complete.any() else totals.index[-1]
+
+    months = PERIOD_MONTHS[period]
+    current = starts[position]
+    previous = current - pd.DateOffset(months=months)
+    year_start = current.replace(month=1)
+    prior_year_start = year_start - pd.DateOffset(years=1)
+    prior_year_current = current - pd.DateOffset(years=1)
+
+    rows = get_period_exports(conn, commodity_code, period, start=prior_year_start, end=starts.iloc[-1])
+    rows['netSales'] = rows['currentMYNetSales'].fillna(0) + rows['nextMYNetSales'].fillna(0)
+
+    def by_country(selected: pd.Series, column: str) -> pd.Series:
+        return rows[selected].groupby('countryCode')[column].sum(min_count=1)
+
+    in_current = rows['period_start'] == current
+    in_ytd = rows['period_start'].between(year_start, current)
+    in_prior_ytd = rows['period_start'].between(prior_year_start, prior_year_current)
+
+    countries = pd.DataFrame({
+        'weeklyExports': by_country(in_current, 'weeklyExports'),
+        'previousWeeklyExports': by_country(rows['period_start'] == previous, 'weeklyExports'),
+        'priorYearWeeklyExports': by_country(rows['period_start'] == prior_year_current, 'weeklyExports'),
+        'yearToDateExports': by_country(in_ytd, 'weeklyExports'),
+        'priorYearToDateExports': by_country(in_prior_ytd, 'weeklyExports'),
+        'grossNewSales': by_country(in_current, 'grossNewSales'),
+        'netSales': by_country(in_current, 'netSales'),
+    })
+    # Totals over every country; the buyers table leaves out those without exports this year
+    sums = countries.sum(min_count=1)
+    countries = countries[countries['weeklyExports'].notna() | countries['yearToDateExports'].notna()]
+
+    names = pd.read_sql("""
+        SELECT countryCode, MIN(countryName) AS countryName
+        FROM metadata_countries
+        GROUP BY countryCode
+    """, conn).set_index('countryCode')['countryName']
+    countries.insert(0, 'countryName', countries.index.map(names))
+    countries['weeklyExportsChangePct'] = _pct_change(countries['weeklyExports'], countries['previousWeeklyExports'])
+    countries['yearToDateChangePct'] = _pct_change(countries['yearToDateExports'],
+                                                   countries['priorYearToDateExports'])
+    countries = countries.sort_values(['weeklyExports', 'yearToDateExports'],
+                                      ascending=False, na_position='last').reset_index()
+    countries['rank'] = range(1, len(countries) + 1)
+
+    summary = {
+        'commodityCode': int(commodity_code),
+        'period': period,
+        'periodStart': current.strftime('%Y-%m-%d'),
+        'periodEnd': period_end(current, period).strftime('%Y-%m-%d'),
+        'periodLabel': period_label(current, period),
+        'complete': bool(complete[position]),
+        'lastWeekEndingDate': totals['last_week_ending'][position].strftime('%Y-%m-%d'),
+        'weeks': rows.loc[in_current, 'weeks'].max(),
+        'previousPeriodLabel': period_label(previous, period),
+        'priorYearPeriodLabel': period_label(prior_year_current, period),
+        'weeklyExports': sums['weeklyExports'],
+        'previousWeeklyExports': sums['previousWeeklyExports'],
+        'weeklyExportsChangePct': _total_change(sums['weeklyExports'], sums['previousWeeklyExports']),
+        'priorYearWeeklyExports': sums['priorYearWeeklyExports'],
+        'priorYearChangePct': _total_change(sums['weeklyExports'], sums['priorYearWeeklyExports']),
+        'yearToDateExports': sums['yearToDateExports'],
+        'priorYearToDateExports': sums['priorYearToDateExports'],
+        'yearToDateChangePct': _total_change(sums['yearToDateExports'], sums['priorYearToDateExports']),
+        'grossNewSales': sums['grossNewSales'],
+        'netSales': sums['netSales'],
+        'periodToDate': None,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    summary = {key: _to_sql_value(value) for key, value in summary.items()}
+
+    # The period after the report period, when only some of its weeks are in
+    if position != totals.index[-1]:
+        latest = starts.iloc[-1]
+        in_latest = rows['period_start'] == latest
+        period_to_date = {
+            'periodStart': latest.strftime('%Y-%m-%d'),
+            'periodLabel': period_label(latest, period),
+            'lastWeekEndingDate': totals['last_week_ending'].iloc[-1].strftime('%Y-%m-%d'),
+            'weeks': rows.loc[in_latest, 'weeks'].max(),
+            'weeklyExports': rows.loc[in_latest, 'weeklyExports'].sum(min_count=1),
+        }
+        summary['periodToDate'] = {key: _to_sql_value(value) for key, value in period_to_date.items()}
+
+    return {
+        'summary': summary,
+        'top_buyers': [{key: _to_sql_value(value) for key, value in row.items()}
+                       for row in countries.head(top_n).to_dict('records')]
+    }
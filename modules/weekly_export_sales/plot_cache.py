@@ -0,0 +1,223 @@
+"""
+Plot cache and warm-up for the Weekly Export Sales module.
+
+Built get_plot responses are stored on disk per data version (see the
+collector's publish_log), so every app worker shares them and a new release
+invalidates them all at once. A usage table records which plot requests
+are made most often, and warm_up() precomputes those for the current data
+version after each collection run and at app startup.
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .config import WeeklyExportConfig
+from .frame_cache import prune_versions
+from .plots import PlotRequest, build_plot
+
+
+class PlotCache:
+    """get_plot response bodies on disk, one directory per data version."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, version: int, key: str) -> str:
+        return os.path.join(self.root, f"v{version}", f"{key}.json")
+
+    def get(self, version: int, key: str) -> Optional[str]:
+        try:
+            with open(self._path(version, key)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def contains(self, version: int, key: str) -> bool:
+        return os.path.exists(self._path(version, key))
+
+    def put(self, version: int, key: str, body: str):
+        path = self._path(version, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def prune(self, version: int):
+        """Remove cached plots for other data versions (see prune_versions)."""
+        prune_versions(self.root, version)
+
+
+class UsageLog:
+    """
+    Counts plot requests in a small usage database.
+
+    Requests are counted in memory and flushed every flush_interval seconds,
+    so recording usage costs no database write on the request path.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 30.0):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._pending = Counter()
+        self._params = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS plot_usage (
+                request_key TEXT PRIMARY KEY,
+                params TEXT,
+                hits INTEGER,
+                last_requested TIMESTAMP
+            )
+        """)
+        return conn
+
+    def record(self, plot_request: PlotRequest):
+        with self._lock:
+            self._pending[plot_request.key] += 1
+            self._params[plot_request.key] = plot_request
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write pending request counts to the usage database."""
+        with self._lock:
+            pending, params = self._pending, self._params
+            self._pending, self._params = Counter(), {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany("""
+                    INSERT INTO plot_usage (request_key, params, hits, last_requested)
+                    VALUES (?, ?, ?, datetime('now'))
+                    ON CONFLICT(request_key) DO UPDATE SET
+                        hits = hits + excluded.hits,
+                        last_requested = excluded.last_requested
+                """, [(key, json.dumps(params[key].to_dict()), hits) for key, hits in pending.items()])
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not record plot usage: {str(e)}")
+
+    def most_requested(self, limit: int, days: int = None) -> List[PlotRequest]:
+        """The most often requested plots, optionally only those requested in the last `days` days."""
+        self.flush()
+        if not os.path.exists(self.db_path):
+            return []
+        conn = self._connect()
+        try:
+            if days:
+                rows = conn.execute("""
+                    SELECT params FROM plot_usage
+                    WHERE last_requested >= datetime('now', ?)
+                    ORDER BY hits DESC LIMIT ?
+                """, (f"-{int(days)} days", limit)).fetchall()
+            else:
+                rows = conn.execute("SELECT params FROM plot_usage ORDER BY hits DESC LIMIT ?",
+                                    (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [PlotRequest.from_dict(json.loads(params)) for (params,) in rows]
+
+    def commodity_views(self) -> Dict[int, int]:
+        """Total plot requests per commodity code."""
+        self.flush()
+        if not os.path.exists(self.db_path):
+            return {}
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT CAST(json_extract(params, '$.commodity_code') AS INTEGER), SUM(hits)
+                FROM plot_usage GROUP BY 1
+            """).fetchall()
+        finally:
+            conn.close()
+        return {code: hits for code, hits in rows if code is not None}
+
+
+def warm_up(data_manager, cache: PlotCache, usage: UsageLog, limit: int = None, workers: int = None,
+            admission=None) -> Dict:
+    """
+    Precompute the most requested plots for the current data version.
+    Nothing is cached for unpublished data (version 0).
+
+    With an AdmissionController, plots are sized and downgraded as the
+    get_plot route would and heavy builds take its slots. A downgraded plot
+    is cached under the request actually built, without the route's notice.
+
+    Returns counts of plots built, already cached and failed.
+    """
+    limit = limit or WeeklyExportConfig.PLOT_WARMUP_TOP_N
+    workers = workers or WeeklyExportConfig.PLOT_WARMUP_WORKERS
+    start = time.perf_counter()
+
+    candidates = usage.most_requested(limit, WeeklyExportConfig.PLOT_WARMUP_WINDOW_DAYS)
+    if not candidates:
+        return {}
+
+    version = data_manager.get_data_version()
+    if not version:
+        # Unpublished data can change without a new version; such plots are never cached
+        logging.info("Skipping plot cache warm-up: the data has no published version")
+        return {}
+    cache.prune(version)
+    todo = [plot_request for plot_request in candidates if not cache.contains(version, plot_request.key)]
+
+    def warm(plot_request):
+        try:
+            if admission is None:
+                payload = build_plot(data_manager, plot_request)
+            else:
+                sized = admission.plan(data_manager, plot_request)
+                plot_request = sized.plot_request
+                if sized.downgraded and cache.contains(version, plot_request.key):
+                    return 'cached'
+                with admission.admit(sized):
+                    payload = build_plot(data_manager, plot_request)
+            if payload['success']:
+                cache.put(version, plot_request.key, json.dumps(payload))
+                return 'built'
+        except Exception as e:
+            logging.warning(f"Plot warm-up failed for {plot_request}: {str(e)}")
+        return 'failed'
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='plot-warmup') as pool:
+        results = Counter(pool.map(warm, todo))
+
+    results['cached'] += len(candidates) - len(todo)
+    logging.info(f"Plot cache warm-up for data version {version}: {dict(results)} "
+                 f"in {time.perf_counter() - start:.2f}s")
+    return dict(results)
+
+
+def start_warm_up(data_manager, cache: PlotCache, usage: UsageLog, admission=None) -> threading.Thread:
+    """Run warm_up() on a background thread."""
+    def run():
+        try:
+            warm_up(data_manager, cache, usage, admission=admission)
+        except Exception as e:
+            logging.error(f"Plot cache warm-up failed: {str(e)}")
+
+    thread = threading.Thread(target=run, name='plot-warmup', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,131 @@
+"""
+Plot payload encodings for the Weekly Export Sales module.
+
+The default 'json' encoding is plotly's PlotlyJSONEncoder output: dates are
+ISO strings and numbers are float64. The opt-in 'binary' encoding writes
+every trace array as a base64 typed array in plotly's bdata layout,
+{"dtype": "f4", "bdata": "..."}, using the narrowest dtype that holds the
+values exactly:
+
+- whole numbers (e.g. export volumes) as the smallest of int8/16/32
+- other floats as float32 when that is lossless, float64 otherwise
+- dates as int32 days since 1970-01-01 ("epoch": "days"), or float64
+  milliseconds ("epoch": "ms") for timestamps that are not whole days
+
+Text arrays stay JSON lists. interactive_visual.js decodes both encodings.
+"""
+
+import base64
+import json
+from typing import Dict, Optional
+
+import numpy as np
+import plotly
+
+PLOT_ENCODINGS = ('json', 'binary')
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+INTEGER_DTYPES = ('<i1', '<i2', '<i4')
+DAY = np.timedelta64(1, 'D')
+
+
+def _typed_array(values: np.ndarray, **extra) -> Dict:
+    encoded = {'dtype': values.dtype.str.lstrip('<|'),
+               'bdata': base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii')}
+    encoded.update(extra)
+    return encoded
+
+
+def _smallest_integers(values: np.ndarray) -> Optional[np.ndarray]:
+    low, high = values.min(), values.max()
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if low >= info.min and high <= info.max:
+            return values.astype(dtype)
+    return None
+
+
+def _compact_numbers(values: np.ndarray) -> np.ndarray:
+    """
+    The narrowest little-endian array of values without loss of precision.
+
+    Browsers have no typed array that plotly.js decodes for 64-bit integers,
+    so integers outside the int32 range are sent as float64, exact up to 2**53.
+    """
+    if not len(values):
+        return values.astype('<f8' if values.dtype.kind in 'iu' and values.dtype.itemsize == 8
+                             else values.dtype.newbyteorder('<'))
+    if values.dtype.kind == 'f':
+        if np.isfinite(values).all() and (values == np.trunc(values)).all():
+            integers = _smallest_integers(values)
+            if integers is not None:
+                return integers
+        as_float32 = values.astype('<f4')
+        if np.array_equal(as_float32.astype(values.dtype), values, equal_nan=True):
+            return as_float32
+        return values.astype('<f8')
+    integers = _smallest_integers(values)
+    return integers if integers is not None else values.astype('<f8')
+
+
+def _encode_dates(values: np.ndarray) -> Optional[Dict]:
+    if np.isnat(values).any():
+        return None
+    days = values.astype('datetime64[D]')
+    if (days == values).all() and len(values) and days.min().astype(np.int64) >= INT32_MIN \
+            and days.max().astype(np.int64) <= INT32_MAX:
+        return _typed_array(days.astype(np.int64).astype('<i4'), epoch='days')
+    return _typed_array(values.astype('datetime64[ms]').astype(np.int64).astype('<f8'), epoch='ms')
+
+
+def trace_values(value) -> np.ndarray:
+    """The numbers of a trace attribute as a float array (empty if it is not numeric)."""
+    if isinstance(value, dict) and 'bdata' in value and 'dtype' in value:
+        value = np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype']).newbyteorder('<'))
+    try:
+        return np.asarray(value, dtype=float).ravel()
+    except (TypeError, ValueError):
+        return np.empty(0)
+
+
+def _encode_array(value):
+    """Encode a trace attribute that is a numeric or date array; return anything else unchanged."""
+    if isinstance(value, dict) and 'bdata' in value and 'dtype' in value:
+        # plotly already stores numeric arrays in bdata form, at their original width
+        if 'shape' in value:
+            return value
+        values = np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype']).newbyteorder('<'))
+        return _typed_array(_compact_numbers(values))
+    if isinstance(value, dict):
+        return {key: _encode_array(item) for key, item in value.items()}
+    if not isinstance(value, np.ndarray) or value.ndim != 1:
+        return value
+    if value.dtype.kind == 'M':
+        return _encode_dates(value) or value
+    if value.dtype.kind in 'iuf':
+        return _typed_array(_compact_numbers(value))
+    return value
+
+
+def dumps(obj) -> str:
+    """Serialize plotly objects, numpy arrays and dates as JSON."""
+    return json.dumps(obj, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def encode_trace(trace: Dict, encoding: str = 'json') -> Dict:
+    """A trace's plotly JSON (trace.to_plotly_json()) with its arrays in an encoding, ready for dumps."""
+    if encoding == 'json':
+        return trace
+    if encoding != 'binary':
+        raise ValueError(f"Unknown plot encoding '{encoding}'")
+    return {key: _encode_array(value) for key, value in trace.items()}
+
+
+def encode_figure(fig, encoding: str = 'json') -> str:
+    """Serialize a plotly figure as the plot JSON of a get_plot payload."""
+    if encoding == 'json':
+        return dumps(fig)
+
+    figure = fig.to_plotly_json()
+    figure['data'] = [encode_trace(trace, encoding) for trace in figure['data']]
+    return dumps(figure)
@@ -0,0 +1,138 @@
+"""
+Plot build offloading for the Weekly Export Sales module.
+
+Building a plot is CPU-bound pandas and plotly work that holds the GIL, so
+in a threaded server a few slow plots slow down every other request the
+worker is handling, including cheap metadata lookups. A PlotExecutor runs
+builds away from the request thread:
+
+    inline   build on the request thread (the development default)
+    thread   build on a bounded thread pool, capping concurrent builds
+    process  build in a pool of worker processes, each with its own GIL
+
+Pools are created on first use in each process, so an app preloaded in a
+gunicorn master gets fresh pools in every forked worker. Process pool
+workers start from a forkserver that has already imported the plot code.
+
+Streamed plots are generators that feed the response as they build, which
+cannot cross into another process. start() runs them on the thread pool in
+thread mode and on a separate thread pool of the same size otherwise.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+import instrumentation
+import metrics
+
+EXECUTOR_MODES = ('inline', 'thread', 'process')
+
+# Imported once by the forkserver so process pool workers start warm
+_PRELOAD_MODULES = ['pandas', 'plotly.graph_objects', 'modules.weekly_export_sales.plots']
+
+
+def _process_context():
+    """Multiprocessing context for process pools: forkserver where available."""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(_PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class PlotExecutor:
+    """Run plot builds inline, on a thread pool or in a process pool."""
+
+    def __init__(self, mode: str = 'inline', workers: int = 2):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown plot executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._pool: Optional[Executor] = None
+        self._pid = None
+        self._stream_pool: Optional[ThreadPoolExecutor] = None
+        self._stream_pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            # A pool inherited through fork has no live workers in this process
+            if self._pool is None or self._pid != os.getpid():
+                if self.mode == 'process':
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_context())
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='plot-build')
+                self._pid = os.getpid()
+                logging.info(f"Started {self.mode} plot executor with {self.workers} workers in process {self._pid}")
+            return self._pool
+
+    def _get_stream_pool(self) -> Executor:
+        if self.mode == 'thread':
+            return self._get_pool()
+        with self._lock:
+            if self._stream_pool is None or self._stream_pid != os.getpid():
+                self._stream_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='plot-stream')
+                self._stream_pid = os.getpid()
+            return self._stream_pool
+
+    def _reset_pool(self, pool: Executor):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, func: Callable, *args) -> Any:
+        """
+        Call func(*args) on the executor and wait for its result.
+
+        In process mode func and its arguments are pickled, so func must be a
+        module-level function; stages it times are not added to the request.
+        """
+        if self.mode == 'inline':
+            return func(*args)
+
+        if self.mode == 'thread':
+            func = instrumentation.propagate_context(func)
+
+        pool = self._get_pool()
+        metrics.OFFLOADED_TASKS.inc(executor=self.mode)
+        try:
+            with instrumentation.stage('offload'):
+                return pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a new pool next time
+            logging.error("Plot process pool broke, restarting it")
+            self._reset_pool(pool)
+            raise
+        finally:
+            metrics.OFFLOADED_TASKS.dec(executor=self.mode)
+
+    def start(self, func: Callable, *args) -> Future:
+        """
+        Start func(*args) on a thread pool without waiting for it.
+
+        Used for streamed builds, which must run in this process; the caller
+        collects what func produces, e.g. through a queue.
+        """
+        pool = self._get_stream_pool()
+        metrics.OFFLOADED_TASKS.inc(executor=self.mode)
+        future = pool.submit(instrumentation.propagate_context(func), *args)
+        future.add_done_callback(lambda _: metrics.OFFLOADED_TASKS.dec(executor=self.mode))
+        return future
+
+    def shutdown(self):
+        """Stop the pools, if they were started in this process."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            owned = self._pid == os.getpid()
+            stream_pool, self._stream_pool = self._stream_pool, None
+            stream_owned = self._stream_pid == os.getpid()
+        if pool is not None and owned:
+            pool.shutdown(wait=True)
+        if stream_pool is not None and stream_owned:
+            stream_pool.shutdown(wait=True)
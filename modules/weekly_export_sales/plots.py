@@ -0,0 +1,254 @@
+"""
+Plot building for the Weekly Export Sales module.
+Turns a plot request into the JSON payload returned by the get_plot route,
+so the same code serves live requests and precomputes the plot cache.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, asdict
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from .config import WeeklyExportConfig
+from .plot_encoding import PLOT_ENCODINGS, dumps, encode_figure, encode_trace, trace_values
+from .query_plan import LoadPlan
+from .utils import (create_weekly_plot, create_country_plot, create_my_comparison_plot,
+                    create_commodity_comparison_plot, country_plot_layout, country_plot_traces)
+from instrumentation import stage
+
+
+@dataclass(frozen=True)
+class PlotRequest:
+    """Normalized parameters of a get_plot request."""
+    commodity_code: int
+    start_year: int
+    end_year: int
+    metric: str
+    plot_type: str
+    countries: Tuple[str, ...] = ('All Countries',)
+    compare_commodities: Tuple[int, ...] = ()
+    encoding: str = 'json'
+
+    @classmethod
+    def from_form(cls, form) -> 'PlotRequest':
+        """Build a request from the get_plot form fields."""
+        return cls.create(
+            commodity_code=int(form.get('commodity_code')),
+            start_year=int(form.get('start_year')),
+            end_year=int(form.get('end_year')),
+            metric=form.get('metric'),
+            plot_type=form.get('plot_type'),
+            countries=form.getlist('countries[]'),
+            compare_commodities=[int(code) for code in form.getlist('compare_commodities[]')],
+            encoding=form.get('encoding') or 'json'
+        )
+
+    @classmethod
+    def create(cls, commodity_code, start_year, end_year, metric, plot_type, countries=(),
+               compare_commodities=(), encoding='json') -> 'PlotRequest':
+        if encoding not in PLOT_ENCODINGS:
+            raise ValueError(f"Unknown plot encoding '{encoding}'")
+        countries = tuple(countries)
+        if 'All Countries' in countries:
+            countries = ('All Countries',)
+
+        # Comparison commodities only matter for the comparison plot
+        if plot_type == 'commodity_comparison':
+            compare_commodities = tuple(code for code in compare_commodities if code != commodity_code)
+        else:
+            compare_commodities = ()
+
+        return cls(int(commodity_code), int(start_year), int(end_year), metric, plot_type,
+                   countries, tuple(int(code) for code in compare_commodities), encoding)
+
+    @classmethod
+    def from_dict(cls, params: Dict) -> 'PlotRequest':
+        return cls.create(**params)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @property
+    def key(self) -> str:
+        """Stable identifier of the request, used as the cache and usage key."""
+        encoded = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha1(encoded.encode()).hexdigest()[:20]
+
+
+NO_DATA_ERROR = 'No data available for the selected parameters'
+
+
+def _load_plot_data(data_manager, plot_request: PlotRequest) -> Tuple[pd.DataFrame, Dict[int, pd.DataFrame]]:
+    """Load the request's commodity data, plus every compared commodity's for the comparison plot."""
+    # Load only the requested countries and metric
+    plan = LoadPlan.create(list(plot_request.countries), [plot_request.metric])
+    start_year, end_year = plot_request.start_year, plot_request.end_year
+    if plot_request.plot_type == 'commodity_comparison':
+        commodity_codes = [plot_request.commodity_code] + list(plot_request.compare_commodities)
+        commodity_codes = commodity_codes[:WeeklyExportConfig.COMPARISON_MAX_COMMODITIES]
+        frames = data_manager.load_multiple(commodity_codes, start_year, end_year, plan=plan)
+        return frames.get(plot_request.commodity_code, pd.DataFrame()), frames
+    return data_manager.load_data(plot_request.commodity_code, start_year, end_year, plan=plan), {}
+
+
+def _create_figure(data_manager, plot_request: PlotRequest, data: pd.DataFrame, frames: Dict[int, pd.DataFrame],
+                   summary: Dict):
+    start_year, end_year = plot_request.start_year, plot_request.end_year
+    metric = plot_request.metric
+    plot_type = plot_request.plot_type
+    countries = list(plot_request.countries)
+
+    # Create plot based on type
+    if plot_type == 'weekly':
+        plot_data = data_manager.get_weekly_data(data, metric, countries)
+        return create_weekly_plot(plot_data, metric, data_manager.metrics[metric],
+                                  summary['units'], start_year, end_year, countries)
+    elif plot_type == 'country':
+        plot_data = data_manager.get_weekly_data_by_country(data, metric, countries)
+        return create_country_plot(plot_data, metric, data_manager.metrics[metric],
+                                   summary['units'], start_year, end_year, countries)
+    elif plot_type == 'commodity_comparison':
+        plot_data = {}
+        for frame in frames.values():
+            commodity_name = frame['commodityName'].iloc[0]
+            plot_data[commodity_name] = data_manager.get_marketing_year_data(
+                frame, metric, countries, start_year, end_year)
+        units = {frame['display_units'].iloc[0] for frame in frames.values()}
+        return create_commodity_comparison_plot(plot_data, metric, data_manager.metrics[metric],
+                                                units.pop() if len(units) == 1 else 'Mixed Units',
+                                                start_year, end_year, countries)
+    else:  # 'my_comparison'
+        plot_data = data_manager.get_marketing_year_data(data, metric, countries, start_year, end_year)
+        return create_my_comparison_plot(plot_data, metric, data_manager.metrics[metric],
+                                         summary['units'], start_year, end_year, countries)
+
+
+def _commodity_info(data_manager, commodity_code: int) -> Dict:
+    unit_info = data_manager.get_unit_info(commodity_code)
+    return {
+        'name': unit_info['commodity_name'],
+        'unit': unit_info['unit_name']
+    }
+
+
+def build_plot(data_manager, plot_request: PlotRequest) -> Dict:
+    """
+    Load the data for a plot request and build the get_plot response payload.
+
+    Returns a payload with success False if there is no data for the request.
+    """
+    data, frames = _load_plot_data(data_manager, plot_request)
+    if data.empty:
+        return {
+            'success': False,
+            'error': NO_DATA_ERROR
+        }
+
+    # Get summary data
+    summary = data_manager.get_summary_data(data, plot_request.metric, list(plot_request.countries))
+    fig = _create_figure(data_manager, plot_request, data, frames, summary)
+
+    # Convert plot to JSON
+    with stage('json_encode'):
+        plot_json = encode_figure(fig, plot_request.encoding)
+
+    return {
+        'success': True,
+        'plot': plot_json,
+        'summary': summary,
+        'commodity': _commodity_info(data_manager, plot_request.commodity_code)
+    }
+
+
+def trace_order(fig) -> List[int]:
+    """Trace positions by descending importance: the largest total of y values first."""
+    totals = [np.nansum(np.abs(trace_values(trace.to_plotly_json().get('y', ()))), dtype=float)
+              for trace in fig.data]
+    return sorted(range(len(totals)), key=lambda index: -totals[index])
+
+
+def stream_plot(data_manager, plot_request: PlotRequest, batch_size: int) -> Iterator[Dict]:
+    """
+    Build a plot as the messages of a streamed get_plot_stream response.
+
+    Messages come in this order: 'summary' (with the commodity) once the
+    data is loaded, 'layout' (with the number of traces), then 'traces'
+    with up to batch_size encoded traces each, most important first (see
+    trace_order), and 'done'. Country plot bars are built batch by batch;
+    the other plots are built whole before their layout is sent. Each traces message
+    carries the traces' positions in the figure, so the client can draw
+    them in figure order. A request without data gets a single 'error'.
+    """
+    data, frames = _load_plot_data(data_manager, plot_request)
+    if data.empty:
+        yield {'type': 'error', 'error': NO_DATA_ERROR}
+        return
+
+    metric = plot_request.metric
+    countries = list(plot_request.countries)
+    summary = data_manager.get_summary_data(data, metric, countries)
+    yield {'type': 'summary', 'summary': summary,
+           'commodity': _commodity_info(data_manager, plot_request.commodity_code)}
+
+    plot_data = (data_manager.get_weekly_data_by_country(data, metric, countries)
+                 if plot_request.plot_type == 'country' else pd.DataFrame())
+    if not plot_data.empty:
+        # One bar per country, built in order of importance while the
+        # earlier batches are already on their way
+        with stage('figure'):
+            layout = go.Layout(**country_plot_layout(data_manager.metrics[metric], summary['units'],
+                                                     plot_request.start_year, plot_request.end_year, countries))
+        totals = plot_data[metric].abs().groupby(plot_data['countryName'], sort=True).sum()
+        order = sorted(range(len(totals)), key=lambda index: -totals.iloc[index])
+        traces = country_plot_traces(plot_data, metric, [totals.index[index] for index in order])
+    else:
+        fig = _create_figure(data_manager, plot_request, data, frames, summary)
+        layout = fig.layout
+        order = trace_order(fig)
+        traces = (fig.data[index] for index in order)
+    yield {'type': 'layout', 'layout': layout.to_plotly_json(), 'traces': len(order)}
+
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        with stage('figure'):
+            batch = list(islice(traces, len(indices)))
+        with stage('json_encode'):
+            encoded = [encode_trace(trace.to_plotly_json(), plot_request.encoding) for trace in batch]
+        yield {'type': 'traces', 'indices': indices, 'traces': encoded}
+    yield {'type': 'done'}
+
+
+def stream_payload(messages: List[Dict]) -> Dict:
+    """
+    Assemble the get_plot response payload from the messages of stream_plot.
+
+    Lets a streamed build fill the plot cache and answer coalesced get_plot
+    requests; the traces are put back in figure order.
+    """
+    first = messages[0]
+    if first['type'] == 'error':
+        return {
+            'success': False,
+            'error': first['error']
+        }
+
+    layout = messages[1]
+    traces = [None] * layout['traces']
+    for message in messages[2:]:
+        if message['type'] == 'traces':
+            for index, trace in zip(message['indices'], message['traces']):
+                traces[index] = trace
+    with stage('json_encode'):
+        plot_json = dumps({'data': traces, 'layout': layout['layout']})
+
+    return {
+        'success': True,
+        'plot': plot_json,
+        'summary': first['summary'],
+        'commodity': first['commodity']
+    }
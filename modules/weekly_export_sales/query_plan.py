@@ -0,0 +1,70 @@
+"""
+Query planning for Weekly Export Sales data loads.
+
+A LoadPlan records which countries and metrics a caller will use, so
+load_data can filter countries in SQL and read and reshape only those
+metric columns instead of every country and metric of the commodity.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import WeeklyExportConfig
+
+
+@dataclass(frozen=True)
+class LoadPlan:
+    """Countries and metrics to load; None means all of them."""
+    countries: Optional[Tuple[str, ...]] = None
+    metrics: Optional[Tuple[str, ...]] = None
+
+    @classmethod
+    def create(cls, countries: Iterable[str] = None, metrics: Iterable[str] = None) -> 'LoadPlan':
+        """Build a plan from request parameters, ignoring unknown metrics."""
+        countries = tuple(dict.fromkeys(countries or ()))
+        if not countries or 'All Countries' in countries:
+            countries = None
+
+        if metrics:
+            metrics = tuple(m for m in dict.fromkeys(metrics) if m in WeeklyExportConfig.METRIC_COLUMNS)
+        else:
+            metrics = None
+
+        return cls(countries, metrics)
+
+    def _project(self, columns: Dict[str, str]) -> Dict[str, str]:
+        if self.metrics is None:
+            return dict(columns)
+        return {metric: source for metric, source in columns.items() if metric in self.metrics}
+
+    @property
+    def current_columns(self) -> Dict[str, str]:
+        """Source columns of the planned metrics for the row's own marketing year."""
+        return self._project(WeeklyExportConfig.METRIC_COLUMNS)
+
+    @property
+    def next_columns(self) -> Dict[str, str]:
+        """Source columns of the planned metrics for the next marketing year."""
+        return self._project(WeeklyExportConfig.NEXT_MY_METRIC_COLUMNS)
+
+    def source_columns(self) -> List[str]:
+        """
+        Metric source columns to read for the plan.
+
+        Every next MY column is read, whatever the metrics: together they
+        decide which week one rows carry next marketing year records.
+        """
+        columns = list(self.current_columns.values()) + list(WeeklyExportConfig.NEXT_MY_METRIC_COLUMNS.values())
+        return list(dict.fromkeys(columns))
+
+    def country_filter(self, column: str) -> Tuple[str, list]:
+        """
+        SQL condition limiting a countryCode column to the planned countries.
+
+        Returns ('', []) when the plan covers all countries.
+        """
+        if self.countries is None:
+            return '', []
+        placeholders = ', '.join('?' for _ in self.countries)
+        return (f"AND {column} IN (SELECT countryCode FROM metadata_countries WHERE countryName IN ({placeholders}))",
+                list(self.countries))
@@ -0,0 +1,315 @@
+"""
+Materialized report engine for the Weekly Export Sales module.
+Computes the weekly report figures for every commodity in a single batch pass
+(run by the collector after each collection) and stores them in report tables
+keyed by release, so serving a report is a small indexed lookup.
+"""
+
+import logging
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from typing import Dict, Optional
+
+SUMMARY_TABLE = 'report_weekly_summary'
+COUNTRY_TABLE = 'report_weekly_countries'
+
+# Source columns carried into the report tables
+REPORT_COLUMNS = {
+    'weeklyExports': 'weeklyExports',
+    'accumulatedExports': 'accumulatedExports',
+    'outstandingSales': 'outstandingSales',
+    'netSales': 'currentMYNetSales',
+    'totalCommitment': 'currentMYTotalCommitment',
+    'nextMYOutstandingSales': 'nextMYOutstandingSales'
+}
+
+# Target weeks compared by the report: the latest week, the week before it,
+# and the same week of the prior marketing year
+ROLE_CURRENT = 'current'
+ROLE_PREVIOUS = 'previous'
+ROLE_PRIOR_YEAR = 'prior_year'
+
+
+def ensure_report_tables(conn: sqlite3.Connection):
+    """Create the report tables and their lookup indexes if they don't exist."""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+        commodityCode INTEGER,
+        releaseTimeStamp TEXT,
+        marketYear INTEGER,
+        weekEndingDate TEXT,
+        previousWeekEndingDate TEXT,
+        priorYearWeekEndingDate TEXT,
+        weeklyExports REAL,
+        previousWeeklyExports REAL,
+        weeklyExportsChangePct REAL,
+        accumulatedExports REAL,
+        priorYearAccumulatedExports REAL,
+        accumulatedExportsChangePct REAL,
+        outstandingSales REAL,
+        priorYearOutstandingSales REAL,
+        netSales REAL,
+        totalCommitment REAL,
+        nextMYOutstandingSales REAL,
+        generated_at TIMESTAMP,
+        PRIMARY KEY (commodityCode, releaseTimeStamp)
+    )
+    """)
+    cursor.execute(f"""
+    CREATE INDEX IF NOT EXISTS idx_{SUMMARY_TABLE}_week
+    ON {SUMMARY_TABLE} (commodityCode, weekEndingDate)
+    """)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {COUNTRY_TABLE} (
+        commodityCode INTEGER,
+        releaseTimeStamp TEXT,
+        rank INTEGER,
+        countryCode INTEGER,
+        countryName TEXT,
+        weeklyExports REAL,
+        previousWeeklyExports REAL,
+        weeklyExportsChangePct REAL,
+        accumulatedExports REAL,
+        priorYearAccumulatedExports REAL,
+        accumulatedExportsChangePct REAL,
+        outstandingSales REAL,
+        netSales REAL,
+        PRIMARY KEY (commodityCode, releaseTimeStamp, rank)
+    )
+    """)
+
+
+def _pct_change(current: pd.Series, previous: pd.Series) -> pd.Series:
+    """Percent change that is NULL rather than infinite when the base is zero."""
+    base = previous.where(previous != 0)
+    return (current - previous) / base.abs() * 100
+
+
+def _to_sql_value(value):
+    """Convert pandas/NumPy scalars to values sqlite3 can bind."""
+    if value is None or pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _report_targets(weeks: pd.DataFrame) -> pd.DataFrame:
+    """Pick the current, previous and prior-year weeks for every commodity."""
+    weeks = weeks.copy()
+    weeks['weekEndingDate_dt'] = pd.to_datetime(weeks['weekEndingDate'])
+    weeks = weeks.sort_values(['commodityCode', 'market_year', 'weekEndingDate_dt'])
+
+    targets = []
+    for commodity_code, commodity_weeks in weeks.groupby('commodityCode'):
+        latest_my = commodity_weeks['market_year'].max()
+        current_weeks = commodity_weeks[commodity_weeks['market_year'] == latest_my]
+        latest = current_weeks.iloc[-1]
+        targets.append((commodity_code, latest_my, latest['weekEndingDate'], ROLE_CURRENT))
+
+        if len(current_weeks) > 1:
+            previous = current_weeks.iloc[-2]
+            targets.append((commodity_code, latest_my, previous['weekEndingDate'], ROLE_PREVIOUS))
+
+        # Same point of the prior marketing year: the last week on or before
+        # 52 weeks ago, so MY-to-date pace compares like with like
+        prior_year_weeks = commodity_weeks[
+            (commodity_weeks['market_year'] == latest_my - 1) &
+            (commodity_weeks['weekEndingDate_dt'] <= latest['weekEndingDate_dt'] - pd.Timedelta(weeks=52))
+        ]
+        if not prior_year_weeks.empty:
+            prior = prior_year_weeks.iloc[-1]
+            targets.append((commodity_code, latest_my - 1, prior['weekEndingDate'], ROLE_PRIOR_YEAR))
+
+    return pd.DataFrame(targets, columns=['commodityCode', 'market_year', 'weekEndingDate', 'role'])
+
+
+def build_weekly_reports(conn: sqlite3.Connection) -> int:
+    """
+    Compute the weekly report for every commodity and store it by release.
+
+    Args:
+        conn: Connection to the export sales database
+
+    Returns:
+        int: Number of commodity reports written
+    """
+    ensure_report_tables(conn)
+    cursor = conn.cursor()
+
+    weeks = pd.read_sql("""
+        SELECT DISTINCT commodityCode, market_year, weekEndingDate
+        FROM commodity_exports
+    """, conn)
+    if weeks.empty:
+        logging.info("No export data available, skipping weekly reports")
+        return 0
+
+    targets = _report_targets(weeks)
+
+    cursor.execute("DROP TABLE IF EXISTS temp.report_targets")
+    cursor.execute("""
+        CREATE TEMP TABLE report_targets (
+            commodityCode INTEGER, market_year INTEGER, weekEndingDate TEXT, role TEXT
+        )
+    """)
+    cursor.executemany("INSERT INTO report_targets VALUES (?, ?, ?, ?)",
+                       targets.itertuples(index=False, name=None))
+
+    source_columns = ', '.join(f"e.{source} AS {name}" for name, source in REPORT_COLUMNS.items())
+    rows = pd.read_sql(f"""
+        SELECT
+            t.commodityCode,
+            t.role,
+            t.market_year,
+            t.weekEndingDate,
+            e.countryCode,
+            mc.countryName,
+            {source_columns}
+        FROM report_targets t
+        JOIN commodity_exports e
+            ON e.commodityCode = t.commodityCode
+            AND e.market_year = t.market_year
+            AND e.weekEndingDate = t.weekEndingDate
+        LEFT JOIN (
+            SELECT countryCode, MIN(countryName) AS countryName
+            FROM metadata_countries
+            GROUP BY countryCode
+        ) mc ON e.countryCode = mc.countryCode
+    """, conn)
+    cursor.execute("DROP TABLE temp.report_targets")
+
+    releases = pd.read_sql("""
+        SELECT commodityCode, marketYear, releaseTimeStamp
+        FROM data_releases
+    """, conn)
+    release_lookup = {(row.commodityCode, row.marketYear): row.releaseTimeStamp
+                      for row in releases.itertuples(index=False)}
+
+    for col in REPORT_COLUMNS:
+        rows[col] = pd.to_numeric(rows[col], errors='coerce')
+
+    generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    reports_written = 0
+
+    for commodity_code, commodity_rows in rows.groupby('commodityCode'):
+        by_role = {role: role_rows for role, role_rows in commodity_rows.groupby('role')}
+        current = by_role.get(ROLE_CURRENT)
+        if current is None:
+            continue
+        previous = by_role.get(ROLE_PREVIOUS, commodity_rows.iloc[0:0])
+        prior_year = by_role.get(ROLE_PRIOR_YEAR, commodity_rows.iloc[0:0])
+
+        market_year = int(current['market_year'].iloc[0])
+        week_ending = current['weekEndingDate'].iloc[0]
+        release = release_lookup.get((commodity_code, market_year)) or week_ending
+
+        # Per-country comparison table
+        countries = current.set_index('countryCode')[
+            ['countryName', 'weeklyExports', 'accumulatedExports', 'outstandingSales', 'netSales']
+        ]
+        countries = countries.join(
+            previous.set_index('countryCode')['weeklyExports'].rename('previousWeeklyExports'))
+        countries = countries.join(
+            prior_year.set_index('countryCode')['accumulatedExports'].rename('priorYearAccumulatedExports'))
+        countries['weeklyExportsChangePct'] = _pct_change(
+            countries['weeklyExports'], countries['previousWeeklyExports'])
+        countries['accumulatedExportsChangePct'] = _pct_change(
+            countries['accumulatedExports'], countries['priorYearAccumulatedExports'])
+        countries = countries.sort_values(['accumulatedExports', 'weeklyExports'],
+                                          ascending=False, na_position='last').reset_index()
+        countries['rank'] = range(1, len(countries) + 1)
+
+        # Commodity totals
+        totals = current[list(REPORT_COLUMNS)].sum()
+        previous_exports = previous['weeklyExports'].sum() if not previous.empty else None
+        prior_accumulated = prior_year['accumulatedExports'].sum() if not prior_year.empty else None
+        prior_outstanding = prior_year['outstandingSales'].sum() if not prior_year.empty else None
+
+        summary = {
+            'commodityCode': int(commodity_code),
+            'releaseTimeStamp': release,
+            'marketYear': market_year,
+            'weekEndingDate': week_ending,
+            'previousWeekEndingDate': previous['weekEndingDate'].iloc[0] if not previous.empty else None,
+            'priorYearWeekEndingDate': prior_year['weekEndingDate'].iloc[0] if not prior_year.empty else None,
+            'weeklyExports': totals['weeklyExports'],
+            'previousWeeklyExports': previous_exports,
+            'weeklyExportsChangePct': _pct_change(
+                pd.Series([totals['weeklyExports']]), pd.Series([previous_exports], dtype=float)).iloc[0],
+            'accumulatedExports': totals['accumulatedExports'],
+            'priorYearAccumulatedExports': prior_accumulated,
+            'accumulatedExportsChangePct': _pct_change(
+                pd.Series([totals['accumulatedExports']]), pd.Series([prior_accumulated], dtype=float)).iloc[0],
+            'outstandingSales': totals['outstandingSales'],
+            'priorYearOutstandingSales': prior_outstanding,
+            'netSales': totals['netSales'],
+            'totalCommitment': totals['totalCommitment'],
+            'nextMYOutstandingSales': totals['nextMYOutstandingSales'],
+            'generated_at': generated_at
+        }
+        summary = {key: _to_sql_value(value) for key, value in summary.items()}
+
+        columns = ', '.join(summary)
+        placeholders = ', '.join('?' for _ in summary)
+        cursor.execute(f"INSERT OR REPLACE INTO {SUMMARY_TABLE} ({columns}) VALUES ({placeholders})",
+                       tuple(summary.values()))
+
+        country_columns = ['rank', 'countryCode', 'countryName', 'weeklyExports', 'previousWeeklyExports',
+                           'weeklyExportsChangePct', 'accumulatedExports', 'priorYearAccumulatedExports',
+                           'accumulatedExportsChangePct', 'outstandingSales', 'netSales']
+        cursor.execute(f"DELETE FROM {COUNTRY_TABLE} WHERE commodityCode = ? AND releaseTimeStamp = ?",
+                       (int(commodity_code), release))
+        cursor.executemany(f"""
+            INSERT INTO {COUNTRY_TABLE}
+            (commodityCode, releaseTimeStamp, {', '.join(country_columns)})
+            VALUES (?, ?, {', '.join('?' for _ in country_columns)})
+        """, [(int(commodity_code), release) + tuple(_to_sql_value(value) for value in row)
+              for row in countries[country_columns].itertuples(index=False, name=None)])
+        reports_written += 1
+
+    conn.commit()
+    logging.info(f"Built weekly reports for {reports_written} commodities")
+    return reports_written
+
+
+def get_weekly_report(conn: sqlite3.Connection, commodity_code: int, top_n: int) -> Optional[Dict]:
+    """
+    Look up the latest materialized weekly report for a commodity.
+
+    Args:
+        conn: Connection to the export sales database
+        commodity_code: Commodity to look up
+        top_n: Number of top buyers to include
+
+    Returns:
+        dict: Report summary and top buyers, or None if no report has been built
+    """
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT * FROM {SUMMARY_TABLE}
+            WHERE commodityCode = ?
+            ORDER BY weekEndingDate DESC, releaseTimeStamp DESC
+            LIMIT 1
+        """, (commodity_code,))
+    except sqlite3.OperationalError:
+        # Report tables are created by the first collection run
+        return None
+
+    summary = cursor.fetchone()
+    if summary is None:
+        return None
+
+    cursor.execute(f"""
+        SELECT * FROM {COUNTRY_TABLE}
+        WHERE commodityCode = ? AND releaseTimeStamp = ?
+        ORDER BY rank
+        LIMIT ?
+    """, (commodity_code, summary['releaseTimeStamp'], top_n))
+
+    return {
+        'summary': dict(summary),
+        'top_buyers': [dict(row) for row in cursor.fetchall()]
+    }
@@ -5,10 +5,9 @@ Handles both visualization and report endpoints.
 
 import logging
 import json
-import pandas as pd
-import plotly
-import plotly.graph_objects as go
-from flask import render_template, request, jsonify, current_app, Blueprint
+import queue
+from contextlib import nullcontext
+from flask import render_template, request, jsonify, current_app, Blueprint, Response, stream_with_context
 
 # Access the blueprint through circular import workaround
 def get_blueprint():
@@ -19,8 +18,54 @@ def get_data_manager():
     bp = get_blueprint()
     return bp.export_manager
 
-from .utils import create_weekly_plot, create_country_plot, create_my_comparison_plot
+from .config import WeeklyExportConfig
+from .plots import PlotRequest, build_plot, stream_plot, stream_payload
+from .plot_encoding import dumps
+from .admission import Admission, AdmissionRejected
+from .single_flight import FlightTimeout
+import metrics
+from .export_stream import stream_csv, stream_parquet, parquet_available
 from . import weekly_exports_bp
+
+# Sent to requests that stop waiting on another request's build of the same plot
+PLOT_TIMEOUT_ERROR = 'The plot is taking too long to build, please try again shortly.'
+
+def plan_admission(data_manager, plot_request: PlotRequest) -> Admission:
+    """Size a plot request, downgrading or rejecting it if it is over the row budget."""
+    admission = get_blueprint().admission
+    if admission is None:
+        return Admission(plot_request, 0, False)
+    return admission.plan(data_manager, plot_request)
+
+def admission_slot(admission: Admission):
+    """Context holding a heavy request's build slot."""
+    controller = get_blueprint().admission
+    return controller.admit(admission) if controller is not None else nullcontext()
+
+def with_downgrade_notice(body: str, downgraded) -> str:
+    """
+    A successful plot payload body with the notice of a downgraded request added.
+
+    Cached and coalesced bodies are keyed by the request actually built and
+    never hold the notice, as an explicit request for the same reduced
+    selection shares them.
+    """
+    if not downgraded:
+        return body
+    return body[:body.rindex('}')] + ', "downgraded": ' + json.dumps(downgraded) + '}'
+
+def admission_error(e: AdmissionRejected):
+    """JSON error response for a request turned away by admission control."""
+    logging.warning(f"Plot request not admitted: {str(e)}")
+    response = jsonify({
+        'success': False,
+        'error': str(e)
+    })
+    response.status_code = e.status
+    if e.retry_after:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 # ===== Visualization Routes =====
 
 @weekly_exports_bp.route('/')
@@ -86,58 +131,60 @@ def esr_get_countries():
 def esr_get_plot():
     """Generate visualization based on user parameters."""
     data_manager = get_data_manager()
-    commodity_code = int(request.form.get('commodity_code'))
-    start_year = int(request.form.get('start_year'))
-    end_year = int(request.form.get('end_year'))
-    metric = request.form.get('metric')
-    plot_type = request.form.get('plot_type')
-    countries = request.form.getlist('countries[]')
-
-    if 'All Countries' in countries:
-        countries = ["All Countries"]
+    blueprint = get_blueprint()
+    plot_cache = blueprint.plot_cache
 
     try:
-        # Load data
-        data = data_manager.load_data(commodity_code, start_year, end_year)
-
-        if data.empty:
-            return jsonify({
-                'success': False,
-                'error': 'No data available for the selected parameters'
-            })
-
-        # Get summary data
-        summary = data_manager.get_summary_data(data, metric, countries)
-
-        # Create plot based on type
-        if plot_type == 'weekly':
-            plot_data = data_manager.get_weekly_data(data, metric, countries)
-            fig = create_weekly_plot(plot_data, metric, data_manager.metrics[metric],
-                                    summary['units'], start_year, end_year, countries)
-        elif plot_type == 'country':
-            plot_data = data_manager.get_weekly_data_by_country(data, metric, countries)
-            fig = create_country_plot(plot_data, metric, data_manager.metrics[metric],
-                                     summary['units'], start_year, end_year, countries)
-        else:  # 'my_comparison'
-            plot_data = data_manager.get_marketing_year_data(data, metric, countries, start_year, end_year)
-            fig = create_my_comparison_plot(plot_data, metric, data_manager.metrics[metric],
-                                          summary['units'], start_year, end_year, countries)
-
-        # Convert plot to JSON
-        plot_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        plot_request = PlotRequest.from_form(request.form)
+        # Usage (for warm-up) counts the request as asked, once it has been served
+        requested = plot_request
 
-        # Get commodity information
-        unit_info = data_manager.get_unit_info(commodity_code)
+        # Serve a plot built for the current data version if there is one;
+        # unpublished data (version 0) can change without a new version
+        version = data_manager.get_data_version()
+        if not version:
+            plot_cache = None
+        body = plot_cache.get(version, plot_request.key) if plot_cache else None
+        metrics.record_cache('plot', body is not None)
+        if body is not None:
+            blueprint.usage_log.record(requested)
+            return Response(body, mimetype='application/json')
 
+        # Size the request first: heavy builds wait for a slot, oversized ones are downgraded
+        admission = plan_admission(data_manager, plot_request)
+        success = True
+        if admission.downgraded:
+            plot_request = admission.plot_request
+            body = plot_cache.get(version, plot_request.key) if plot_cache else None
+            metrics.record_cache('plot', body is not None)
+
+        def build():
+            with admission_slot(admission):
+                payload = blueprint.plot_executor.run(build_plot, data_manager, plot_request)
+            body = json.dumps(payload)
+            if payload['success'] and plot_cache:
+                plot_cache.put(version, plot_request.key, body)
+            return body, payload['success']
+
+        if body is None:
+            # Identical requests arriving while this plot is being built share the build
+            plot_flights = blueprint.plot_flights
+            if plot_flights:
+                (body, success), _ = plot_flights.do((version, plot_request.key), build)
+            else:
+                body, success = build()
+        if success:
+            blueprint.usage_log.record(requested)
+            body = with_downgrade_notice(body, admission.downgraded)
+        return Response(body, mimetype='application/json')
+    except AdmissionRejected as e:
+        return admission_error(e)
+    except FlightTimeout as e:
+        logging.warning(f"Plot request timed out: {str(e)}")
         return jsonify({
-            'success': True,
-            'plot': plot_json,
-            'summary': summary,
-            'commodity': {
-                'name': unit_info['commodity_name'],
-                'unit': unit_info['unit_name']
-            }
-        })
+            'success': False,
+            'error': PLOT_TIMEOUT_ERROR
+        }), 503
     except Exception as e:
         logging.error(f"Error generating plot: {str(e)}")
         return jsonify({
@@ -145,6 +192,174 @@ def esr_get_plot():
             'error': str(e)
         })
 
+@weekly_exports_bp.route('/get_plot_stream', methods=['POST'])
+def esr_get_plot_stream():
+    """
+    Stream a plot as NDJSON, one message per line: the summary, the layout,
+    then the traces in batches, most important first (see stream_plot).
+
+    A plot already in the plot cache, or built by a concurrent request for
+    the same plot, is sent whole as a single 'plot' message holding the
+    get_plot payload. Otherwise the plot is built on the plot executor, which
+    feeds the lines to this response and caches the finished payload even if
+    the client goes away. Errors end the stream with an 'error' message;
+    requests over the row budget get get_plot's error response instead of a
+    stream.
+    """
+    data_manager = get_data_manager()
+    blueprint = get_blueprint()
+    plot_cache = blueprint.plot_cache
+    plot_flights = blueprint.plot_flights
+
+    try:
+        plot_request = PlotRequest.from_form(request.form)
+
+        # Unpublished data (version 0) can change without a new version, so it is not cached
+        version = data_manager.get_data_version()
+        if not version:
+            plot_cache = None
+        body = plot_cache.get(version, plot_request.key) if plot_cache else None
+        metrics.record_cache('plot', body is not None)
+        admission = None
+        if body is None:
+            admission = plan_admission(data_manager, plot_request)
+            if admission.downgraded and plot_cache:
+                body = plot_cache.get(version, admission.plot_request.key)
+                metrics.record_cache('plot', body is not None)
+                if body is not None:
+                    body = with_downgrade_notice(body, admission.downgraded)
+        if body is not None:
+            blueprint.usage_log.record(plot_request)
+    except AdmissionRejected as e:
+        return admission_error(e)
+    except Exception as e:
+        logging.error(f"Error streaming plot: {str(e)}")
+        return Response(json.dumps({'type': 'error', 'error': str(e)}) + '\n', mimetype='application/x-ndjson')
+
+    def send_plot(body):
+        yield '{"type": "plot", "payload": ' + body + '}\n'
+
+    if body is not None:
+        return Response(send_plot(body), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+    # Share the build with identical plot requests in flight, streamed or not
+    key = (version, admission.plot_request.key)
+    call, leader = plot_flights.join(key) if plot_flights else (None, True)
+
+    if not leader:
+        def follow():
+            try:
+                body, success = plot_flights.wait(call)
+            except FlightTimeout as e:
+                logging.warning(f"Plot request timed out: {str(e)}")
+                yield json.dumps({'type': 'error', 'error': PLOT_TIMEOUT_ERROR}) + '\n'
+                return
+            except Exception as e:
+                logging.error(f"Error streaming plot: {str(e)}")
+                yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+                return
+            if success:
+                blueprint.usage_log.record(plot_request)
+                yield from send_plot(with_downgrade_notice(body, admission.downgraded))
+            else:
+                yield json.dumps({'type': 'error', 'error': json.loads(body)['error']}) + '\n'
+
+        return Response(follow(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+    lines = queue.Queue()
+    slot = admission_slot(admission)
+
+    def produce():
+        messages = []
+        result = error = None
+        try:
+            # The slot is held until the last trace is built
+            with slot:
+                for message in stream_plot(data_manager, admission.plot_request,
+                                           WeeklyExportConfig.PLOT_STREAM_BATCH_TRACES):
+                    messages.append(message)
+                    if message['type'] == 'summary' and admission.downgraded:
+                        message = dict(message, downgraded=admission.downgraded)
+                    lines.put(dumps(message) + '\n')
+            payload = stream_payload(messages)
+            body = json.dumps(payload)
+            if payload['success']:
+                blueprint.usage_log.record(plot_request)
+                if plot_cache:
+                    plot_cache.put(version, admission.plot_request.key, body)
+            result = (body, payload['success'])
+        except Exception as e:
+            logging.error(f"Error streaming plot: {str(e)}")
+            lines.put(json.dumps({'type': 'error', 'error': str(e)}) + '\n')
+            error = e
+        finally:
+            if call is not None:
+                plot_flights.finish(key, call, result, error)
+            lines.put(None)
+
+    try:
+        blueprint.plot_executor.start(produce)
+    except Exception as e:
+        if call is not None:
+            plot_flights.finish(key, call, error=e)
+        logging.error(f"Error streaming plot: {str(e)}")
+        return Response(json.dumps({'type': 'error', 'error': str(e)}) + '\n', mimetype='application/x-ndjson')
+
+    # X-Accel-Buffering keeps a proxy (nginx) from holding back the lines
+    return Response(iter(lines.get, None), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+@weekly_exports_bp.route('/export_data', methods=['GET', 'POST'])
+def esr_export_data():
+    """Stream export rows for a selection as CSV or Parquet."""
+    data_manager = get_data_manager()
+    export_format = request.values.get('format', 'csv').lower()
+    countries = request.values.getlist('countries[]')
+    metric_columns = request.values.getlist('metrics[]') or None
+
+    try:
+        commodity_code = int(request.values.get('commodity_code'))
+        start_year = int(request.values['start_year']) if request.values.get('start_year') else None
+        end_year = int(request.values['end_year']) if request.values.get('end_year') else None
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'commodity_code, start_year and end_year must be integers'
+        }), 400
+
+    if export_format not in WeeklyExportConfig.EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown export format: {export_format}'
+        }), 400
+    if export_format == 'parquet' and not parquet_available():
+        return jsonify({
+            'success': False,
+            'error': 'Parquet export is not available on this server'
+        }), 501
+    unknown_metrics = [m for m in metric_columns or () if m not in WeeklyExportConfig.METRIC_COLUMNS]
+    if unknown_metrics:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown metrics: {', '.join(unknown_metrics)}"
+        }), 400
+
+    chunks = data_manager.iter_export_rows(commodity_code, start_year, end_year, countries, metric_columns)
+    years = f"_{start_year or 'first'}-{end_year or 'last'}" if start_year or end_year else ''
+    filename = f"weekly_export_sales_{commodity_code}{years}.{export_format}"
+
+    if export_format == 'csv':
+        body, mimetype = stream_csv(chunks), 'text/csv'
+    else:
+        body, mimetype = stream_parquet(chunks), 'application/vnd.apache.parquet'
+
+    logging.info(f"Streaming {export_format} export for commodity {commodity_code}")
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 # ===== Report Routes =====
 
 @weekly_exports_bp.route('/report')
@@ -170,19 +385,50 @@ def esr_generate_report():
         
         # Generate report based on type
         if report_type == 'weekly':
-            report_data = {
-                'commodity_info': commodity_info,
-                'report_date': None,
-                'report_type': 'weekly',
-                'data_available': False,
-                'message': 'This is a placeholder for the weekly report. Full implementation coming soon.'
-            }
-        elif report_type == 'monthly':
-            report_data = {
-                'report_type': 'monthly',
-                'data_available': False,
-                'message': 'Monthly report generation will be implemented in a future update.'
-            }
+            weekly_report = data_manager.get_weekly_report(commodity_code)
+            if weekly_report:
+                summary = weekly_report['summary']
+                report_data = {
+                    'commodity_info': commodity_info,
+                    'report_date': summary['weekEndingDate'],
+                    'release': summary['releaseTimeStamp'],
+                    'marketing_year': summary['marketYear'],
+                    'report_type': 'weekly',
+                    'data_available': True,
+                    'summary': summary,
+                    'top_buyers': weekly_report['top_buyers']
+                }
+            else:
+                report_data = {
+                    'commodity_info': commodity_info,
+                    'report_date': None,
+                    'report_type': 'weekly',
+                    'data_available': False,
+                    'message': 'No weekly report has been built for this commodity yet. Reports are generated after each data collection run.'
+                }
+        elif report_type in WeeklyExportConfig.PERIOD_REPORTS:
+            period = WeeklyExportConfig.PERIOD_REPORTS[report_type]
+            period_report = data_manager.get_period_report(commodity_code, period)
+            if period_report:
+                summary = period_report['summary']
+                report_data = {
+                    'commodity_info': commodity_info,
+                    'report_date': summary['periodEnd'],
+                    'period': period,
+                    'period_label': summary['periodLabel'],
+                    'report_type': report_type,
+                    'data_available': True,
+                    'summary': summary,
+                    'top_buyers': period_report['top_buyers']
+                }
+            else:
+                report_data = {
+                    'commodity_info': commodity_info,
+                    'report_date': None,
+                    'report_type': report_type,
+                    'data_available': False,
+                    'message': f'No {report_type} totals have been built for this commodity yet. They are updated after each data collection run.'
+                }
         elif report_type == 'yearly':
             report_data = {
                 'report_type': 'yearly',
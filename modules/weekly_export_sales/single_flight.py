@@ -0,0 +1,106 @@
+"""
+Request coalescing for the Weekly Export Sales module.
+
+When many users open the same plot at once, each worker thread would
+otherwise load the same data and build the same figure. A SingleFlight
+group runs one computation per key at a time: the first caller (the
+leader) computes, and callers that arrive while it is running (followers)
+wait for it and share its result or its exception.
+
+Coalescing only spans one process; the plot cache shares finished plots
+between workers. With a timeout, followers stop waiting on a leader that
+runs too long and get a FlightTimeout, so a hung build does not also hold
+every thread that asked for the same result.
+
+do() runs the computation on the calling thread. A leader that computes
+elsewhere, such as a streamed plot built on an executor while the request
+thread sends its lines, uses join(), wait() and finish() instead.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import metrics
+
+
+class FlightTimeout(TimeoutError):
+    """A follower waited longer than the group's timeout for the leader's result."""
+
+
+class _Call:
+    """One in-progress computation, shared with the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one computation."""
+
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run func for key, or wait for the run already in progress.
+
+        Returns:
+            tuple: (result, shared), where shared is True for followers
+        """
+        call, leader = self.join(key)
+        if not leader:
+            return self.wait(call), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result, False
+
+    def join(self, key: Hashable) -> Tuple[_Call, bool]:
+        """
+        Join the computation for key, starting one if none is in progress.
+
+        Returns:
+            tuple: (call, leader); the leader must finish() the call, followers wait() on it
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                metrics.SINGLE_FLIGHT_IN_FLIGHT.inc(group=self.name)
+
+        metrics.record_single_flight(self.name, shared=not leader)
+        return call, leader
+
+    def wait(self, call: _Call) -> Any:
+        """
+        Wait for a joined computation and return its result or raise its exception.
+
+        Raises:
+            FlightTimeout: if the computation is still running after the group's timeout
+        """
+        if not call.done.wait(self.timeout):
+            metrics.SINGLE_FLIGHT_TIMEOUTS.inc(group=self.name)
+            raise FlightTimeout(f"Gave up after {self.timeout:g}s waiting for the shared {self.name} computation")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def finish(self, key: Hashable, call: _Call, result: Any = None, error: BaseException = None):
+        """Complete the leader's computation for key, handing its result or exception to the followers."""
+        call.result = result
+        call.error = error
+        # Later callers start a new computation; waiting ones get this one
+        with self._lock:
+            del self._calls[key]
+        metrics.SINGLE_FLIGHT_IN_FLIGHT.dec(group=self.name)
+        call.done.set()
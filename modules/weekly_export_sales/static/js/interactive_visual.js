@@ -3,6 +3,18 @@
  * Handles the interactive visualization functionality for the Weekly Export Sales module.
  */
 
+// Plotly configuration shared by every plot
+const PLOT_CONFIG = {
+    responsive: true,
+    displayModeBar: true,
+    displaylogo: false,
+    modeBarButtonsToRemove: ['lasso2d', 'select2d']
+};
+
+// Plot types whose trace count grows with the selection; these are streamed
+// so that the first traces are drawn while the rest are still on the way
+const STREAMED_PLOT_TYPES = ['country'];
+
 // Wait for document to be ready
 document.addEventListener('DOMContentLoaded', function() {
     setupFormHandlers();
@@ -42,18 +54,55 @@ function setupFormHandlers() {
         generateVisualization();
     });
 
+    // Show the comparison commodities only for the commodity comparison plot
+    $('#plot-type').change(function() {
+        $('#compare-commodities-group').toggle($(this).val() === 'commodity_comparison');
+    });
+
+    // Download the current selection as CSV
+    $('#download-csv').click(function() {
+        downloadSelection('csv');
+    });
+
     // Enable Update Plot button when years are selected
     $('#start-year, #end-year').change(function() {
         if ($('#commodity').val() && $('#start-year').val() && $('#end-year').val()) {
             $('#update-plot').prop('disabled', false);
+            $('#download-csv').prop('disabled', false);
             $('#update-countries').prop('disabled', false);
             $('#countries').prop('disabled', false);
         } else {
             $('#update-plot').prop('disabled', true);
+            $('#download-csv').prop('disabled', true);
         }
     });
 }
 
+/**
+ * Download the raw data for the current selection
+ * @param {string} format - Export format ('csv' or 'parquet')
+ */
+function downloadSelection(format) {
+    const commodityCode = $('#commodity').val();
+    const startYear = $('#start-year').val();
+    const endYear = $('#end-year').val();
+    const countries = $('#countries').val() || ['All Countries'];
+
+    if (!(commodityCode && startYear && endYear)) {
+        alert('Please select a commodity and year range first');
+        return;
+    }
+
+    const params = $.param({
+        commodity_code: commodityCode,
+        start_year: startYear,
+        end_year: endYear,
+        'countries[]': countries,
+        format: format
+    });
+    window.location = '/weekly_export_sales/export_data?' + params;
+}
+
 /**
  * Fetch marketing years for the selected commodity
  * @param {string} commodityCode - Selected commodity code
@@ -96,6 +145,7 @@ function fetchMarketingYears(commodityCode) {
                     // Enable update countries button
                     $('#update-countries').prop('disabled', false);
                     $('#update-plot').prop('disabled', false);
+                    $('#download-csv').prop('disabled', false);
                 }
             } else {
                 alert('Error loading years: ' + response.error);
@@ -163,45 +213,46 @@ function generateVisualization() {
     const countries = $('#countries').val() || ['All Countries'];
     const metric = $('#metric').val();
     const plotType = $('#plot-type').val();
+    const compareCommodities = $('#compare-commodities').val() || [];
+
+    if (plotType === 'commodity_comparison' && compareCommodities.length === 0) {
+        alert('Please select at least one commodity to compare with');
+        return;
+    }
 
     if (commodityCode && startYear && endYear && metric && plotType) {
         showLoading('loading');
         $('#plot-container').empty();
         $('#summary-container').hide();
 
+        const params = {
+            commodity_code: commodityCode,
+            start_year: startYear,
+            end_year: endYear,
+            'countries[]': countries,
+            metric: metric,
+            plot_type: plotType,
+            'compare_commodities[]': compareCommodities,
+            encoding: 'binary'
+        };
+
+        if (STREAMED_PLOT_TYPES.includes(plotType) && window.fetch && window.ReadableStream) {
+            streamVisualization(params, countries);
+            return;
+        }
+
         $.ajax({
             url: '/weekly_export_sales/get_plot',
             type: 'POST',
-            data: {
-                commodity_code: commodityCode,
-                start_year: startYear,
-                end_year: endYear,
-                'countries[]': countries,
-                metric: metric,
-                plot_type: plotType
-            },
+            data: params,
             success: function(response) {
                 hideLoading('loading');
-
-                if (response.success) {
-                    // Display the plot
-                    const plotJson = JSON.parse(response.plot);
-                    Plotly.newPlot('plot-container', plotJson.data, plotJson.layout, {
-                        responsive: true,
-                        displayModeBar: true,
-                        displaylogo: false,
-                        modeBarButtonsToRemove: ['lasso2d', 'select2d']
-                    });
-
-                    // Update summary
-                    updateSummary(response.summary, response.commodity, countries);
-                } else {
-                    showNoDataMessage(response.error || 'No data available for the selected parameters');
-                }
+                renderPlot(response, countries);
             },
-            error: function() {
+            error: function(jqXHR) {
                 hideLoading('loading');
-                showError('plot-container', 'An error occurred while generating the plot. Please try again later.');
+                // Requests over the size limit or turned away while the server is busy carry a message
+                showPlotError(jqXHR.responseJSON && jqXHR.responseJSON.error);
             }
         });
     } else {
@@ -209,6 +260,195 @@ function generateVisualization() {
     }
 }
 
+/**
+ * Display a get_plot response payload
+ * @param {Object} response - Payload with the plot JSON, summary and commodity
+ * @param {Array} countries - Selected countries
+ */
+function renderPlot(response, countries) {
+    if (response.success) {
+        // Display the plot
+        const plotJson = JSON.parse(response.plot);
+        plotJson.data = decodePlotArrays(plotJson.data);
+        Plotly.newPlot('plot-container', plotJson.data, plotJson.layout, PLOT_CONFIG);
+
+        // Update summary
+        updateSummary(response.summary, response.commodity, countries);
+        showDowngradeNotice(response.downgraded);
+    } else {
+        showNoDataMessage(response.error || 'No data available for the selected parameters');
+    }
+}
+
+/**
+ * Show the plot request error message
+ * @param {string} [message] - Error message from the server, if it sent one
+ */
+function showPlotError(message) {
+    showError('plot-container', message || 'An error occurred while generating the plot. Please try again later.');
+}
+
+/**
+ * Note in the summary that a large selection was cut down to fit the server's limits
+ * @param {Object} [downgraded] - The downgrade the server applied, with its message
+ */
+function showDowngradeNotice(downgraded) {
+    if (downgraded) {
+        $('#summary-content').append(`<p class="text-muted"><em>${downgraded.message}</em></p>`);
+    }
+}
+
+/**
+ * Generate a visualization from the streamed plot endpoint, drawing traces as they arrive
+ * @param {Object} params - Plot request form fields
+ * @param {Array} countries - Selected countries
+ */
+function streamVisualization(params, countries) {
+    // Figure positions of the traces drawn so far, ascending
+    const drawn = [];
+    // Plotly calls are chained so each one starts after the previous has drawn
+    let drawing = Promise.resolve();
+
+    function handleMessage(message) {
+        switch (message.type) {
+            case 'plot':
+                hideLoading('loading');
+                renderPlot(message.payload, countries);
+                break;
+            case 'summary':
+                hideLoading('loading');
+                updateSummary(message.summary, message.commodity, countries);
+                showDowngradeNotice(message.downgraded);
+                break;
+            case 'layout':
+                drawing = drawing.then(() => Plotly.newPlot('plot-container', [], message.layout, PLOT_CONFIG));
+                break;
+            case 'traces': {
+                const traces = decodePlotArrays(message.traces);
+                drawing = drawing.then(() => {
+                    // Insert each trace at its position among the drawn ones, keeping figure order
+                    drawn.push(...message.indices);
+                    drawn.sort((a, b) => a - b);
+                    const positions = message.indices.map(index => drawn.indexOf(index));
+                    return Plotly.addTraces('plot-container', traces, positions);
+                });
+                break;
+            }
+            case 'error':
+                hideLoading('loading');
+                showNoDataMessage(message.error || 'No data available for the selected parameters');
+                break;
+        }
+    }
+
+    fetch('/weekly_export_sales/get_plot_stream', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+        body: $.param(params)
+    })
+        .then(response => {
+            if (!response.ok) {
+                // Admission control errors come back as get_plot style JSON
+                return response.json().then(body => {
+                    hideLoading('loading');
+                    showPlotError(body.error);
+                });
+            }
+            return readNdjson(response, handleMessage);
+        })
+        .catch(() => {
+            hideLoading('loading');
+            showPlotError();
+        });
+}
+
+/**
+ * Read a newline-delimited JSON response, handing each message over as soon as its line is complete
+ * @param {Response} response - fetch response
+ * @param {Function} onMessage - Called with each parsed message
+ * @returns {Promise} Resolves when the response has been read
+ */
+async function readNdjson(response, onMessage) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+
+    for (;;) {
+        const {value, done} = await reader.read();
+        if (done) {
+            break;
+        }
+        buffered += decoder.decode(value, {stream: true});
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+    }
+    buffered += decoder.decode();
+    if (buffered.trim()) {
+        onMessage(JSON.parse(buffered));
+    }
+}
+
+// Typed array constructors by plotly bdata dtype
+const TYPED_ARRAYS = {
+    i1: Int8Array,
+    u1: Uint8Array,
+    u1c: Uint8ClampedArray,
+    i2: Int16Array,
+    u2: Uint16Array,
+    i4: Int32Array,
+    u4: Uint32Array,
+    f4: Float32Array,
+    f8: Float64Array
+};
+
+/**
+ * Replace base64 typed arrays ({dtype, bdata}) in plot data with arrays plotly.js can draw
+ * @param {*} value - Plot data, a trace or a trace attribute
+ * @returns {*} The value with its typed arrays decoded
+ */
+function decodePlotArrays(value) {
+    if (Array.isArray(value)) {
+        return value.map(decodePlotArrays);
+    }
+    if (value !== null && typeof value === 'object') {
+        if (typeof value.bdata === 'string' && TYPED_ARRAYS[value.dtype]) {
+            return decodeTypedArray(value);
+        }
+        Object.keys(value).forEach(key => {
+            value[key] = decodePlotArrays(value[key]);
+        });
+    }
+    return value;
+}
+
+/**
+ * Decode one base64 typed array
+ * @param {Object} encoded - {dtype, bdata} plus an optional shape ("rows, columns")
+ *                           or epoch ('days' or 'ms' since 1970-01-01 for dates)
+ * @returns {TypedArray|Array} Numbers, rows of numbers, or ISO date strings
+ */
+function decodeTypedArray(encoded) {
+    const binary = atob(encoded.bdata);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    const values = new TYPED_ARRAYS[encoded.dtype](bytes.buffer);
+
+    if (encoded.epoch === 'days') {
+        return Array.from(values, day => new Date(day * 86400000).toISOString().slice(0, 10));
+    }
+    if (encoded.epoch === 'ms') {
+        return Array.from(values, ms => new Date(ms).toISOString().slice(0, 23));
+    }
+    if (encoded.shape) {
+        const [rows, columns] = String(encoded.shape).split(',').map(Number);
+        return Array.from({length: rows}, (_, row) => values.subarray(row * columns, (row + 1) * columns));
+    }
+    return values;
+}
+
 /**
  * Update the summary information display
  * @param {Object} summary - Summary data
@@ -268,6 +508,7 @@ function disableControls() {
     $('#update-countries').prop('disabled', true);
     $('#countries').html('<option value="All Countries" selected>All Countries</option>').prop('disabled', true);
     $('#update-plot').prop('disabled', true);
+    $('#download-csv').prop('disabled', true);
 }
 
 /**
@@ -3,6 +3,12 @@
  * Handles the report generation functionality for the Weekly Export Sales module.
  */
 
+// Report types built from calendar month and quarter totals
+const PERIOD_REPORT_TYPES = ['monthly', 'quarterly'];
+
+// Summary table columns of the weekly report
+const WEEKLY_REPORT_COLUMNS = ['Country', 'Current Week', 'Previous Week', '% Change', 'Year to Date', 'Last Year', '% Change'];
+
 // Wait for document to be ready
 document.addEventListener('DOMContentLoaded', function() {
     setupReportHandlers();
@@ -90,7 +96,11 @@ function displayReport(report) {
         $('#report-commodity-name').text(report.commodity_info.commodity_name);
     }
     
-    if (report.report_date) {
+    const periodReport = PERIOD_REPORT_TYPES.includes(report.report_type);
+    $('#report-date-label').text(periodReport ? 'Period' : 'Week Ending');
+    if (periodReport && report.period_label) {
+        $('#report-week').text(report.period_label);
+    } else if (report.report_date) {
         $('#report-week').text(formatDate(report.report_date));
     } else {
         // Use current date as fallback
@@ -106,16 +116,135 @@ function displayReport(report) {
         $('#report-placeholder .alert-secondary').html(`
             <p>${report.message || 'No data available for the selected report type.'}</p>
             <p>This section will provide structured, printer-friendly reports that follow the format of current PDF exports.</p>
-        `);
+        `).show();
     } else {
-        // In a future implementation, this would handle the actual report data
-        // For now, we're just showing the placeholder
+        $('#report-placeholder .alert-secondary').hide();
+        if (periodReport) {
+            displayPeriodReport(report);
+        } else {
+            displayWeeklyReport(report);
+        }
     }
     
     // Show the report container
     $('#report-placeholder').show();
 }
 
+/**
+ * Fill the highlights and summary table from a materialized weekly report
+ * @param {Object} report - Report data with summary and top buyers
+ */
+function displayWeeklyReport(report) {
+    const summary = report.summary;
+    const buyers = report.top_buyers || [];
+    const topBuyer = buyers.length > 0 ? buyers[0].countryName : 'N/A';
+
+    setReportTable('Weekly Highlights:', WEEKLY_REPORT_COLUMNS);
+    $('#report-highlights').html(`
+        <li>Top destination: ${topBuyer}</li>
+        <li>Week-over-week change: ${formatPercentChange(summary.weeklyExportsChangePct)}</li>
+        <li>Year-over-year comparison: ${formatPercentChange(summary.accumulatedExportsChangePct)} (MY to date vs. same week last year)</li>
+        <li>Outstanding sales: ${formatNumber(summary.outstandingSales)}</li>
+        <li>Net sales: ${formatNumber(summary.netSales)}</li>
+    `);
+
+    let rows = '';
+    buyers.forEach(buyer => {
+        rows += `
+            <tr>
+                <td>${buyer.countryName || buyer.countryCode}</td>
+                <td>${formatNumber(buyer.weeklyExports)}</td>
+                <td>${formatNumber(buyer.previousWeeklyExports)}</td>
+                <td>${formatPercentChange(buyer.weeklyExportsChangePct)}</td>
+                <td>${formatNumber(buyer.accumulatedExports)}</td>
+                <td>${formatNumber(buyer.priorYearAccumulatedExports)}</td>
+                <td>${formatPercentChange(buyer.accumulatedExportsChangePct)}</td>
+            </tr>
+        `;
+    });
+    rows += `
+        <tr class="highlight-row">
+            <td><strong>Total</strong></td>
+            <td><strong>${formatNumber(summary.weeklyExports)}</strong></td>
+            <td><strong>${formatNumber(summary.previousWeeklyExports)}</strong></td>
+            <td><strong>${formatPercentChange(summary.weeklyExportsChangePct)}</strong></td>
+            <td><strong>${formatNumber(summary.accumulatedExports)}</strong></td>
+            <td><strong>${formatNumber(summary.priorYearAccumulatedExports)}</strong></td>
+            <td><strong>${formatPercentChange(summary.accumulatedExportsChangePct)}</strong></td>
+        </tr>
+    `;
+    $('#report-table-body').html(rows);
+}
+
+/**
+ * Fill the highlights and summary table from a calendar month or quarter report
+ * @param {Object} report - Report data with the period summary and top buyers
+ */
+function displayPeriodReport(report) {
+    const summary = report.summary;
+    const buyers = report.top_buyers || [];
+    const topBuyer = buyers.length > 0 ? buyers[0].countryName : 'N/A';
+    const periodName = report.period === 'quarter' ? 'Quarter' : 'Month';
+
+    setReportTable(`${periodName}ly Highlights:`, [
+        'Country', summary.periodLabel, summary.previousPeriodLabel, '% Change',
+        'Year to Date', 'Last Year to Date', '% Change'
+    ]);
+
+    let highlights = `
+        <li>Top destination: ${topBuyer}</li>
+        <li>${periodName}-over-${periodName.toLowerCase()} change: ${formatPercentChange(summary.weeklyExportsChangePct)}</li>
+        <li>Year-over-year comparison: ${formatPercentChange(summary.priorYearChangePct)} (vs. ${summary.priorYearPeriodLabel})</li>
+        <li>Calendar year to date: ${formatPercentChange(summary.yearToDateChangePct)} (vs. the same ${periodName.toLowerCase()}s last year)</li>
+        <li>Net sales: ${formatNumber(summary.netSales)}</li>
+    `;
+    if (!summary.complete) {
+        highlights += `<li>${summary.periodLabel} is not complete: ${summary.weeks} weeks through ${formatDate(summary.lastWeekEndingDate + 'T00:00:00')}</li>`;
+    }
+    if (summary.periodToDate) {
+        const toDate = summary.periodToDate;
+        highlights += `<li>${toDate.periodLabel} to date: ${formatNumber(toDate.weeklyExports)} (${toDate.weeks} weeks through ${formatDate(toDate.lastWeekEndingDate + 'T00:00:00')})</li>`;
+    }
+    $('#report-highlights').html(highlights);
+
+    let rows = '';
+    buyers.forEach(buyer => {
+        rows += `
+            <tr>
+                <td>${buyer.countryName || buyer.countryCode}</td>
+                <td>${formatNumber(buyer.weeklyExports)}</td>
+                <td>${formatNumber(buyer.previousWeeklyExports)}</td>
+                <td>${formatPercentChange(buyer.weeklyExportsChangePct)}</td>
+                <td>${formatNumber(buyer.yearToDateExports)}</td>
+                <td>${formatNumber(buyer.priorYearToDateExports)}</td>
+                <td>${formatPercentChange(buyer.yearToDateChangePct)}</td>
+            </tr>
+        `;
+    });
+    rows += `
+        <tr class="highlight-row">
+            <td><strong>Total</strong></td>
+            <td><strong>${formatNumber(summary.weeklyExports)}</strong></td>
+            <td><strong>${formatNumber(summary.previousWeeklyExports)}</strong></td>
+            <td><strong>${formatPercentChange(summary.weeklyExportsChangePct)}</strong></td>
+            <td><strong>${formatNumber(summary.yearToDateExports)}</strong></td>
+            <td><strong>${formatNumber(summary.priorYearToDateExports)}</strong></td>
+            <td><strong>${formatPercentChange(summary.yearToDateChangePct)}</strong></td>
+        </tr>
+    `;
+    $('#report-table-body').html(rows);
+}
+
+/**
+ * Set the highlights title and summary table columns for a report type
+ * @param {string} title - Highlights section title
+ * @param {string[]} columns - Table column headings
+ */
+function setReportTable(title, columns) {
+    $('#report-highlights-title').text(title);
+    $('#report-table-head').html(columns.map(column => `<th>${column}</th>`).join(''));
+}
+
 /**
  * Export the current report as PDF
  * Note: This is a placeholder function that would be implemented with a PDF library
@@ -127,13 +256,20 @@ function exportReportAsPdf() {
 }
 
 /**
- * Export the current report as Excel
- * Note: This is a placeholder function that would be implemented with an Excel library
+ * Export the selected commodity's data as a CSV file that opens in Excel
  */
 function exportReportAsExcel() {
-    // This is a placeholder for Excel export functionality
-    // In a real implementation, we would use a library like SheetJS (xlsx)
-    alert('Excel export functionality will be implemented in a future update.');
+    const commodityCode = $('#report-commodity').val();
+    if (!commodityCode) {
+        alert('Please select a commodity');
+        return;
+    }
+
+    // The server streams the export, so this works for the full history
+    window.location = '/weekly_export_sales/export_data?' + $.param({
+        commodity_code: commodityCode,
+        format: 'csv'
+    });
 }
 
 /**
@@ -175,8 +311,8 @@ function formatDate(dateInput, includeTime = false) {
  * @returns {string} Formatted number string
  */
 function formatNumber(num) {
-    if (isNaN(num)) return 'N/A';
-    return num.toString().replace(/(\d)(?=(\d{3})+(?!\d))/g, '$1,');
+    if (num === null || num === undefined || isNaN(num)) return 'N/A';
+    return Math.round(num).toString().replace(/(\d)(?=(\d{3})+(?!\d))/g, '$1,');
 }
 
 /**
@@ -185,7 +321,7 @@ function formatNumber(num) {
  * @returns {string} Formatted percentage string with sign
  */
 function formatPercentChange(value) {
-    if (isNaN(value)) return 'N/A';
+    if (value === null || value === undefined || isNaN(value)) return 'N/A';
     
     const sign = value >= 0 ? '+' : '';
     return `${sign}${value.toFixed(1)}%`;
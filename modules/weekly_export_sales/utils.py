@@ -4,9 +4,10 @@ Contains helper functions for data visualization and processing.
 """
 
 import pandas as pd
-from typing import Union, Optional
+from typing import Dict, Iterator, List, Union, Optional
 from datetime import datetime
 import plotly.graph_objects as go
+from instrumentation import timed_stage
 
 def calculate_weeks_into_my(date: Union[str, datetime, pd.Timestamp], 
                        my_start_date: Union[str, datetime, pd.Timestamp]) -> Optional[int]:
@@ -60,16 +61,18 @@ def calculate_weeks_into_my_for_df(df: pd.DataFrame,
         pd.DataFrame: DataFrame with the new column added
     """
     result_df = df.copy()
-    
-    # Apply the calculation to each row
-    result_df[result_col] = result_df.apply(
-        lambda row: calculate_weeks_into_my(row[date_col], row[my_start_col]),
-        axis=1
-    )
-    
+
+    # Vectorized equivalent of calculate_weeks_into_my applied to each row
+    days_diff = (pd.to_datetime(result_df[date_col]) - pd.to_datetime(result_df[my_start_col])).dt.days
+    weeks = (days_diff // 7).where(days_diff >= -368)
+
+    # Keep integer weeks when every row has a value, as the row-wise version did
+    result_df[result_col] = weeks.astype('int64') if weeks.notna().all() else weeks
+
     return result_df
 
 
+@timed_stage('figure')
 def create_weekly_plot(data, metric, metric_name, units, start_year, end_year, countries):
     """Create a weekly trend plot."""
     if data.empty:
@@ -118,6 +121,7 @@ def create_weekly_plot(data, metric, metric_name, units, start_year, end_year, c
     )
     return fig
 
+@timed_stage('figure')
 def create_country_plot(data, metric, metric_name, units, start_year, end_year, countries):
     """Create a plot showing data by country."""
     if data.empty:
@@ -125,20 +129,28 @@ def create_country_plot(data, metric, metric_name, units, start_year, end_year,
         fig.update_layout(title="No data available")
         return fig
 
-    fig = go.Figure()
-    for country in sorted(data['countryName'].unique()):
-        country_data = data[data['countryName'] == country]
-        fig.add_trace(go.Bar(
+    fig = go.Figure(data=list(country_plot_traces(data, metric)))
+    fig.update_layout(**country_plot_layout(metric_name, units, start_year, end_year, countries))
+    return fig
+
+def country_plot_traces(data, metric, order: List[str] = None) -> Iterator[go.Bar]:
+    """Build the bars of a country plot one at a time, by country name or in the given order of countries."""
+    groups = dict(tuple(data.groupby('countryName', sort=True)))
+    for country in (groups if order is None else order):
+        country_data = groups[country]
+        yield go.Bar(
             x=country_data['weekEndingDate'],
             y=country_data[metric],
             name=country
-        ))
+        )
 
+def country_plot_layout(metric_name, units, start_year, end_year, countries) -> Dict:
+    """Layout settings of a country plot."""
     title_suffix = ""
     if countries and "All Countries" not in countries:
         title_suffix = f" - {', '.join(countries) if len(countries) <= 3 else f'{len(countries)} Countries'}"
 
-    fig.update_layout(
+    return dict(
         title=f'{metric_name} - Weekly Trend by Country (MY {start_year}-{end_year}){title_suffix}',
         xaxis_title='Week Ending Date',
         yaxis_title=units,
@@ -164,8 +176,8 @@ def create_country_plot(data, metric, metric_name, units, start_year, end_year,
         ),
         margin=dict(l=50, r=150, t=100, b=50)
     )
-    return fig
 
+@timed_stage('figure')
 def create_my_comparison_plot(data, metric, metric_name, units, start_year, end_year, countries):
     """Create a marketing year comparison plot."""
     fig = go.Figure()
@@ -217,4 +229,60 @@ def create_my_comparison_plot(data, metric, metric_name, units, start_year, end_
         ),
         margin=dict(l=50, r=150, t=100, b=50)
     )
-    return fig
\ No newline at end of file
+    return fig
+
+@timed_stage('figure')
+def create_commodity_comparison_plot(data, metric, metric_name, units, start_year, end_year, countries):
+    """Create a marketing year pace comparison plot across commodities."""
+    fig = go.Figure()
+
+    if not data:
+        fig.update_layout(title="No data available")
+        return fig
+
+    for commodity_name, years in data.items():
+        for year, year_data in years.items():
+            df = year_data['data']
+            is_latest = year == max(years)
+
+            fig.add_trace(go.Scatter(
+                x=df['weeks_into_my'],
+                y=df[metric],
+                name=f'{commodity_name} MY {year-1}/{year}',
+                legendgroup=commodity_name,
+                mode='lines',
+                line=dict(dash='solid' if is_latest else 'dot'),
+                opacity=1.0 if is_latest else 0.6
+            ))
+
+    title_suffix = ""
+    if countries and "All Countries" not in countries:
+        title_suffix = f" - {', '.join(countries) if len(countries) <= 3 else f'{len(countries)} Countries'}"
+
+    fig.update_layout(
+        title=f'Weekly {metric_name} - Commodity Comparison (MY {start_year}-{end_year}){title_suffix}',
+        xaxis_title='Weeks into Marketing Year',
+        yaxis_title=f'{units}',
+        showlegend=True,
+        height=700,
+        width=1000,
+        template='plotly_white',
+        xaxis=dict(tickmode='linear', dtick=4),
+        legend=dict(
+            x=1.05,
+            y=1,
+            xanchor='left',
+            yanchor='top',
+            bgcolor='rgba(255,255,255,0.5)',
+            bordercolor='black',
+            borderwidth=1,
+            font=dict(size=10),
+            traceorder='grouped',
+            itemsizing='constant',
+            itemwidth=30,
+            orientation='v',
+            tracegroupgap=10
+        ),
+        margin=dict(l=50, r=150, t=100, b=50)
+    )
+    return fig
@@ -1,17 +1,25 @@
 """
-WSGI Entry Point for the Market Research Platform # for python anywhere
+WSGI Entry Point for the Market Research Platform
+
+Loaded by WSGI servers: gunicorn (see gunicorn.conf.py) or the PythonAnywhere
+WSGI configuration file, which imports `application` from here.
 """
 
+import os
 import sys
 
-# Add your project directory to the Python path
-path = '/home/ncoolidge/market_research_platform'
+# Add the project directory to the Python path
+path = os.path.dirname(os.path.abspath(__file__))
 if path not in sys.path:
     sys.path.append(path)
 
-# Import and initialize the Flask app
-from app import app as application
+# Serve with the production configuration unless APP_CONFIG says otherwise
+os.environ.setdefault('APP_CONFIG', 'production')
+
+from app import create_app
 
 # This variable must be named 'application'
+application = create_app()
+
 if __name__ == '__main__':
-    application.run()
\ No newline at end of file
+    application.run()